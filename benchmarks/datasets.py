@@ -0,0 +1,80 @@
+import random
+from datetime import datetime, timedelta
+
+from models import Model
+from models.customer import Customer
+from models.plan import Plan
+from models.seeds.seeds import SEEDS
+from models.subscription import Subscription
+from models.website import Website
+
+# every dataset starts from the same point in time, so runs are comparable
+EPOCH = datetime(2020, 1, 1)
+
+class Dataset(object):
+    '''
+    Synthetic Plan/Subscription/Customer/Website data. `rows` is the number of websites:
+    there is a customer (with a subscription) for every `websites_per_customer` websites.
+    The same seed always builds the same data
+    '''
+    def __init__(self, rows, websites_per_customer=4, seed=0):
+        self.rows = rows
+        self.customers = max(1, rows // websites_per_customer)
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.plans = []
+        self.customer_ids = []
+        self.website_ids = []
+
+    def url(self, i):
+        return 'http://site{}.example.com'.format(i)
+
+    def email(self, i):
+        return 'customer{}@example.com'.format(i)
+
+    def subscription_rows(self, plan_ids):
+        rand = self.random
+        return [[EPOCH + timedelta(days=rand.randrange(730), seconds=rand.randrange(86400)),
+                 rand.choice(plan_ids)] for _ in range(self.customers)]
+
+    def customer_rows(self, subscription_ids):
+        # trusted rows are stored as they are, so passwords come already hashed
+        return [['customer {}'.format(i), Customer.hash_password('password {}'.format(i)),
+                 self.email(i), subscription_id]
+                for i, subscription_id in enumerate(subscription_ids)]
+
+    def website_rows(self, customer_ids, count=None):
+        rand = self.random
+        return [[self.url(i), rand.choice(customer_ids)] for i in range(count or self.rows)]
+
+    def build(self):
+        '''
+        empties every model and stores the dataset. Rows are trusted: they are generated here
+        '''
+        Model.reset_all_containers()
+        self.plans = Plan.seed(SEEDS['plans'], trusted=True)
+        plan_ids = [plan.id for plan in self.plans]
+
+        Subscription.bulk_create(self.subscription_rows(plan_ids), trusted=True)
+        Customer.bulk_create(self.customer_rows(self.stored_ids(Subscription)), trusted=True)
+        self.customer_ids = self.stored_ids(Customer)
+        Website.bulk_create(self.website_rows(self.customer_ids), trusted=True)
+        self.website_ids = self.stored_ids(Website)
+
+    def stored_ids(self, model):
+        # frozen views, so nothing is copied
+        return [obj.id for obj in model.all(read_mode='frozen')]
+
+    def customer(self):
+        '''
+        returns a random stored customer
+        '''
+        id = self.random.choice(self.customer_ids)
+        return Customer.get_many([id])[id]
+
+    def website(self):
+        '''
+        returns a random stored website
+        '''
+        id = self.random.choice(self.website_ids)
+        return Website.get_many([id])[id]
@@ -0,0 +1,83 @@
+import gc
+import resource
+import sys
+import time
+import tracemalloc
+
+# samples traced by tracemalloc to measure the peak memory of an operation
+MEMORY_SAMPLES = 20
+
+def percentile(ordered, p):
+    '''
+    returns the `p` percentile (0-100) of sorted values, interpolating between the closest ranks
+    '''
+    if not ordered:
+        return None
+
+    k = (len(ordered) - 1) * p / 100.0
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+def summarize(latencies, total, items_per_call=1):
+    '''
+    returns the latency percentiles (in microseconds) and throughput of the timed calls
+    :param latencies: list of seconds taken by each call
+    :param total: float seconds taken by all the calls
+    :param items_per_call: int objects handled by each call (e.g. rows of a bulk insert)
+    '''
+    ordered = sorted(latencies)
+    micro = lambda value: round(value * 1e6, 3)
+    return {
+        'calls': len(ordered),
+        'mean_us': micro(sum(ordered) / len(ordered)),
+        'p50_us': micro(percentile(ordered, 50)),
+        'p90_us': micro(percentile(ordered, 90)),
+        'p99_us': micro(percentile(ordered, 99)),
+        'max_us': micro(ordered[-1]),
+        'throughput_per_s': round(len(ordered) * items_per_call / total, 3) if total else None,
+    }
+
+def max_rss_bytes():
+    '''
+    returns the peak resident memory of the process so far
+    '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def measure(operation, samples, items_per_call=1):
+    '''
+    times `samples` calls of the operation, then traces a few more to find their peak memory.
+    `operation.prepare()` runs before each call, untimed, and returns the arguments of `operation.run`
+    :rtype dict:
+    '''
+    latencies = []
+    timer = time.perf_counter
+    gc.collect()
+    for _ in range(samples):
+        args = operation.prepare()
+        start = timer()
+        operation.run(*args)
+        latencies.append(timer() - start)
+
+    result = summarize(latencies, sum(latencies), items_per_call)
+    result['peak_memory_bytes'] = peak_memory(operation, min(samples, MEMORY_SAMPLES))
+    return result
+
+def peak_memory(operation, samples):
+    '''
+    returns the largest amount of memory allocated (in bytes) while running a single call
+    '''
+    peak = 0
+    for _ in range(samples):
+        args = operation.prepare()
+        tracemalloc.start()
+        try:
+            operation.run(*args)
+            _, call_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak = max(peak, call_peak)
+
+    return peak
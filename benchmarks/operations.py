@@ -0,0 +1,141 @@
+from models.customer import Customer
+from models.plan import Plan
+from models.website import Website
+
+class Operation(object):
+    '''
+    A benchmarked operation. `prepare` builds the arguments of each call (untimed)
+    and `run` is the timed call
+    '''
+    name = None
+    # calls are capped for operations that scan the whole dataset
+    max_samples = None
+    # objects handled by each call, for the throughput
+    items_per_call = 1
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.random = dataset.random
+
+    def prepare(self):
+        return ()
+
+    def run(self, *args):
+        raise NotImplementedError()
+
+class Find(Operation):
+    name = 'find'
+
+    def prepare(self):
+        return (self.dataset.customer(),)
+
+    def run(self, customer):
+        Website.find({'customer': customer})
+
+class FindScan(Operation):
+    name = 'find_scan'
+    max_samples = 20
+
+    def prepare(self):
+        return (self.dataset.url(self.random.randrange(self.dataset.rows)),)
+
+    def run(self, url):
+        Website.find({'url': url})
+
+class FindOne(Operation):
+    name = 'find_one'
+
+    def prepare(self):
+        return (self.dataset.email(self.random.randrange(self.dataset.customers)),)
+
+    def run(self, email):
+        Customer.find_one({'email': email})
+
+class FindOneCached(Operation):
+    name = 'find_one_cached'
+
+    def prepare(self):
+        return (self.random.choice(self.dataset.plans).name,)
+
+    def run(self, name):
+        Plan.find_one({'name': name})
+
+class Count(Operation):
+    name = 'count'
+
+    def prepare(self):
+        return (self.dataset.customer(),)
+
+    def run(self, customer):
+        Website.count({'customer': customer})
+
+class CountScan(Operation):
+    name = 'count_scan'
+    max_samples = 20
+
+    def prepare(self):
+        return (self.dataset.url(self.random.randrange(self.dataset.rows)),)
+
+    def run(self, url):
+        Website.count({'url': url})
+
+class Create(Operation):
+    name = 'create'
+
+    def prepare(self):
+        return ('http://new.example.com', self.random.choice(self.dataset.customer_ids))
+
+    def run(self, url, customer_id):
+        Website.create(url, customer_id)
+
+class SaveObject(Operation):
+    name = 'save_object'
+
+    def prepare(self):
+        website = self.dataset.website()
+        website.url = 'http://saved.example.com'
+        return (website,)
+
+    def run(self, website):
+        Website.save_object(website)
+
+class RemoveObject(Operation):
+    name = 'remove_object'
+
+    def prepare(self):
+        return (Website.create('http://removed.example.com', self.random.choice(self.dataset.customer_ids)),)
+
+    def run(self, website):
+        Website.remove_object(website)
+
+class Seed(Operation):
+    name = 'seed'
+    max_samples = 20
+    items_per_call = 1000
+
+    def prepare(self):
+        return (self.dataset.website_rows(self.dataset.customer_ids, self.items_per_call),)
+
+    def run(self, rows):
+        Website.seed(rows)
+
+class CreateWebsite(Operation):
+    '''
+    `Customer.create_website` of a random customer. Customers over the quota of their plan
+    raise instead, after the same checks
+    '''
+    name = 'create_website'
+
+    def prepare(self):
+        return (self.dataset.customer(),)
+
+    def run(self, customer):
+        try:
+            customer.create_website('http://created.example.com')
+        except Exception as e:
+            if not str(e).startswith('Max websites reached'):
+                raise
+
+# reads first, so they all see the dataset as it was built
+OPERATIONS = [Find, FindScan, FindOne, FindOneCached, Count, CountScan,
+              Create, SaveObject, RemoveObject, Seed, CreateWebsite]
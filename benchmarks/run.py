@@ -0,0 +1,152 @@
+'''
+Benchmarks the hot paths of the models over synthetic datasets and writes the results as JSON.
+Run from the repository root, e.g.:
+    python -m benchmarks.run --sizes 1000 100000 --output bench_output.json
+    python -m benchmarks.run --sizes 1000 --compare bench_output.json
+'''
+import argparse
+from datetime import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from .datasets import Dataset
+from .harness import max_rss_bytes, measure
+from .operations import OPERATIONS
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_SAMPLES = 1000
+# relative changes reported as regressions by --compare
+DEFAULT_TOLERANCE = 0.1
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_size(rows, samples, names, seed, log):
+    '''
+    builds a dataset of `rows` websites and measures every operation over it
+    :rtype dict:
+    '''
+    dataset = Dataset(rows, seed=seed)
+    start = time.perf_counter()
+    dataset.build()
+    result = {
+        'build': {
+            'seconds': round(time.perf_counter() - start, 3),
+            'websites': rows,
+            'customers': dataset.customers,
+            'max_rss_bytes': max_rss_bytes(),
+        },
+        'operations': {},
+    }
+    log('{} rows built in {}s'.format(rows, result['build']['seconds']))
+
+    for operation_class in OPERATIONS:
+        if names and operation_class.name not in names:
+            continue
+
+        operation = operation_class(dataset)
+        calls = samples
+        if operation.max_samples is not None:
+            calls = min(calls, operation.max_samples)
+
+        stats = measure(operation, calls, operation.items_per_call)
+        result['operations'][operation.name] = stats
+        log('  {:<16} p50 {:>12.1f}us  p99 {:>12.1f}us  {:>12.1f}/s'.format(
+            operation.name, stats['p50_us'], stats['p99_us'], stats['throughput_per_s']))
+
+    return result
+
+def run(sizes=None, samples=DEFAULT_SAMPLES, names=None, seed=0, log=None):
+    '''
+    runs the benchmarks and returns their results
+    :param sizes: list of dataset sizes (websites)
+    :param samples: int calls of each operation
+    :param names: list of operations to run. Defaults to all
+    :rtype dict:
+    '''
+    log = log or (lambda message: None)
+    results = {
+        'meta': {
+            'started_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'commit': git_commit(),
+            'samples': samples,
+            'seed': seed,
+        },
+        'sizes': {},
+    }
+    for rows in sizes or DEFAULT_SIZES:
+        results['sizes'][str(rows)] = run_size(rows, samples, names, seed, log)
+
+    return results
+
+def compare(previous, current, tolerance=DEFAULT_TOLERANCE):
+    '''
+    returns the (size, operation, metric, previous, current) that got worse by more than `tolerance`
+    :rtype list(tuple):
+    '''
+    regressions = []
+    for size, result in current['sizes'].items():
+        before = previous.get('sizes', {}).get(size)
+        if before is None:
+            continue
+
+        for name, stats in result['operations'].items():
+            old = before['operations'].get(name)
+            if old is None:
+                continue
+
+            if stats['p50_us'] > old['p50_us'] * (1 + tolerance):
+                regressions.append((size, name, 'p50_us', old['p50_us'], stats['p50_us']))
+            if stats['throughput_per_s'] < old['throughput_per_s'] * (1 - tolerance):
+                regressions.append((size, name, 'throughput_per_s', old['throughput_per_s'],
+                                    stats['throughput_per_s']))
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the model operations')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='dataset sizes, in websites')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES,
+                        help='calls of each operation')
+    parser.add_argument('--operations', nargs='+', choices=[op.name for op in OPERATIONS],
+                        help='operations to run (all by default)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='writes the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='relative change reported as a regression')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    results = run(args.sizes, args.samples, args.operations, args.seed, log)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(previous, results, args.tolerance)
+        for size, name, metric, old, new in regressions:
+            log('regression: {} rows {} {} {} -> {}'.format(size, name, metric, old, new))
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+import unittest
+
+from models.model_test import ModelTestCase
+from .operations import OPERATIONS
+from .run import compare, run
+
+class TestBenchmarks(ModelTestCase):
+    def test_run(self):
+        results = run(sizes=[40], samples=3)
+
+        size = results['sizes']['40']
+        self.assertEqual(size['build']['websites'], 40)
+        self.assertEqual(sorted(size['operations']), sorted(op.name for op in OPERATIONS))
+        for stats in size['operations'].values():
+            self.assertEqual(stats['calls'], 3)
+            self.assertLessEqual(stats['p50_us'], stats['p99_us'])
+            self.assertGreater(stats['throughput_per_s'], 0)
+            self.assertGreaterEqual(stats['peak_memory_bytes'], 0)
+
+    def test_compare(self):
+        stats = {'p50_us': 10.0, 'throughput_per_s': 100.0}
+        previous = {'sizes': {'40': {'operations': {'find': stats, 'count': stats}}}}
+        current = {'sizes': {'40': {'operations': {
+            'find': {'p50_us': 10.5, 'throughput_per_s': 95.0},
+            'count': {'p50_us': 20.0, 'throughput_per_s': 50.0},
+        }}}}
+
+        self.assertEqual(compare(previous, current), [
+            ('40', 'count', 'p50_us', 10.0, 20.0),
+            ('40', 'count', 'throughput_per_s', 100.0, 50.0),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,27 @@
-from .validator import ValidatorException
+from contextlib import contextmanager
+from threading import get_ident
+from types import FunctionType
+
+from .validator import ValidatorException, compile_validators
+
+# threads loading trusted data (thread id -> depth), which skip validation
+_trusted = {}
+
+@contextmanager
+def skip_validation():
+    '''
+    stores the values of every property set by this thread inside the block as they are,
+    skipping the validators and the custom setters (`set_<name>`).
+    Only for data that was already validated and transformed, e.g. bulk loads from our own storage
+    '''
+    ident = get_ident()
+    _trusted[ident] = _trusted.get(ident, 0) + 1
+    try:
+        yield
+    finally:
+        depth = _trusted.pop(ident) - 1
+        if depth:
+            _trusted[ident] = depth
 
 def autoproperty(**kwargs):
     '''
@@ -15,6 +38,31 @@ def autoproperty(**kwargs):
         def __init__(self, name):
             # Error! Set is disabled
             self.name = name
+
+    @autoproperty(email='', index=True)
+    class User(Model):
+        def __init__(self, email):
+            # email is kept in a hash index, so `User.find({'email': ...})` doesn't scan
+            self.email = email
+
+    @autoproperty(price=0.0, index='sorted')
+    class Product(Model):
+        def __init__(self, price):
+            # price is kept sorted, so `Product.find({'price': LTProp(10)})` uses a binary search
+            self.price = price
+
+    @autoproperty(price=0.0, column=True)
+    class Product(Model):
+        def __init__(self, price):
+            # price is also kept in a typed array, so filters over it are evaluated at once
+            self.price = price
+
+    @autoproperty(customer=None, relation='Customer')
+    class Website(Model):
+        def __init__(self, customer):
+            # only the id of the customer is stored (also readable as `customer_id`),
+            # the customer is read when the property is first accessed
+            self.customer = customer
     '''
 
     hasGet = True
@@ -24,6 +72,9 @@ def autoproperty(**kwargs):
     innerName = '_{}'
     defaultValue = None
     validators = []
+    index = None
+    column = False
+    relation = None
 
     # gets the first kwarg and assume the rest are args
     baseName, defaultValue = list(kwargs.items())[0]
@@ -39,34 +90,95 @@ def autoproperty(**kwargs):
             hasDel = value
         elif key == 'validators':
             validators = value
+        elif key == 'index':
+            index = value
+        elif key == 'column':
+            column = value
+        elif key == 'relation':
+            relation = value
 
     def _get(obj):
         return getattr(obj, innerName, defaultValue)
 
+    def _get_relation(obj):
+        return obj._get_relation(baseName)
+
+    def _get_id(obj):
+        return getattr(obj, innerName, None)
+
+    # the validators are combined into a single check, and the custom setter
+    # (`set_<name>`) of each class is looked up once
+    check = compile_validators(validators)
+    setterName = 'set_{}'.format(baseName)
+    setters = {}
+
+    def _store(obj, v):
+        setattr(obj, innerName, v)
+
+    def _store_relation(obj, v):
+        obj._set_relation(baseName, v)
+
+    store = _store if relation is None else _store_relation
+
+    def _resolve_setter(cls):
+        for base in cls.__mro__:
+            if setterName in base.__dict__:
+                custom_setter = base.__dict__[setterName]
+                if isinstance(custom_setter, FunctionType):
+                    return custom_setter
+                return lambda obj, v: getattr(obj, setterName)(v)
+
+        return store
+
     def _set(obj, v):
-        for vdt in validators:
-            if not vdt.validate(v):
-                raise ValidatorException(v, property=baseName)
+        if _trusted and get_ident() in _trusted:
+            # trusted values already went through the setter when they were first stored
+            store(obj, v)
+            return
 
-        custom_setter = getattr(obj, 'set_{}'.format(baseName), None)
-        if custom_setter is not None:
-            custom_setter(v)
-        else:
-            setattr(obj, innerName, v)
+        if check is not None and not check(v):
+            raise ValidatorException(v, property=baseName)
+
+        setter = setters.get(type(obj))
+        if setter is None:
+            setter = setters[type(obj)] = _resolve_setter(type(obj))
+        setter(obj, v)
 
     def _del(obj):
         delattr(obj, innerName)
 
     def decorator(cls):
-        prop = property(_get if hasGet else None, _set if hasSet else None,
+        getter = _get if relation is None else _get_relation
+        prop = property(getter if hasGet else None, _set if hasSet else None,
                         _del if hasDel else None)
 
         setattr(cls, baseName, prop)
 
+        if relation is not None:
+            # the backing attribute holds the id of the related model
+            setattr(cls, '{}_id'.format(baseName), property(_get_id))
+            relations = dict(getattr(cls, '__relations__', {}))
+            relations[baseName] = relation
+            setattr(cls, '__relations__', relations)
+
         props = getattr(cls, '__properties__', [])
         props.insert(0, baseName)
         setattr(cls, '__properties__', props)
 
+        inner = dict(getattr(cls, '__inner_properties__', {}))
+        inner[innerName] = baseName
+        setattr(cls, '__inner_properties__', inner)
+
+        if index:
+            indexes = dict(getattr(cls, '__indexes__', {}))
+            indexes[baseName] = index if isinstance(index, str) else 'hash'
+            setattr(cls, '__indexes__', indexes)
+
+        if column:
+            columns = list(getattr(cls, '__columns__', []))
+            columns.insert(0, baseName)
+            setattr(cls, '__columns__', columns)
+
         return cls
 
     return decorator
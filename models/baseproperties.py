@@ -1,14 +1,66 @@
 from .autoproperty import autoproperty
 
-def baseproperties(cls):
+def _rebind_class_cells(value, old, new):
+    '''
+    points the `__class__` cell of functions (used by `super()`) from `old` to `new`
+    '''
+    if isinstance(value, (classmethod, staticmethod)):
+        value = value.__func__
+
+    if isinstance(value, property):
+        for func in (value.fget, value.fset, value.fdel):
+            _rebind_class_cells(func, old, new)
+        return
+
+    for cell in getattr(value, '__closure__', None) or ():
+        try:
+            if cell.cell_contents is old:
+                cell.cell_contents = new
+        except ValueError:
+            # empty cell
+            pass
+
+def _slotted(cls):
+    '''
+    rebuilds `cls` storing its backing attributes in __slots__ instead of a __dict__
+    '''
+    inherited = set()
+    for base in cls.__mro__[1:]:
+        inherited.update(getattr(base, '__slots__', ()))
+
+    body = dict(cls.__dict__)
+    body.pop('__dict__', None)
+    body.pop('__weakref__', None)
+    body['__slots__'] = tuple(
+        inner for inner in cls.__inner_properties__ if inner not in inherited
+    )
+
+    slotted = type(cls)(cls.__name__, cls.__bases__, body)
+    for value in body.values():
+        _rebind_class_cells(value, cls, slotted)
+
+    return slotted
+
+def baseproperties(cls=None, slots=False):
     '''
     creates base properties for models
     base properties includes:
     - id: int (autoincrement)
     - created_at
     - updated_at
+
+    With `@baseproperties(slots=True)` the model stores the backing attribute of every
+    property in __slots__ instead of a per-instance __dict__, which saves memory
+    and speeds up attribute access. Instances can't receive undeclared attributes
     '''
+    if cls is None:
+        return lambda cls: baseproperties(cls, slots=slots)
+
     cls = autoproperty(id=0, hasSet=False)(cls)
     cls = autoproperty(created_at=None)(cls)
     cls = autoproperty(updated_at=None)(cls)
-    return cls
\ No newline at end of file
+
+    if slots:
+        cls = _slotted(cls)
+
+    return cls
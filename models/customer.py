@@ -8,11 +8,11 @@ from models.website import Website
 from models.validator.email_validator import EmailValidator
 from models.validator.instance_validator import InstanceValidator
 
-@baseproperties
+@baseproperties(slots=True)
 @autoproperty(name='', validators=[InstanceValidator(str)])
 @autoproperty(password='', validators=[InstanceValidator(str)])
-@autoproperty(email='', validators=[InstanceValidator(str), EmailValidator()])
-@autoproperty(subscription=None)
+@autoproperty(email='', validators=[InstanceValidator(str), EmailValidator()], index=True)
+@autoproperty(subscription=None, relation=Subscription)
 class Customer(Model):
     @classmethod
     def hash_password(cls, password):
@@ -40,7 +40,7 @@ class Customer(Model):
             self.name == other.name and \
             self.password == other.password and \
             self.email == other.email and \
-            self.subscription == other.subscription
+            self.subscription_id == other.subscription_id
 
     def has_subscription(self):
         '''
@@ -67,6 +67,8 @@ class Customer(Model):
         else:
             self.subscription.plan = plan
             self.subscription.renewal_date = renewal_date
+            # reschedules its expiry as well
+            self.subscription.save()
 
     def create_website(self, url):
         '''
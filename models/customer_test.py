@@ -25,6 +25,16 @@ class TestCustomer(ModelTestCase):
         self.assertEqual(c1.password, Customer.hash_password('abc'))
         self.assertIsInstance(c1.password, str)
 
+    def test_trusted_reload_keeps_password(self):
+        Customer.create('c1', 'abc', 'asd@example.com', None)
+        rows = [[c.name, c.password, c.email, c.subscription] for c in Customer.all()]
+        Customer.clear()
+
+        # the stored hash is loaded as it is, not hashed again
+        Customer.bulk_create(rows, trusted=True)
+        self.assertEqual(Customer.find_one({'email': 'asd@example.com'}).password,
+                         Customer.hash_password('abc'))
+
     def test_invalid_email(self):
         with self.assertRaises(ValidatorException):
             Customer('c1', '123', 'asd', None)
@@ -101,6 +111,38 @@ class TestCustomer(ModelTestCase):
 
         self.assertEqual(c1.subscription.renewal_date.year, datetime.now().year+1)
 
+    def test_subscribe_renewal_saved(self):
+        Plan.seed(SEEDS['plans'])
+
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        c1.subscribe('single')
+        c1.save()
+        c1.subscription.renewal_date = datetime.now()
+        c1.subscription.save()
+        self.assertEqual(len(Subscription.expiry.pop_due()), 1)
+
+        c1.subscribe('plus')
+        stored = Subscription.find_one({'id': c1.subscription_id})
+        self.assertEqual(stored.plan.name, 'plus')
+        self.assertEqual(stored.renewal_date.year, datetime.now().year + 1)
+        self.assertEqual(Subscription.expiry.next_deadline(), stored.renewal_date)
+
+    def test_create_saves_subscription(self):
+        Plan.seed(SEEDS['plans'])
+        plan = Plan.find_one({'name': 'single'})
+
+        c1 = Customer.create('c1', '123456', 'abc@example.com', Subscription(datetime.now(), plan))
+        stored = Customer.find_one({'id': c1.id})
+        self.assertTrue(stored.has_subscription())
+        self.assertEqual(stored.subscription.plan.name, 'single')
+        stored.create_website('http://localhost')
+
+        subscription = Subscription(datetime.now(), plan)
+        Customer.bulk_create([['c2', '123456', 'def@example.com', subscription],
+                              ['c3', '123456', 'ghi@example.com', subscription]])
+        self.assertEqual(Customer.count({'subscription': subscription}), 2)
+        self.assertEqual(Subscription.count(), 2)
+
     def test_website_create_no_plan(self):
         c1 = Customer('c1', '12345', 'abc@example.com', None)
         with self.assertRaisesRegex(Exception, 'Please subscribe .*'):
@@ -153,6 +195,52 @@ class TestCustomer(ModelTestCase):
         with self.assertRaisesRegex(Exception, 'Max websites reached for this plan.*'):
             c1.create_website('http://localhost')
 
+    def test_website_count_without_scan(self):
+        Plan.seed(SEEDS['plans'])
+        p1 = Plan.find_one({'name': 'infinite'})
+        c1 = Customer.create('c1', '12345', 'abc@example.com', Subscription.create(datetime.now(), p1))
+        c2 = Customer.create('c2', '12345', 'abc@example.com', None)
+        for _ in range(5):
+            c1.create_website('http://localhost')
+
+        # the websites of a customer are counted by the index of the relation
+        backend = Website._get_backend()
+        backend.scan = None
+        try:
+            self.assertEqual(Website.count({'customer': c1}), 5)
+            self.assertEqual(Website.count({'customer': c2}), 0)
+        finally:
+            del backend.scan
+
+        website = Website.find_one({'customer': c1})
+        website.customer = c2
+        website.save()
+        self.assertEqual(Website.count({'customer': c1}), 4)
+        self.assertEqual(Website.count({'customer': c2.id}), 1)
+
+        website.remove()
+        self.assertEqual(Website.count({'customer': c2}), 0)
+
+    def test_subscriptions_per_plan(self):
+        Plan.seed(SEEDS['plans'])
+        single = Plan.find_one({'name': 'single'})
+        plus = Plan.find_one({'name': 'plus'})
+        subscriptions = [Subscription.create(datetime.now(), single) for _ in range(3)]
+
+        backend = Subscription._get_backend()
+        backend.scan = None
+        try:
+            self.assertEqual(Subscription.count({'plan': single}), 3)
+            self.assertEqual(Subscription.count({'plan': plus}), 0)
+        finally:
+            del backend.scan
+
+        subscriptions[0].plan = plus
+        subscriptions[0].save()
+        subscriptions[1].remove()
+        self.assertEqual(Subscription.count({'plan': single}), 1)
+        self.assertEqual(Subscription.count({'plan': plus}), 1)
+
     def test_website_create_infinite_plan(self):
         Plan.seed(SEEDS['plans'])
         p1 = Plan.find_one({'name': 'infinite'})
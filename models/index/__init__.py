@@ -0,0 +1,5 @@
+from .index import Index, index_key, relation_id
+from .hash_index import HashIndex
+from .sorted_index import SortedIndex
+from .counter_index import CounterIndex
+from .index_set import IndexSet
@@ -0,0 +1,162 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from ..query.query_prop import QueryProp
+from .index import Index
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH = datetime(1970, 1, 1)
+AWARE_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+# integers above this can't be represented exactly by a float column
+MAX_EXACT_INT = 2 ** 53
+
+TYPECODES = {
+    'number': 'd',
+    'datetime': 'q',
+    'aware': 'q',
+}
+
+def encode(value):
+    '''
+    returns (kind, encoded value) for values that can be stored in a column, None otherwise.
+    Numbers are stored as floats and datetimes as microseconds since the epoch
+    '''
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return 'datetime', (value - EPOCH) // MICROSECOND
+        return 'aware', (value - AWARE_EPOCH) // MICROSECOND
+
+    if isinstance(value, float) or (isinstance(value, int) and abs(value) <= MAX_EXACT_INT):
+        return 'number', float(value)
+
+    return None
+
+class ColumnIndex(Index):
+    '''
+    ColumnIndex keeps the values of a numeric or datetime property in a typed array,
+    one slot per ordinal. Equality and range queries are evaluated over the whole array
+    at once (as a NumPy mask when NumPy is available) instead of one object at a time
+    '''
+    def __init__(self, prop, attr=None):
+        super().__init__(prop, attr)
+        self.kind = None
+        self.values = array('d')
+        self.alive = bytearray()
+        # stored values that can't be encoded (e.g. None), the column can't answer queries then
+        self.foreign = 0
+
+    def _encode_stored(self, value):
+        encoded = encode(value)
+        if encoded is None:
+            return None
+
+        kind, value = encoded
+        if self.kind is None:
+            self.kind = kind
+            self.values = array(TYPECODES[kind], [0]) * len(self.alive)
+        elif kind != self.kind:
+            return None
+
+        return value
+
+    def add(self, obj, ordinal):
+        value = self._encode_stored(getattr(obj, self.attr, None))
+        if ordinal == len(self.alive):
+            self.alive.append(0)
+            self.values.append(0)
+
+        if value is None:
+            self.foreign += 1
+            self.alive[ordinal] = 0
+        else:
+            self.values[ordinal] = value
+            self.alive[ordinal] = 1
+
+    def remove(self, obj, ordinal):
+        if self.alive[ordinal]:
+            self.alive[ordinal] = 0
+        else:
+            self.foreign -= 1
+
+    def _encode_query(self, value):
+        encoded = encode(value)
+        if encoded is None or encoded[0] != self.kind:
+            return None
+        return encoded[1]
+
+    def _bounds(self, value):
+        '''
+        returns the encoded bounds (lower, upper) matching `value`. Each bound is a tuple
+        (value, inclusive) or None when unbounded. None means the column can't answer the query
+        '''
+        if self.foreign or self.kind is None:
+            return None
+
+        if not isinstance(value, QueryProp):
+            encoded = self._encode_query(value)
+            if encoded is None:
+                return None
+            return (encoded, True), (encoded, True)
+
+        bounds = value.range()
+        if bounds is None:
+            return None
+
+        encoded = []
+        for bound in bounds:
+            if bound is None:
+                encoded.append(None)
+                continue
+
+            data = self._encode_query(bound[0])
+            if data is None:
+                return None
+            encoded.append((data, bound[1]))
+
+        return tuple(encoded)
+
+    def mask(self, value):
+        '''
+        returns a NumPy bool array flagging the ordinals matching `value`, or None
+        '''
+        bounds = self._bounds(value)
+        if bounds is None:
+            return None
+
+        values = numpy.frombuffer(self.values, dtype=numpy.dtype(self.values.typecode))
+        result = numpy.frombuffer(self.alive, dtype=numpy.uint8).astype(bool)
+        lower, upper = bounds
+        if lower is not None:
+            result &= (values >= lower[0]) if lower[1] else (values > lower[0])
+        if upper is not None:
+            result &= (values <= upper[0]) if upper[1] else (values < upper[0])
+
+        return result
+
+    def match(self, value, ordinals=None):
+        '''
+        returns the ordinals matching `value`, restricted to `ordinals` when given, or None
+        '''
+        bounds = self._bounds(value)
+        if bounds is None:
+            return None
+
+        lower, upper = bounds
+        lo, lo_inclusive = lower if lower is not None else (None, True)
+        hi, hi_inclusive = upper if upper is not None else (None, True)
+
+        values, alive = self.values, self.alive
+        if ordinals is None:
+            ordinals = range(len(alive))
+
+        return [
+            i for i in ordinals
+            if alive[i] and
+            (lo is None or (values[i] >= lo if lo_inclusive else values[i] > lo)) and
+            (hi is None or (values[i] <= hi if hi_inclusive else values[i] < hi))
+        ]
@@ -0,0 +1,41 @@
+from .index import Index, index_key
+
+class CounterIndex(Index):
+    '''
+    CounterIndex only keeps how many stored objects hold each value, so equality
+    counts are answered without scanning. Used for relations that are not indexed,
+    e.g. the number of subscriptions of each plan
+    '''
+    def __init__(self, prop, attr=None):
+        super().__init__(prop, attr)
+        self.counts = {}
+        self.uncounted = 0
+
+    def add(self, obj, ordinal):
+        key = index_key(getattr(obj, self.attr, None))
+        try:
+            self.counts[key] = self.counts.get(key, 0) + 1
+        except TypeError:
+            self.uncounted += 1
+
+    def remove(self, obj, ordinal):
+        key = index_key(getattr(obj, self.attr, None))
+        try:
+            count = self.counts.get(key, 0) - 1
+        except TypeError:
+            self.uncounted -= 1
+            return
+
+        if count > 0:
+            self.counts[key] = count
+        else:
+            self.counts.pop(key, None)
+
+    def count(self, value):
+        if self.uncounted:
+            return None
+
+        try:
+            return self.counts.get(index_key(value), 0)
+        except TypeError:
+            return None
@@ -0,0 +1,57 @@
+from .index import Index, index_key
+
+class HashIndex(Index):
+    '''
+    HashIndex answers equality queries with a single dict probe
+    '''
+    def __init__(self, prop, attr=None):
+        super().__init__(prop, attr)
+        self.buckets = {}
+        self.unhashable = {}
+
+    def add(self, obj, ordinal):
+        key = index_key(getattr(obj, self.attr, None))
+        try:
+            self.buckets.setdefault(key, {})[ordinal] = obj
+        except TypeError:
+            self.unhashable[ordinal] = obj
+
+    def remove(self, obj, ordinal):
+        key = index_key(getattr(obj, self.attr, None))
+        try:
+            bucket = self.buckets.get(key)
+        except TypeError:
+            self.unhashable.pop(ordinal, None)
+            return
+
+        if bucket is not None:
+            bucket.pop(ordinal, None)
+            if not bucket:
+                del self.buckets[key]
+
+    def replace(self, old, new, ordinal):
+        if ordinal in self.unhashable:
+            self.unhashable[ordinal] = new
+        else:
+            self.buckets[index_key(getattr(new, self.attr, None))][ordinal] = new
+
+    def lookup(self, value):
+        # unhashable values may compare equal to anything, so we can't rule them out
+        if self.unhashable:
+            return None
+
+        try:
+            bucket = self.buckets.get(index_key(value), {})
+        except TypeError:
+            return None
+
+        return [bucket[ordinal] for ordinal in sorted(bucket)]
+
+    def count(self, value):
+        if self.unhashable:
+            return None
+
+        try:
+            return len(self.buckets.get(index_key(value), ()))
+        except TypeError:
+            return None
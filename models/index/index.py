@@ -0,0 +1,66 @@
+
+def index_key(value):
+    '''
+    returns the key used to store `value` in an index.
+    Models are keyed by class and id, since model equality implies both are the same
+    '''
+    if hasattr(value, '__properties__'):
+        return (value.__class__, value.id)
+    return value
+
+def relation_id(value):
+    '''
+    returns the id of the model `value` (relations are indexed by id), or the value itself
+    '''
+    if hasattr(value, '__properties__'):
+        return value.id
+    return value
+
+class Index(object):
+    '''
+    Base index. Indexes map the values of a property to the stored objects holding them,
+    so queries can be answered without scanning the whole container.
+    Every indexed object is identified by its ordinal (insertion order in the container)
+    '''
+    def __init__(self, prop, attr=None):
+        '''
+        :param prop: str indexed property
+        :param attr: str attribute holding the indexed values. Defaults to the property
+        '''
+        self.prop = prop
+        self.attr = attr or prop
+
+    def add(self, obj, ordinal):
+        pass
+
+    def add_many(self, entries):
+        '''
+        :param entries: list of tuples (obj, ordinal)
+        '''
+        for obj, ordinal in entries:
+            self.add(obj, ordinal)
+
+    def remove(self, obj, ordinal):
+        pass
+
+    def replace(self, old, new, ordinal):
+        '''
+        swaps the object indexed at `ordinal` for `new`, holding the same value
+        '''
+        pass
+
+    def lookup(self, value):
+        '''
+        returns the candidates for `value` in insertion order.
+        None means this index cannot answer the query
+        :rtype list(Model)|None:
+        '''
+        return None
+
+    def count(self, value):
+        '''
+        returns the number of indexed objects equal to `value`.
+        None means this index cannot count them
+        :rtype int|None:
+        '''
+        return None
@@ -0,0 +1,195 @@
+from .hash_index import HashIndex
+from .sorted_index import SortedIndex
+from .column_index import ColumnIndex, numpy
+from .counter_index import CounterIndex
+from .index import relation_id
+
+# columns are rebuilt once at least this many (and more than half) of their slots are dead
+COMPACT_THRESHOLD = 1024
+
+class IndexSet(object):
+    '''
+    Keeps all the indexes and columns declared on a model in sync with its container
+    '''
+    kinds = {
+        'hash': HashIndex,
+        'sorted': SortedIndex,
+    }
+
+    def __init__(self, declared, columns=(), relations=()):
+        '''
+        :param declared: dict mapping property names to index kinds
+        :param columns: list of properties stored in columns
+        :param relations: relation properties, indexed by the related id.
+            Relations without an index are counted, so reverse counts stay O(1)
+        '''
+        self.declared = declared
+        self.column_props = list(columns)
+        self.relations = set(relations)
+        self._reset()
+
+    def _attr(self, prop):
+        return '{}_id'.format(prop) if prop in self.relations else prop
+
+    def _reset(self):
+        self.indexes = {
+            prop: self.kinds[kind](prop, self._attr(prop)) for prop, kind in self.declared.items()
+        }
+        self.columns = {prop: ColumnIndex(prop, self._attr(prop)) for prop in self.column_props}
+        self.counters = {
+            prop: CounterIndex(prop, self._attr(prop)) for prop in self.relations if prop not in self.indexes
+        }
+        self.all = list(self.indexes.values()) + list(self.columns.values()) + list(self.counters.values())
+        self.ordinals = {}
+        self.next_ordinal = 0
+        # columns answer with ordinals, so they need the object stored at each ordinal
+        self.rows = [] if self.columns else None
+        self.dead = 0
+
+    def add(self, obj):
+        '''
+        indexes a newly stored object
+        '''
+        if not self.all:
+            return
+
+        ordinal = self.next_ordinal
+        self.next_ordinal += 1
+        self.ordinals[obj.id] = ordinal
+        if self.rows is not None:
+            self.rows.append(obj)
+
+        for index in self.all:
+            index.add(obj, ordinal)
+
+    def add_many(self, objs):
+        '''
+        indexes many newly stored objects at once
+        '''
+        if not self.all:
+            return
+
+        entries = []
+        for obj in objs:
+            self.ordinals[obj.id] = self.next_ordinal
+            entries.append((obj, self.next_ordinal))
+            self.next_ordinal += 1
+
+        if self.rows is not None:
+            self.rows.extend(obj for obj, _ in entries)
+
+        for index in self.all:
+            index.add_many(entries)
+
+    def remove(self, obj):
+        '''
+        drops a stored object from all indexes
+        '''
+        ordinal = self.ordinals.pop(obj.id, None)
+        if ordinal is None:
+            return
+
+        for index in self.all:
+            index.remove(obj, ordinal)
+
+        if self.rows is not None:
+            self.rows[ordinal] = None
+            self.dead += 1
+            if self.dead >= COMPACT_THRESHOLD and self.dead * 2 > len(self.rows):
+                self._compact()
+
+    def _compact(self):
+        '''
+        rebuilds everything from the live objects, dropping the dead slots
+        '''
+        live = [obj for obj in self.rows if obj is not None]
+        self._reset()
+        self.add_many(live)
+
+    def replace(self, old, new, props):
+        '''
+        swaps a stored object for its new version, re-indexing only the changed properties
+        :param props: set of properties whose values changed
+        '''
+        ordinal = self.ordinals.get(old.id)
+        if ordinal is None:
+            return
+
+        if self.rows is not None:
+            self.rows[ordinal] = new
+
+        for index in self.all:
+            if index.prop in props:
+                index.remove(old, ordinal)
+                index.add(new, ordinal)
+            else:
+                index.replace(old, new, ordinal)
+
+    def lookup(self, prop, value):
+        '''
+        returns the candidates for `value` from the index of `prop`, in container order.
+        None means the index can't answer the query and the container must be scanned
+        :rtype list(Model)|None:
+        '''
+        index = self.indexes.get(prop)
+        if index is None:
+            return None
+
+        if prop in self.relations:
+            value = relation_id(value)
+
+        return index.lookup(value)
+
+    def count(self, prop, value):
+        '''
+        returns the number of stored objects whose `prop` equals `value`, from the index
+        or counter of `prop`. None means they must be counted by scanning
+        :rtype int|None:
+        '''
+        index = self.indexes.get(prop) or self.counters.get(prop)
+        if index is None:
+            return None
+
+        if prop in self.relations:
+            value = relation_id(value)
+
+        return index.count(value)
+
+    def _query_value(self, query, prop):
+        value = query[prop]
+        return relation_id(value) if prop in self.relations else value
+
+    def scan_columns(self, query, props):
+        '''
+        evaluates the conditions of `query` on the columns of `props` all at once.
+        Returns the candidates in container order and the set of properties they satisfy,
+        or (None, empty set) when no column can answer the query
+        :rtype tuple(list(Model)|None, set):
+        '''
+        resolved = set()
+        if numpy is not None:
+            mask = None
+            for prop in props:
+                found = self.columns[prop].mask(self._query_value(query, prop))
+                if found is None:
+                    continue
+                mask = found if mask is None else mask & found
+                resolved.add(prop)
+
+            if mask is None:
+                return None, resolved
+            ordinals = numpy.flatnonzero(mask).tolist()
+        else:
+            ordinals = None
+            for prop in props:
+                found = self.columns[prop].match(self._query_value(query, prop), ordinals)
+                if found is None:
+                    continue
+                ordinals = found
+                resolved.add(prop)
+
+            if ordinals is None:
+                return None, resolved
+
+        rows = self.rows
+        return [rows[ordinal] for ordinal in ordinals], resolved
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+from ..query.query_prop import QueryProp
+from .index import Index
+
+class SortedIndex(Index):
+    '''
+    SortedIndex keeps the values of a property ordered, so range queries
+    (GTProp, GTEProp, LTProp, LTEProp) and equality are answered with a binary search
+    '''
+    def __init__(self, prop, attr=None):
+        super().__init__(prop, attr)
+        self.keys = []
+        self.entries = []
+        self.unordered = {}
+
+    def add(self, obj, ordinal):
+        key = getattr(obj, self.attr, None)
+        try:
+            i = bisect_right(self.keys, key)
+        except TypeError:
+            self.unordered[ordinal] = obj
+            return
+
+        self.keys.insert(i, key)
+        self.entries.insert(i, (ordinal, obj))
+
+    def add_many(self, entries):
+        # a few entries are cheaper to insert one by one than to sort everything again
+        if len(entries) * 10 < len(self.keys):
+            return super().add_many(entries)
+
+        new = [(getattr(obj, self.attr, None), (ordinal, obj)) for obj, ordinal in entries]
+        try:
+            merged = sorted(list(zip(self.keys, self.entries)) + new, key=itemgetter(0))
+        except TypeError:
+            return super().add_many(entries)
+
+        self.keys = [key for key, _ in merged]
+        self.entries = [entry for _, entry in merged]
+
+    def remove(self, obj, ordinal):
+        key = getattr(obj, self.attr, None)
+        try:
+            lo = bisect_left(self.keys, key)
+            hi = bisect_right(self.keys, key)
+        except TypeError:
+            lo = hi = 0
+
+        for i in range(lo, hi):
+            if self.entries[i][0] == ordinal:
+                del self.keys[i]
+                del self.entries[i]
+                return
+
+        self.unordered.pop(ordinal, None)
+
+    def replace(self, old, new, ordinal):
+        if ordinal in self.unordered:
+            self.unordered[ordinal] = new
+            return
+
+        key = getattr(new, self.attr, None)
+        for i in range(bisect_left(self.keys, key), bisect_right(self.keys, key)):
+            if self.entries[i][0] == ordinal:
+                self.entries[i] = (ordinal, new)
+                return
+
+    def _bounds(self, value):
+        '''
+        returns the slice of `keys` matching `value`
+        '''
+        if not isinstance(value, QueryProp):
+            return bisect_left(self.keys, value), bisect_right(self.keys, value)
+
+        bounds = value.range()
+        if bounds is None:
+            return None
+
+        lower, upper = bounds
+        lo, hi = 0, len(self.keys)
+        if lower is not None:
+            data, inclusive = lower
+            lo = (bisect_left if inclusive else bisect_right)(self.keys, data)
+        if upper is not None:
+            data, inclusive = upper
+            hi = (bisect_right if inclusive else bisect_left)(self.keys, data)
+
+        return lo, max(lo, hi)
+
+    def lookup(self, value):
+        # values that could not be ordered may match anything
+        if self.unordered:
+            return None
+
+        try:
+            bounds = self._bounds(value)
+        except TypeError:
+            return None
+
+        if bounds is None:
+            return None
+
+        lo, hi = bounds
+        return [obj for _, obj in sorted(self.entries[lo:hi])]
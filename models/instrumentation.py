@@ -0,0 +1,247 @@
+from collections import deque
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class QueryEvent(object):
+    '''
+    What one `find`, `find_one` or `count` of a model cost. Rows examined are the stored
+    items compared with the query (e.g. the candidates of an index), rows returned are the
+    items (or the count) it answered with
+    '''
+    def __init__(self, model, operation, query):
+        self.model = model
+        self.operation = operation
+        self.query = query
+        self.seconds = 0.0
+        self.rows_examined = 0
+        self.rows_returned = 0
+        # time comparing items with the query and handing them out in the read mode (e.g. deepcopy)
+        self.predicate_seconds = 0.0
+        self.read_seconds = 0.0
+        self.slow = False
+
+    def explain(self):
+        '''
+        returns the access path of the query (see `Model.explain`)
+        :rtype dict:
+        '''
+        return self.model.explain(self.query, self.operation)
+
+    def as_dict(self):
+        return {
+            'model': self.model.__name__,
+            'operation': self.operation,
+            'seconds': self.seconds,
+            'rows_examined': self.rows_examined,
+            'rows_returned': self.rows_returned,
+            'predicate_seconds': self.predicate_seconds,
+            'read_seconds': self.read_seconds,
+        }
+
+class QueryStats(object):
+    '''
+    Totals of the queries of a model
+    '''
+    fields = ('queries', 'slow_queries', 'seconds', 'rows_examined', 'rows_returned',
+              'predicate_seconds', 'read_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.slow_queries = 0
+        self.seconds = 0.0
+        self.rows_examined = 0
+        self.rows_returned = 0
+        self.predicate_seconds = 0.0
+        self.read_seconds = 0.0
+
+    def add(self, event):
+        self.queries += 1
+        self.slow_queries += event.slow
+        self.seconds += event.seconds
+        self.rows_examined += event.rows_examined
+        self.rows_returned += event.rows_returned
+        self.predicate_seconds += event.predicate_seconds
+        self.read_seconds += event.read_seconds
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in self.fields)
+
+class QueryMonitor(object):
+    '''
+    Measures the `find`, `find_one` and `count` of every model while something listens:
+    counters are enabled, a hook is registered or a slow query threshold is set.
+    Otherwise queries run as if it wasn't there. E.g.:
+        monitor.enable()
+        monitor.stats(Website).rows_examined
+        monitor.add_hook(lambda event: statsd.timing(event.operation, event.seconds))
+        monitor.set_slow_query_threshold(0.05)
+
+    Queries slower than the threshold are logged as warnings, with their access path,
+    and the latest of them are kept in `slow_queries`
+    '''
+    def __init__(self, slow_query_threshold=None, slow_query_log_size=100):
+        '''
+        :param slow_query_threshold: float seconds. None disables the slow query log
+        :param slow_query_log_size: int slow queries kept
+        '''
+        self.hooks = []
+        self.enabled = False
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self.totals = {}
+        # queries being measured by any thread, so the others skip the per item checks
+        self.tracking = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self._update()
+
+    def _update(self):
+        self.active = bool(self.enabled or self.hooks or self.slow_query_threshold is not None)
+
+    def enable(self):
+        '''
+        starts counting the queries of each model (see `stats`)
+        '''
+        self.enabled = True
+        self._update()
+
+    def disable(self):
+        self.enabled = False
+        self._update()
+
+    def add_hook(self, hook):
+        '''
+        registers `hook(event)`, called with the QueryEvent of every query once it returns.
+        Returns the hook, so it can be used as a decorator
+        '''
+        self.hooks.append(hook)
+        self._update()
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+        self._update()
+
+    def set_slow_query_threshold(self, seconds):
+        '''
+        :param seconds: float queries taking at least this long are logged. None disables the log
+        '''
+        self.slow_query_threshold = seconds
+        self._update()
+
+    def stats(self, model):
+        '''
+        returns the totals of the queries of `model` counted since enabled (or reset)
+        :rtype QueryStats:
+        '''
+        with self.lock:
+            return self.totals.get(model) or QueryStats()
+
+    def reset(self):
+        '''
+        drops the counters and the slow query log
+        '''
+        with self.lock:
+            self.totals.clear()
+            self.slow_queries.clear()
+
+    def current(self):
+        '''
+        returns the event of the query being measured by this thread, if any
+        '''
+        events = getattr(self.local, 'events', None)
+        return events[-1] if events else None
+
+    def examined(self, predicate):
+        '''
+        returns `predicate` counting the items it examines for the current query
+        '''
+        event = self.current()
+        if event is None:
+            return predicate
+
+        clock = time.perf_counter
+        def counted(item):
+            start = clock()
+            matched = predicate(item)
+            event.predicate_seconds += clock() - start
+            event.rows_examined += 1
+            return matched
+
+        return counted
+
+    def timed_reader(self, reader):
+        '''
+        returns `reader` adding the time spent reading items to the current query
+        '''
+        event = self.current()
+        if event is None:
+            return reader
+
+        clock = time.perf_counter
+        def timed(item):
+            start = clock()
+            obj = reader(item)
+            event.read_seconds += clock() - start
+            return obj
+
+        return timed
+
+    def run(self, model, operation, query, compute, returned):
+        '''
+        returns `compute()`, measuring it as a query of `model`
+        :param operation: str 'find', 'find_one' or 'count'
+        :param returned: function giving the number of rows in the result
+        '''
+        event = QueryEvent(model, operation, query)
+        events = getattr(self.local, 'events', None)
+        if events is None:
+            events = self.local.events = []
+
+        with self.lock:
+            self.tracking += 1
+        events.append(event)
+        start = time.perf_counter()
+        try:
+            result = compute()
+        finally:
+            event.seconds = time.perf_counter() - start
+            events.pop()
+            with self.lock:
+                self.tracking -= 1
+
+        event.rows_returned = returned(result)
+        self._record(event)
+        return result
+
+    def _record(self, event):
+        threshold = self.slow_query_threshold
+        if threshold is not None and event.seconds >= threshold:
+            event.slow = True
+            entry = event.as_dict()
+            entry['explain'] = event.explain()
+            with self.lock:
+                self.slow_queries.append(entry)
+            logger.warning('slow %s of %s (%.1fms, %d rows examined, %d returned): %s',
+                           event.operation, entry['model'], event.seconds * 1000,
+                           event.rows_examined, event.rows_returned, entry['explain'])
+
+        if self.enabled:
+            with self.lock:
+                stats = self.totals.get(event.model)
+                if stats is None:
+                    stats = self.totals[event.model] = QueryStats()
+                stats.add(event)
+
+        for hook in list(self.hooks):
+            try:
+                hook(event)
+            except Exception:
+                # metrics must not break the queries they measure
+                logger.exception('query hook %r failed', hook)
+
+# measures the queries of every model
+monitor = QueryMonitor()
@@ -0,0 +1,104 @@
+import logging
+
+from .model_test import ModelTestCase, ModelTest, ModelTestIndexed, ModelTestColumns
+from .instrumentation import monitor, QueryMonitor
+from .query.gt_prop import GTProp
+
+class TestInstrumentation(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        monitor.reset()
+        self.addCleanup(monitor.disable)
+        self.addCleanup(monitor.set_slow_query_threshold, None)
+        self.addCleanup(monitor.reset)
+
+    def test_inactive(self):
+        self.assertFalse(QueryMonitor().active)
+        ModelTest.create('abc')
+        self.assertEqual(ModelTest.find({'name': 'abc'})[0].name, 'abc')
+        self.assertEqual(monitor.stats(ModelTest).queries, 0)
+
+    def test_stats(self):
+        monitor.enable()
+        for name in ['a', 'b', 'a', 'c']:
+            ModelTest.create(name)
+            ModelTestIndexed.create(name)
+
+        self.assertEqual(len(ModelTest.find({'name': 'a'})), 2)
+        self.assertEqual(ModelTest.count({'name': 'b'}), 1)
+        self.assertEqual(ModelTest.find_one({'name': 'c'}).name, 'c')
+        stats = monitor.stats(ModelTest)
+        self.assertEqual(stats.queries, 3)
+        # the full scans compare every item, find_one stops at its match
+        self.assertEqual(stats.rows_examined, 12)
+        self.assertEqual(stats.rows_returned, 4)
+        self.assertGreater(stats.read_seconds, 0)
+        self.assertGreater(stats.predicate_seconds, 0)
+
+        # indexes hand out only their candidates
+        self.assertEqual(len(ModelTestIndexed.find({'name': 'a'})), 2)
+        self.assertEqual(ModelTestIndexed.count({'name': 'a'}), 2)
+        stats = monitor.stats(ModelTestIndexed)
+        self.assertEqual(stats.rows_examined, 2)
+        self.assertEqual(stats.rows_returned, 4)
+
+    def test_hooks(self):
+        events = []
+        hook = monitor.add_hook(events.append)
+        self.addCleanup(monitor.remove_hook, hook)
+
+        @monitor.add_hook
+        def failing(event):
+            raise Exception('metrics are down')
+        self.addCleanup(monitor.remove_hook, failing)
+
+        ModelTest.create('abc')
+        with self.assertLogs('models.instrumentation', logging.ERROR):
+            self.assertEqual(ModelTest.count(), 1)
+
+        self.assertEqual([(event.model, event.operation, event.rows_returned) for event in events],
+                         [(ModelTest, 'count', 1)])
+        self.assertEqual(events[0].explain()['access'], 'size')
+        # counters are only kept when enabled
+        self.assertEqual(monitor.stats(ModelTest).queries, 0)
+
+    def test_slow_query_log(self):
+        ModelTest.create('abc')
+        monitor.set_slow_query_threshold(0)
+        with self.assertLogs('models.instrumentation', logging.WARNING) as logs:
+            ModelTest.find({'name': 'abc'})
+
+        self.assertIn('slow find of ModelTest', logs.output[0])
+        self.assertEqual(len(monitor.slow_queries), 1)
+        self.assertEqual(monitor.slow_queries[0]['explain']['access'], 'full_scan')
+
+        monitor.set_slow_query_threshold(60)
+        ModelTest.find({'name': 'abc'})
+        self.assertEqual(len(monitor.slow_queries), 1)
+
+    def test_explain(self):
+        for name in ['a', 'b', 'a']:
+            ModelTest.create(name)
+            ModelTestIndexed.create(name)
+        ModelTestColumns.create(1, None)
+        ModelTestColumns.create(2, None)
+
+        explained = ModelTest.explain({'name': 'a'})
+        self.assertEqual(explained['access'], 'full_scan')
+        self.assertEqual(explained['candidates'], 3)
+        self.assertEqual(explained['filters'], ['name'])
+        self.assertEqual(explained['model'], 'ModelTest')
+        self.assertIsNone(explained['cached'])
+
+        explained = ModelTestIndexed.explain({'name': 'a'}, 'find_one')
+        self.assertEqual((explained['access'], explained['index'], explained['index_type']),
+                         ('index', 'name', 'HashIndex'))
+        self.assertEqual((explained['candidates'], explained['filters']), (2, []))
+        self.assertEqual(ModelTestIndexed.explain({'name': 'a'}, 'count')['access'], 'index_count')
+        self.assertEqual(ModelTestIndexed.objects.filter(name='b').explain()['candidates'], 1)
+
+        explained = ModelTestColumns.explain({'price': GTProp(1)})
+        self.assertEqual((explained['access'], explained['columns']), ('columns', ['price']))
+
+        with self.assertRaises(Exception):
+            ModelTest.explain({}, 'remove')
@@ -1,14 +1,95 @@
 from copy import deepcopy
 from datetime import datetime
+from itertools import count, islice
+import threading
+
+from .autoproperty import autoproperty, skip_validation
+from .instrumentation import monitor
+from .rwlock import ReadWriteLock
+from .session import Session
+from .storage import MemoryBackend, ExecutorBackend
+from .storage.codec import codec_for
+from .snapshot import FrozenView, CopyOnWriteProxy
+from .query.queryset import QueryManager
+from .query.compiler import compile_query
+
+_default_backend = MemoryBackend()
+# id counters and reader/writer locks of each model
+_sequences = {}
+_locks = {}
+# async adapters of the synchronous backends
+_async_backends = {}
+# items fetched at once by the async iterators
+ASYNC_BATCH_SIZE = 100
+# id blocks reserved by bulk_create, per thread
+_local = threading.local()
+# attributes making up the state of each model class (see Model.__getstate__)
+_state_names = {}
+# target model of each relation, once resolved
+_relation_models = {}
+# write generation of each model, bumped by every write (see ResultCache)
+_generations = {}
+
+def _locked(items, lock):
+    '''
+    iterates `items` holding the read lock only while each item is produced
+    '''
+    items = iter(items)
+    while True:
+        with lock.read():
+            item = next(items, _locked)
+        if item is _locked:
+            return
+        yield item
 
-from .autoproperty import autoproperty
-
-_global_containers = {}
+def _batches(items, size):
+    '''
+    groups an iterator into lists of `size` items
+    '''
+    batch = list(islice(items, size))
+    while batch:
+        yield batch
+        batch = list(islice(items, size))
 
 class Model(object):
     """
     Base model class to be shared in all models
     """
+    # keeps models declared with @baseproperties(slots=True) free of a __dict__.
+    # `__related` caches the related models of the relation properties
+    __slots__ = ('__dirty', '__related')
+
+    # how stored objects are handed out by reads: deep copies ('copy'),
+    # read-only views ('frozen') or copy-on-write proxies ('cow')
+    __read_mode__ = 'copy'
+
+    read_modes = {
+        'copy': deepcopy,
+        'frozen': FrozenView,
+        'cow': CopyOnWriteProxy,
+    }
+
+    # lazy and chainable queries. E.g.: Model.objects.filter(name='abc')[:10]
+    objects = QueryManager()
+
+    # maps backing attributes to their property names. Filled by @autoproperty
+    __inner_properties__ = {}
+
+    # storage of this model (see `storage`). None means the default backend
+    __backend__ = None
+
+    # storage used by the async api. None runs the synchronous backend in an executor
+    __async_backend__ = None
+
+    # cache of query results (see `result_cache`). None disables it
+    __cache__ = None
+
+    # objects told about every write of this model, e.g. `scheduler.ExpiryScheduler`.
+    # They implement inserted(model, objs), updated(model, obj, changed),
+    # removed(model, obj) and cleared(model), called right after each write
+    # (while the write lock is held, except for the async api)
+    __observers__ = ()
+
     def __init__(self, created_at=None, updated_at=None, id=None):
         if id is None:
             id = self.__class__.next_sequence()
@@ -27,6 +108,13 @@ class Model(object):
         default __repr__ for all models
         '''
         def get_prop_value(obj, prop, default):
+            # relations are printed without reading the related model
+            if prop in getattr(self, '__relations__', {}):
+                v = getattr(self, '_{}'.format(prop), None)
+                if v is None:
+                    return None
+                return '{} [id={}]'.format(self._relation_model(prop).__name__, v)
+
             v = getattr(self, prop, None)
 
             if isinstance(v, Model):
@@ -50,9 +138,165 @@ class Model(object):
     def __setattr__(self, attr, value):
         super().__setattr__(attr, value)
 
-        if attr in ['created_at', 'updated_at', '_created_at', '_updated_at']:
+        # writes to backing attributes (including custom setters) mark the property as dirty.
+        # `updated_at` is only stamped once, when the object is saved
+        prop = self.__inner_properties__.get(attr)
+        if prop is not None:
+            try:
+                self.__dirty.add(prop)
+            except AttributeError:
+                self.__dirty = set([prop])
+
+    def __getstate__(self):
+        '''
+        state used by copy and pickle: the backing attributes, without the cached related models
+        '''
+        cls = type(self)
+        names = _state_names.get(cls)
+        if names is None:
+            names = []
+            for klass in cls.__mro__:
+                for name in klass.__dict__.get('__slots__', ()):
+                    if name.startswith('__') and not name.endswith('__'):
+                        name = '_{}{}'.format(klass.__name__.lstrip('_'), name)
+                    names.append(name)
+            _state_names[cls] = names
+
+        state = dict(getattr(self, '__dict__', {}))
+        for name in names:
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+
+        state.pop('_Model__related', None)
+        return state
+
+    def __setstate__(self, state):
+        # restoring the state is not a change
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def _relation_model(cls, prop):
+        '''
+        returns the model a relation property points to. Targets can be declared
+        by name (e.g. relation='Customer') to avoid circular imports
+        '''
+        target = _relation_models.get((cls, prop))
+        if target is not None:
+            return target
+
+        target = cls.__relations__[prop]
+        if isinstance(target, str):
+            pending = list(Model.__subclasses__())
+            found = None
+            while pending and found is None:
+                model = pending.pop()
+                pending.extend(model.__subclasses__())
+                if target in (model.__name__, '{}.{}'.format(model.__module__, model.__qualname__)):
+                    found = model
+            if found is None:
+                raise Exception('Unknown model {} in relation {}'.format(target, prop))
+            target = found
+
+        _relation_models[(cls, prop)] = target
+        return target
+
+    def _get_relation(self, prop, cache=True):
+        '''
+        returns the related model of a relation property. It is read once, through the
+        current session when there is one, and kept by this object
+        :param cache: bool keep the related model on this object. Views over stored
+            objects don't, so stored objects never hold related models
+        '''
+        id = getattr(self, '_{}'.format(prop), None)
+        if id is None:
+            return None
+
+        related = getattr(self, '_Model__related', None)
+        obj = None if related is None else related.get(prop)
+        if obj is not None and obj.id == id:
+            return obj
+
+        target = self._relation_model(prop)
+        session = Session.current()
+        if session is not None:
+            obj = session.get_many(target, [id]).get(id)
+        else:
+            obj = target.get_many([id]).get(id)
+
+        if obj is not None and cache:
+            self._cache_relation(prop, obj)
+
+        return obj
+
+    def _cache_relation(self, prop, obj):
+        related = getattr(self, '_Model__related', None)
+        if related is None:
+            related = {}
+            object.__setattr__(self, '_Model__related', related)
+        related[prop] = obj
+
+    def _set_relation(self, prop, value):
+        '''
+        stores the id of `value` (a model, an id or None) in a relation property
+        '''
+        if isinstance(value, Model) or hasattr(value, '__properties__'):
+            setattr(self, '_{}'.format(prop), value.id)
+            self._cache_relation(prop, value)
             return
-        self.updated_at = datetime.now()
+
+        related = getattr(self, '_Model__related', None)
+        if related is not None:
+            related.pop(prop, None)
+        setattr(self, '_{}'.format(prop), value)
+
+    def _detach_relations(self):
+        '''
+        drops the related models kept by this object, before it is stored
+        '''
+        if getattr(self, '_Model__related', None) is not None:
+            object.__delattr__(self, '_Model__related')
+
+    def _changed_relations(self):
+        '''
+        yields the related models held by this object which have unsaved changes
+        '''
+        related = getattr(self, '_Model__related', None)
+        for obj in (related or {}).values():
+            if obj.changed_fields():
+                yield obj
+
+    def _related(self):
+        '''
+        yields the (property, model) pairs of the related models held by this object
+        '''
+        for prop in self.__inner_properties__.values():
+            value = getattr(self, '_{}'.format(prop), None)
+            if isinstance(value, Model):
+                yield prop, value
+
+    def changed_fields(self):
+        '''
+        returns the properties changed since this object was last stored.
+        Related models changed in place count as changed properties as well
+        :rtype frozenset:
+        '''
+        changed = set(getattr(self, '_Model__dirty', ()))
+        for prop, value in self._related():
+            if value.changed_fields():
+                changed.add(prop)
+
+        return frozenset(changed)
+
+    def _mark_clean(self):
+        # dropping the set (instead of clearing it) keeps stored objects small
+        if getattr(self, '_Model__dirty', None) is not None:
+            del self.__dirty
+
+        for _, value in self._related():
+            value._mark_clean()
 
     def save(self):
         '''
@@ -66,96 +310,386 @@ class Model(object):
         '''
         self.__class__.remove_object(self)
 
-    @staticmethod
-    def _get_global_container(cls):
+    async def asave(self):
+        '''
+        same as `save`, without blocking the event loop
         '''
-        manages all containers from all models
+        await self.__class__.asave_object(self)
+
+    @classmethod
+    def _get_backend(cls):
+        '''
+        Returns the storage backend of this class.
+        Models use the default backend unless they set `__backend__`
+        '''
+        return cls.__backend__ or _default_backend
+
+    @classmethod
+    def _get_async_backend(cls):
+        '''
+        Returns the async storage backend of this class
+        :rtype storage.AsyncBackend:
         '''
-        return _global_containers.get(cls, [])
+        if cls.__async_backend__ is not None:
+            return cls.__async_backend__
+
+        backend = cls._get_backend()
+        adapter = _async_backends.get(backend)
+        if adapter is None:
+            adapter = _async_backends.setdefault(backend, ExecutorBackend(backend))
+
+        return adapter
 
     @staticmethod
-    def _set_global_container(cls, ct):
+    def use_backend(backend):
         '''
-        manages all containers from all models
+        sets the default storage backend of all models
+        :param backend: storage.Backend
         '''
-        _global_containers[cls] = ct
+        global _default_backend
+        _default_backend = backend
+
+    @staticmethod
+    def _all_models():
+        models = []
+        pending = list(Model.__subclasses__())
+        while pending:
+            model = pending.pop()
+            pending.extend(model.__subclasses__())
+            models.append(model)
+
+        return models
+
+    @staticmethod
+    def _all_backends():
+        backends = [_default_backend]
+        for model in Model._all_models():
+            if model.__backend__ is not None and model.__backend__ not in backends:
+                backends.append(model.__backend__)
+
+        return backends
 
     @staticmethod
     def reset_all_containers():
-        _global_containers.clear()
+        for backend in Model._all_backends():
+            backend.reset()
+        for model in Model._all_models():
+            model._written()
+            model._notify('cleared')
+
+    @classmethod
+    def _written(cls):
+        '''
+        bumps the write generation of this model, so its cached results are dropped.
+        Called by every write, while the write lock is held
+        '''
+        _generations[cls] = _generations.get(cls, 0) + 1
 
     @classmethod
-    def _get_container(cls):
+    def _notify(cls, event, *args):
         '''
-        Returns the base storage for this class
+        tells the observers of this model about a write (see `__observers__`)
         '''
-        return cls._get_global_container(cls)
+        for observer in cls.__observers__:
+            getattr(observer, event)(cls, *args)
 
     @classmethod
-    def _set_container(cls, ct):
+    def _cached(cls, kind, query, compute):
         '''
-        Updates the base storage for this class
+        returns `compute()`, through the result cache of this model if it has one
         '''
-        cls._set_global_container(cls, ct)
+        cache = cls.__cache__
+        if cache is None:
+            return compute()
+
+        return cache.get(cls, kind, query or {}, cls._cache_generation(), compute)
+
+    @classmethod
+    def _cache_generation(cls):
+        '''
+        returns what cached results of this model are valid for: its backend (which
+        `use_backend` or `__backend__` may change) and its write generation
+        '''
+        return (cls._get_backend(), _generations.get(cls, 0))
+
+    @classmethod
+    def _lock(cls):
+        '''
+        returns the reader/writer lock of this model. Reads share it and writes are serialized
+        :rtype ReadWriteLock:
+        '''
+        lock = _locks.get(cls)
+        if lock is None:
+            lock = _locks.setdefault(cls, ReadWriteLock())
+
+        return lock
+
+    @classmethod
+    def _sequence(cls):
+        sequence = _sequences.get(cls)
+        if sequence is None:
+            sequence = _sequences.setdefault(cls, count(1))
+
+        return sequence
 
     @classmethod
     def next_sequence(cls):
-        n = getattr(cls, '_next_sequence', 1)
-        setattr(cls, '_next_sequence', n+1)
-        return n
+        '''
+        returns a new id. `itertools.count` is advanced atomically, so no lock is needed
+        '''
+        block = getattr(_local, 'blocks', {}).get(cls)
+        if block is not None:
+            return next(block)
+
+        return next(cls._sequence())
+
+    @classmethod
+    def allocate_sequence(cls, size):
+        '''
+        reserves `size` ids at once. They are consecutive unless other threads
+        take ids at the same time
+        :rtype list(int):
+        '''
+        return list(islice(cls._sequence(), size))
+
+    @classmethod
+    def reset_sequence(cls, start=1):
+        '''
+        restarts the ids of this model from `start`
+        '''
+        _sequences[cls] = count(start)
+
+    @classmethod
+    def advance_sequence(cls, last):
+        '''
+        makes sure the new ids of this model are greater than `last`
+        '''
+        n = next(cls._sequence())
+        _sequences[cls] = count(max(n, last + 1))
 
     @classmethod
     def clear(cls):
         '''
         Clear all stored items
         '''
-        cls._set_container([])
+        with cls._lock().write():
+            cls._get_backend().clear(cls)
+            cls._written()
+            cls._notify('cleared')
+
+    @classmethod
+    def _reader(cls, read_mode=None):
+        '''
+        returns the function handing out stored items in `read_mode`
+        :param read_mode: str one of `read_modes`. Defaults to the model `__read_mode__`
+        '''
+        reader = cls.read_modes.get(read_mode or cls.__read_mode__)
+        if reader is None:
+            raise Exception('Invalid read mode. Required one of: {}'.format(', '.join(cls.read_modes)))
+
+        if monitor.tracking:
+            reader = monitor.timed_reader(reader)
+        return reader
 
     @classmethod
-    def all(cls):
+    def _read(cls, item, read_mode=None):
+        '''
+        hands out a stored item according to the read mode
+        :param read_mode: str one of `read_modes`. Defaults to the model `__read_mode__`
+        '''
+        return cls._reader(read_mode)(item)
+
+    @classmethod
+    def all(cls, read_mode=None):
         '''
         all returns all the stored items for this model
+        :param read_mode: str see `read_modes`
         '''
-        ct = cls._get_container()
-        return deepcopy(ct)
+        with cls._lock().read():
+            return [cls._read(item, read_mode) for item in cls._get_backend().scan(cls, {})]
 
     @classmethod
     def create(cls, *args, **kwargs):
         '''
-        creates a new model and stores it
+        creates a new model and stores it. Related models with unsaved changes are saved first
         '''
         obj = cls(*args, **kwargs)
-        ct = cls._get_container()
-        ct.append(obj)
-        cls._set_container(ct)
-
-        return deepcopy(obj)
+        for related in list(obj._changed_relations()):
+            related.save()
+        obj._mark_clean()
+        obj._detach_relations()
+        with cls._lock().write():
+            cls._get_backend().insert(cls, obj)
+            cls._written()
+            cls._notify('inserted', [obj])
+            return cls._read(obj)
 
     @classmethod
     def _compare_props_query(cls, v1, v2):
         return v1 == v2
 
     @classmethod
-    def find(cls, query=None):
+    def _predicate(cls, query, skip=()):
         '''
-        queries stored items for this model
+        returns a function telling if an item matches `query`
+        :param skip: keys already resolved by indexes or columns
+        '''
+        compare = cls._compare_props_query
+        if compare.__func__ is Model._compare_props_query.__func__:
+            compare = None
+
+        predicate = compile_query(cls, query).predicate(query, skip=skip, compare=compare)
+        if monitor.tracking:
+            predicate = monitor.examined(predicate)
+        return predicate
+
+    @classmethod
+    def _matches(cls, item, query):
+        '''
+        returns true if `item` matches every property in `query`
+        '''
+        return cls._predicate(query)(item)
+
+    @classmethod
+    def _query_plan(cls, query):
+        '''
+        returns the compiled plan of `query` (see `query.compiler`)
+        '''
+        return compile_query(cls, query)
+
+    @classmethod
+    def _iter_matches(cls, query, snapshot=False):
+        '''
+        yields the stored items matching the query, in insertion order
         :param query: dict where keys are properties
+        :param snapshot: bool the items must not be affected by writes made while
+            they are consumed. Snapshots hold the read lock while each item is produced,
+            not while it is consumed. Other scans must be consumed by a caller
+            holding the read lock
         '''
         if query is None:
             query = {}
 
-        ct = cls._get_container()
-        results = []
-        for item in ct:
-            valid = True
-            for key, value in query.items():
-                if not cls._compare_props_query(getattr(item, key, None), value):
-                    valid = False
+        lock = cls._lock()
+        if not snapshot:
+            if not lock.held():
+                raise RuntimeError('Scans without a snapshot must be consumed under the read lock')
+            return cls._get_backend().scan(cls, query)
 
-            if valid:
-                results.append(deepcopy(item))
+        with lock.read():
+            items = cls._get_backend().scan(cls, query, snapshot=True)
 
-        return results
+        return _locked(items, lock)
+
+    @classmethod
+    def _iter_read(cls, items, read_mode=None):
+        '''
+        reads each stored item under the read lock, so it is never copied while being written
+        '''
+        lock = cls._lock()
+        for item in items:
+            with lock.read():
+                obj = cls._read(item, read_mode)
+            yield obj
+
+    @classmethod
+    def iter_all(cls, batch_size=None, read_mode=None):
+        '''
+        streams all the stored items for this model. See `iter_find`
+        '''
+        return cls.iter_find(None, batch_size=batch_size, read_mode=read_mode)
+
+    @classmethod
+    def iter_find(cls, query=None, batch_size=None, read_mode=None):
+        '''
+        streams the items matching the query instead of building a list.
+        Each item is only read (copied) when it is reached
+        :param query: dict where keys are properties
+        :param batch_size: int yields lists of up to `batch_size` items instead of single items
+        :param read_mode: str see `read_modes`
+        '''
+        if batch_size is not None and batch_size < 1:
+            raise Exception('Invalid batch size. Required a positive integer')
+
+        items = cls._iter_read(cls._iter_matches(query, snapshot=True), read_mode)
+        if batch_size is None:
+            return items
+
+        return _batches(items, batch_size)
+
+    @classmethod
+    def find(cls, query=None, read_mode=None):
+        '''
+        queries stored items for this model
+        :param query: dict where keys are properties
+        :param read_mode: str see `read_modes`
+        '''
+        if monitor.active:
+            return monitor.run(cls, 'find', query, lambda: cls._find(query, read_mode), len)
+
+        return cls._find(query, read_mode)
+
+    @classmethod
+    def _find(cls, query, read_mode):
+        with cls._lock().read():
+            items = cls._cached('find', query, lambda: list(cls._iter_matches(query)))
+            reader = cls._reader(read_mode)
+            return [reader(item) for item in items]
+
+    @classmethod
+    def get_many(cls, ids, read_mode=None):
+        '''
+        returns {id: object} for the stored objects with `ids`, in a single lookup
+        :param ids: iterable(int)
+        :param read_mode: str see `read_modes`
+        :rtype dict:
+        '''
+        reader = cls._reader(read_mode)
+        with cls._lock().read():
+            return dict((id, reader(obj)) for id, obj in cls._get_backend().get_many(cls, ids).items())
+
+    @classmethod
+    def load_related(cls, objs, *paths):
+        '''
+        resolves relations of many objects of this model at once: one lookup per relation,
+        instead of one per object. Paths follow relations with `__`. E.g.:
+            Website.load_related(websites, 'customer__subscription__plan')
+        :param objs: list(Model) objects of this model
+        :param paths: str relation properties
+        '''
+        tree = {}
+        for path in paths:
+            node = tree
+            for prop in path.split('__'):
+                node = node.setdefault(prop, {})
+
+        cls._load_related(objs, tree)
+
+    @classmethod
+    def _load_related(cls, objs, tree):
+        relations = getattr(cls, '__relations__', {})
+        session = Session.current()
+        for prop, subtree in tree.items():
+            if prop not in relations:
+                raise Exception('{} is not a relation of {}'.format(prop, cls.__name__))
+
+            target = cls._relation_model(prop)
+            ids = set(getattr(obj, '{}_id'.format(prop)) for obj in objs)
+            ids.discard(None)
+            if session is not None:
+                found = session.get_many(target, ids)
+            else:
+                found = target.get_many(ids)
+
+            loaded = []
+            for obj in objs:
+                related = found.get(getattr(obj, '{}_id'.format(prop)))
+                if related is not None:
+                    obj._cache_relation(prop, related)
+                    loaded.append(related)
+
+            if subtree:
+                target._load_related(list(dict((id(obj), obj) for obj in loaded).values()), subtree)
 
     @classmethod
     def count(cls, query=None):
@@ -164,94 +698,301 @@ class Model(object):
         :param query: dict where keys are properties
         :rtype int:
         '''
-        if query is None:
-            query = {}
+        if monitor.active:
+            return monitor.run(cls, 'count', query, lambda: cls._count(query), lambda found: found)
+
+        return cls._count(query)
+
+    @classmethod
+    def _count(cls, query):
+        with cls._lock().read():
+            return cls._cached('count', query, lambda: cls._get_backend().count(cls, query or {}))
 
-        ct = cls._get_container()
-        results = 0
-        for item in ct:
-            valid = True
-            for key, value in query.items():
-                if not cls._compare_props_query(getattr(item, key, None), value):
-                    valid = False
+    @classmethod
+    def explain(cls, query=None, operation='find'):
+        '''
+        describes how `find` (or `find_one`, `count`) would answer the query, without running it.
+        E.g. {'access': 'index', 'index': 'customer', 'candidates': 4, ...} or {'access': 'full_scan', ...}
+        :param query: dict where keys are properties
+        :param operation: str 'find', 'find_one' or 'count'
+        :rtype dict:
+        '''
+        if operation not in ('find', 'find_one', 'count'):
+            raise Exception('Invalid operation. Required one of: find, find_one, count')
 
-            if valid:
-                results += 1
+        query = query or {}
+        backend = cls._get_backend()
+        with cls._lock().read():
+            explained = backend.explain(cls, query, operation)
+            cache = cls.__cache__
+            cached = None if cache is None else \
+                cache.contains(cls, operation, query, cls._cache_generation())
 
-        return results
+        explained.update(model=cls.__name__, operation=operation, backend=type(backend).__name__,
+                         cached=cached)
+        return explained
 
     @classmethod
-    def find_one(cls, query):
+    def aggregate(cls, query=None, **aggregates):
         '''
-        queries stored items for this model. Returns only the first result
+        summarizes the items matching the query in a single pass, without copying them. E.g.:
+            Plan.aggregate(total=Count(), cheapest=Min('price'), average=Avg('price'))
         :param query: dict where keys are properties
+        :param aggregates: Aggregate by name (see `query.aggregate`)
+        :rtype dict: the value of each aggregate by name
         '''
-        if query is None:
-            query = {}
+        names = list(aggregates)
+        functions = [aggregates[name] for name in names]
+        with cls._lock().read():
+            groups = cls._get_backend().aggregate(cls, query or {}, [], functions)
 
-        ct = cls._get_container()
-        for item in ct:
-            valid = True
-            for key, value in query.items():
-                if not cls._compare_props_query(getattr(item, key, None), value):
-                    valid = False
+        states = groups.get((), None) or [function.start() for function in functions]
+        return dict((name, function.result(state))
+                    for name, function, state in zip(names, functions, states))
 
-            if valid:
-                return deepcopy(item)
+    @classmethod
+    def group_by(cls, keys, query=None, **aggregates):
+        '''
+        summarizes the items matching the query per group, in a single pass without copying them.
+        Groups are given by properties (relations are grouped by id) or functions of the stored
+        objects, which must not change them. E.g.:
+            Subscription.group_by('plan', subscriptions=Count())
+            Subscription.group_by(lambda s: s.renewal_date.isocalendar()[:2], expiring=Count())
+        :param keys: str property, function or a list of them
+        :param query: dict where keys are properties
+        :param aggregates: Aggregate by name (see `query.aggregate`)
+        :rtype dict: {group: {name: value}}. Groups are tuples when there are many keys
+        '''
+        single = not isinstance(keys, (list, tuple))
+        keys = [keys] if single else list(keys)
+        names = list(aggregates)
+        functions = [aggregates[name] for name in names]
+        with cls._lock().read():
+            groups = cls._get_backend().aggregate(cls, query or {}, keys, functions)
 
-        return None
+        return dict((group[0] if single else group,
+                     dict((name, function.result(state))
+                          for name, function, state in zip(names, functions, states)))
+                    for group, states in groups.items())
+
+    @classmethod
+    def find_one(cls, query, read_mode=None):
+        '''
+        queries stored items for this model. Returns only the first result
+        :param query: dict where keys are properties
+        :param read_mode: str see `read_modes`
+        '''
+        if monitor.active:
+            return monitor.run(cls, 'find_one', query, lambda: cls._find_one(query, read_mode),
+                               lambda found: int(found is not None))
+
+        return cls._find_one(query, read_mode)
+
+    @classmethod
+    def _find_one(cls, query, read_mode):
+        with cls._lock().read():
+            item = cls._cached('find_one', query, lambda: next(iter(cls._iter_matches(query)), None))
+            return None if item is None else cls._read(item, read_mode)
 
     @classmethod
     def save_object(cls, obj):
         '''
-        saves an object to this container
+        saves an object to this container. Related models changed in place are saved first
         :param obj: Model
         '''
-        ct = cls._get_container()
-        to_replace = -1
-        for i, se in enumerate(ct):
-            if se.id == obj.id:
-                to_replace = i
+        for related in list(obj._changed_relations()):
+            related.save()
 
-        if to_replace >= 0:
-            ct[to_replace] = deepcopy(obj)
-        else:
-            ct.append(deepcopy(obj))
+        changed = obj.changed_fields()
+        if changed:
+            obj.updated_at = datetime.now()
+            changed = changed | set(['updated_at'])
 
-        cls._set_container(ct)
+        with cls._lock().write():
+            cls._get_backend().upsert(cls, obj, changed)
+            cls._written()
+            cls._notify('updated', obj, changed)
+        obj._mark_clean()
 
     @classmethod
-    def _seed_from_list(cls, data):
-        obj = cls.create(*data)
-        return obj
+    async def acreate(cls, *args, **kwargs):
+        '''
+        same as `create`, without blocking the event loop
+        '''
+        obj = cls(*args, **kwargs)
+        for related in list(obj._changed_relations()):
+            await related.asave()
+        obj._mark_clean()
+        obj._detach_relations()
+        return await cls._get_async_backend().insert(cls, obj, cls._reader())
 
     @classmethod
-    def _seed_from_dict(cls, data):
-        obj = cls.create(**data)
-        return obj
+    async def afind(cls, query=None, read_mode=None):
+        '''
+        same as `find`, without blocking the event loop
+        '''
+        return await cls._get_async_backend().scan(cls, query or {}, cls._reader(read_mode))
+
+    @classmethod
+    async def afind_one(cls, query, read_mode=None):
+        '''
+        same as `find_one`, without blocking the event loop
+        '''
+        async for batch in cls._get_async_backend().iter_scan(cls, query or {}, 1,
+                                                              cls._reader(read_mode)):
+            return batch[0]
+
+        return None
+
+    @classmethod
+    async def acount(cls, query=None):
+        '''
+        same as `count`, without blocking the event loop
+        '''
+        return await cls._get_async_backend().count(cls, query or {})
+
+    @classmethod
+    async def aiter_find(cls, query=None, batch_size=None, read_mode=None):
+        '''
+        async iterator over the items matching the query. Items are fetched (and read)
+        `ASYNC_BATCH_SIZE` at a time. E.g.:
+            async for website in Website.aiter_find({'customer': customer}):
+                ...
+        :param batch_size: int yields lists of up to `batch_size` items instead of single items
+        '''
+        if batch_size is not None and batch_size < 1:
+            raise Exception('Invalid batch size. Required a positive integer')
+
+        batches = cls._get_async_backend().iter_scan(
+            cls, query or {}, batch_size or ASYNC_BATCH_SIZE, cls._reader(read_mode))
+        async for batch in batches:
+            if batch_size is not None:
+                yield batch
+                continue
+
+            for item in batch:
+                yield item
+
+    @classmethod
+    async def asave_object(cls, obj):
+        '''
+        same as `save_object`, without blocking the event loop
+        '''
+        for related in list(obj._changed_relations()):
+            await related.asave()
+
+        changed = obj.changed_fields()
+        if changed:
+            obj.updated_at = datetime.now()
+            changed = changed | set(['updated_at'])
+
+        await cls._get_async_backend().upsert(cls, obj, changed)
+        obj._mark_clean()
+
+    @staticmethod
+    def _copy_fields(source, target, props):
+        for prop in props:
+            inner = '_{}'.format(prop)
+            try:
+                value = getattr(source, inner)
+            except AttributeError:
+                if hasattr(target, inner):
+                    delattr(target, inner)
+                continue
+
+            setattr(target, inner, deepcopy(value))
+
+        target._mark_clean()
+
+    @classmethod
+    def _build(cls, entry):
+        if isinstance(entry, dict):
+            return cls(**entry)
+        elif isinstance(entry, list):
+            return cls(*entry)
+
+        raise Exception('Invalid data type. Required list or dict')
 
     @classmethod
-    def seed(cls, data):
+    def bulk_create(cls, rows, return_objects=False, trusted=False):
+        '''
+        creates and stores many objects at once. Every row is built (and validated)
+        before anything is stored, so an invalid row leaves the container untouched.
+        Related models with unsaved changes are saved first
+        :param rows: list<list|dict> constructor arguments of each object
+        :param return_objects: bool returns the created objects (see `read_modes`)
+        :param trusted: bool stores the values as they are, skipping the validators and custom
+            setters, for rows that were already validated (e.g. loaded from our own storage)
+        :rtype list|None:
+        '''
+        rows = list(rows)
+        blocks = _local.__dict__.setdefault('blocks', {})
+        blocks[cls] = iter(cls.allocate_sequence(len(rows)))
+        try:
+            if trusted:
+                with skip_validation():
+                    objs = [cls._build(entry) for entry in rows]
+            else:
+                objs = [cls._build(entry) for entry in rows]
+        finally:
+            del blocks[cls]
+
+        # related models shared by many rows are saved once
+        changed = dict((id(related), related) for obj in objs for related in obj._changed_relations())
+        for related in changed.values():
+            related.save()
+
+        for obj in objs:
+            obj._mark_clean()
+            obj._detach_relations()
+
+        with cls._lock().write():
+            cls._get_backend().insert_many(cls, objs)
+            cls._written()
+            cls._notify('inserted', objs)
+            if return_objects:
+                return [cls._read(obj) for obj in objs]
+
+        return None
+
+    @classmethod
+    def seed(cls, data, trusted=False):
         '''
         seeds the container with data in `data`
         :param data: list<list|dict>
+        :param trusted: bool skips the validators and custom setters (see `bulk_create`)
         '''
-        results = []
-        for entry in data:
-            if isinstance(entry, dict):
-                results.append(cls._seed_from_dict(entry))
-            elif isinstance(entry, list):
-                results.append(cls._seed_from_list(entry))
-            else:
-                raise Exception('Invalid data type. Required list or dict')
+        return cls.bulk_create(data, return_objects=True, trusted=trusted)
 
-        return results
+    @classmethod
+    def dumps(cls, objs):
+        '''
+        encodes objects of this model in the binary format of `storage.codec`.
+        Related models are encoded as references
+        :param objs: list(Model)
+        :rtype bytes:
+        '''
+        return bytes(codec_for(cls).encode_many(objs))
+
+    @classmethod
+    def loads(cls, data, resolve=None):
+        '''
+        decodes objects encoded by `dumps`. References are resolved to the stored objects
+        (read with the model read mode), or with `resolve(model, id)` when given
+        :param data: bytes-like
+        :rtype list(Model):
+        '''
+        return codec_for(cls).decode_many(data, resolve)
 
     @classmethod
     def remove_object(cls, obj):
         '''
         removes an object from this model container
         '''
-        ct = cls._get_container()
-        ct.remove(obj)
-        cls._set_container(ct)
\ No newline at end of file
+        with cls._lock().write():
+            removed = cls._get_backend().delete(cls, obj.id)
+            cls._written()
+            if removed is not None:
+                cls._notify('removed', removed)
+        if removed is None:
+            raise ValueError('{} is not stored'.format(obj))
\ No newline at end of file
@@ -1,8 +1,21 @@
+import threading
+import time
 import unittest
+from datetime import datetime, timedelta
 
 from .model import Model
 from .autoproperty import autoproperty
 from .baseproperties import baseproperties
+from .snapshot import ReadOnlyException
+from .validator.validator import Validator, ValidatorException
+from .validator.instance_validator import InstanceValidator
+from .query.query_prop import QueryProp
+from .query.compiler import compile_query
+from .query.gt_prop import GTProp
+from .query.gte_prop import GTEProp
+from .query.lt_prop import LTProp
+from .query.lte_prop import LTEProp
+from .query.aggregate import Count, Sum, Avg, Min, Max
 
 @baseproperties
 @autoproperty(name='')
@@ -28,6 +41,74 @@ class ModelTest3(Model):
     def set_custom(self, value):
         self._custom = value + 1
 
+class ModelTest3Child(ModelTest3):
+    def set_custom(self, value):
+        self._custom = value + 2
+
+class EvenValidator(Validator):
+    def validate(self, value):
+        return value % 2 == 0
+
+@baseproperties
+@autoproperty(number=0, validators=[InstanceValidator(int), EvenValidator()])
+class ModelTestValidated(Model):
+    def __init__(self, number):
+        super().__init__()
+        self.number = number
+
+@baseproperties
+@autoproperty(name='', index=True)
+class ModelTestIndexed(Model):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+@baseproperties
+@autoproperty(price=0.0, index='sorted')
+class ModelTestSorted(Model):
+    def __init__(self, price):
+        super().__init__()
+        self.price = price
+
+@baseproperties
+@autoproperty(name='')
+class ModelTestFrozen(Model):
+    __read_mode__ = 'frozen'
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+@baseproperties(slots=True)
+@autoproperty(custom=0.0)
+class ModelTestSlots(Model):
+    def __init__(self, custom):
+        super().__init__()
+        self.custom = custom
+
+    def set_custom(self, value):
+        self._custom = value + 1
+
+@baseproperties
+@autoproperty(price=0.0, column=True)
+@autoproperty(due=None, column=True)
+class ModelTestColumns(Model):
+    def __init__(self, price, due):
+        super().__init__()
+        self.price = price
+        self.due = due
+
+@baseproperties
+@autoproperty(name='', index=True)
+@autoproperty(price=0.0, index='sorted')
+@autoproperty(stock=0, column=True)
+class ModelTestMixedIndexes(Model):
+    def __init__(self, name, price=0.0, stock=0):
+        super().__init__()
+        self.name = name
+        self.price = price
+        self.stock = stock
+
 class ModelTestCase(unittest.TestCase):
     def setUp(self):
         Model.reset_all_containers()
@@ -54,6 +135,33 @@ class TestModel(ModelTestCase):
         model.custom = 2
         self.assertEqual(model.custom, 3)
 
+        # setters are looked up per class
+        self.assertEqual(ModelTest3Child(0).custom, 2)
+        self.assertEqual(ModelTest3(0).custom, 1)
+
+    def test_validators(self):
+        model = ModelTestValidated(2)
+        for value in (None, 3, 'abc', 2.0):
+            with self.assertRaises(ValidatorException):
+                model.number = value
+
+        model.number = 4
+        self.assertEqual(model.number, 4)
+
+    def test_slots(self):
+        model = ModelTestSlots(0)
+        self.assertFalse(hasattr(model, '__dict__'))
+        self.assertEqual(model.custom, 1)
+        self.assertEqual(model.__properties__, ['updated_at', 'created_at', 'id', 'custom'])
+
+        with self.assertRaises(AttributeError):
+            model.undeclared = 1
+
+        model.save()
+        model.custom = 2
+        model.save()
+        self.assertEqual(ModelTestSlots.find_one({'custom': 3}), model)
+
     def test_property_cannot_set_id(self):
         model = ModelTest('test')
         with self.assertRaises(Exception):
@@ -77,6 +185,35 @@ class TestModel(ModelTestCase):
         self.assertEqual(ret.created_at, model.created_at)
         self.assertEqual(ret.updated_at, model.updated_at)
 
+    def test_changed_fields(self):
+        model = ModelTest('test')
+        self.assertEqual(model.changed_fields(), set(['id', 'created_at', 'updated_at', 'name']))
+
+        model.save()
+        self.assertEqual(model.changed_fields(), set())
+
+        updated_at = model.updated_at
+        model.name = 'test2'
+        self.assertEqual(model.changed_fields(), set(['name']))
+        # updated_at is only stamped on save
+        self.assertEqual(model.updated_at, updated_at)
+
+        model.save()
+        self.assertNotEqual(model.updated_at, updated_at)
+        self.assertEqual(ModelTest.find_one({'name': 'test2'}).updated_at, model.updated_at)
+
+    def test_save_changed_fields_only(self):
+        ModelTestIndexed.create('abc')
+        m1 = ModelTestIndexed.find_one({'name': 'abc'})
+        m2 = ModelTestIndexed.find_one({'name': 'abc'})
+
+        m1.name = 'test'
+        m1.save()
+        # m2 didn't change anything, so saving it doesn't overwrite m1 changes
+        m2.save()
+        self.assertEqual(ModelTestIndexed.count({'name': 'test'}), 1)
+        self.assertEqual(ModelTestIndexed.count({'name': 'abc'}), 0)
+
     def test_container(self):
         self.assertEqual(ModelTest.all(), [])
 
@@ -170,6 +307,102 @@ class TestModel(ModelTestCase):
         self.assertEqual('test1', results[0].name)
         self.assertEqual('test2', results[1].name)
 
+    def test_bulk_create(self):
+        self.assertIsNone(ModelTestIndexed.bulk_create([['abc'], {'name': 'abc 2'}, ['abc']]))
+        self.assertEqual(ModelTestIndexed.count({'name': 'abc'}), 2)
+
+        results = ModelTestIndexed.bulk_create([['abc 3'], ['abc 4']], return_objects=True)
+        self.assertEqual([m.name for m in results], ['abc 3', 'abc 4'])
+        self.assertEqual(results[1].id, results[0].id + 1)
+        self.assertEqual(ModelTestIndexed.find_one({'name': 'abc 4'}), results[1])
+
+    def test_bulk_create_invalid(self):
+        ModelTest.create('abc')
+        with self.assertRaises(Exception):
+            ModelTest.bulk_create([['abc 2'], 'abc 3'])
+
+        self.assertEqual(ModelTest.count(), 1)
+        m2 = ModelTest.create('abc 2')
+        self.assertEqual(ModelTest.find_one({'name': 'abc 2'}), m2)
+
+    def test_bulk_create_trusted(self):
+        with self.assertRaises(ValidatorException):
+            ModelTestValidated.bulk_create([[2], [3]])
+
+        # trusted rows skip the validators
+        ModelTestValidated.bulk_create([[2], [3]], trusted=True)
+        self.assertEqual(ModelTestValidated.count(), 2)
+
+        with self.assertRaises(ValidatorException):
+            ModelTestValidated(3)
+
+    def test_bulk_create_sorted(self):
+        ModelTestSorted.create(15)
+        ModelTestSorted.bulk_create([[30], [10], [20]])
+
+        ret = ModelTestSorted.find({'price': GTProp(12)})
+        self.assertEqual([m.price for m in ret], [15, 30, 20])
+
+    def test_columns(self):
+        now = datetime(2020, 1, 1)
+        m1 = ModelTestColumns.create(10, now)
+        m2 = ModelTestColumns.create(20.5, now + timedelta(microseconds=1))
+        m3 = ModelTestColumns.create(30, now - timedelta(days=1))
+
+        self.assertEqual(ModelTestColumns.find({'price': GTProp(10)}), [m2, m3])
+        self.assertEqual(ModelTestColumns.find({'price': 20.5}), [m2])
+        self.assertEqual(ModelTestColumns.find({'due': LTEProp(now)}), [m1, m3])
+        self.assertEqual(ModelTestColumns.find({'due': GTProp(now), 'price': LTProp(25)}), [m2])
+        self.assertEqual(ModelTestColumns.count({'price': GTEProp(10), 'due': LTProp(now)}), 1)
+
+        m3.price = 5
+        m3.save()
+        m1.remove()
+        self.assertEqual(ModelTestColumns.find({'price': LTProp(25)}), [m2, m3])
+
+    def test_columns_foreign_values(self):
+        m1 = ModelTestColumns.create(10, None)
+        m2 = ModelTestColumns.create(20, datetime(2020, 1, 1))
+
+        # None can't be stored in the column, so the container is scanned
+        self.assertEqual(ModelTestColumns.find({'price': GTProp(5), 'due': None}), [m1])
+        m1.remove()
+        self.assertEqual(ModelTestColumns.find({'due': GTProp(datetime(2019, 1, 1))}), [m2])
+
+    def test_columns_compact(self):
+        ModelTestColumns.bulk_create([[i, datetime(2020, 1, 1)] for i in range(3000)])
+        for m in ModelTestColumns.find({'price': LTProp(2000)}):
+            m.remove()
+
+        ret = ModelTestColumns.find({'price': GTEProp(2990)})
+        self.assertEqual([m.price for m in ret], list(range(2990, 3000)))
+        self.assertEqual(ModelTestColumns.count({'price': LTProp(2500)}), 500)
+
+    def test_aggregate(self):
+        ModelTestColumns.bulk_create([[10, datetime(2020, 1, 1)], [20.5, None], [30, datetime(2021, 1, 1)]])
+
+        ret = ModelTestColumns.aggregate(n=Count(), due=Count('due'), total=Sum('price'),
+                                         avg=Avg('price'), first=Min('due'), last=Max('due'))
+        self.assertEqual(ret, {'n': 3, 'due': 2, 'total': 60.5, 'avg': 60.5 / 3,
+                               'first': datetime(2020, 1, 1), 'last': datetime(2021, 1, 1)})
+
+        ret = ModelTestColumns.aggregate({'price': GTProp(15)}, total=Sum('price'), n=Count())
+        self.assertEqual(ret, {'total': 50.5, 'n': 2})
+
+        ret = ModelTestColumns.aggregate({'price': GTProp(100)}, n=Count(), total=Sum('price'),
+                                         avg=Avg('price'), low=Min('price'))
+        self.assertEqual(ret, {'n': 0, 'total': 0, 'avg': None, 'low': None})
+
+    def test_group_by(self):
+        ModelTest2.bulk_create([[1], [2], [2], [3], [3], [3]])
+
+        self.assertEqual(ModelTest2.group_by('price', n=Count(), total=Sum('price')),
+                         {1: {'n': 1, 'total': 1}, 2: {'n': 2, 'total': 4}, 3: {'n': 3, 'total': 9}})
+        self.assertEqual(ModelTest2.group_by(lambda m: m.price % 2, {'price': GTProp(1)}, n=Count()),
+                         {0: {'n': 2}, 1: {'n': 3}})
+        self.assertEqual(ModelTest2.group_by(['price', lambda m: m.price > 2], n=Count()),
+                         {(1, False): {'n': 1}, (2, False): {'n': 2}, (3, True): {'n': 3}})
+
     def test_remove(self):
         m1 = ModelTest.create('abc')
         ModelTest.create('abc 2')
@@ -188,5 +421,288 @@ class TestModel(ModelTestCase):
         self.assertEqual(ret, 1)
         self.assertIsNone(ModelTest.find_one({'name': 'abc'}))
 
+    def test_container_order(self):
+        m1 = ModelTest.create('abc')
+        m2 = ModelTest.create('abc 2')
+
+        m1.name = 'test'
+        m1.save()
+        self.assertEqual([m.name for m in ModelTest.all()], ['test', 'abc 2'])
+
+        m3 = ModelTest('abc 3')
+        m3.save()
+        self.assertEqual(ModelTest.all(), [m1, m2, m3])
+
+    def test_remove_by_id(self):
+        m1 = ModelTest.create('abc')
+        m1.name = 'changed but not saved'
+        m1.remove()
+        self.assertEqual(ModelTest.count(), 0)
+
+        with self.assertRaises(ValueError):
+            m1.remove()
+
+    def test_read_mode_frozen(self):
+        m1 = ModelTest.create('abc')
+
+        ret = ModelTest.find_one({'name': 'abc'}, read_mode='frozen')
+        self.assertEqual(ret, m1)
+        self.assertEqual(m1, ret)
+        self.assertIsInstance(ret, ModelTest)
+        self.assertEqual(ret.name, 'abc')
+
+        with self.assertRaises(ReadOnlyException):
+            ret.name = 'test'
+        self.assertEqual(ModelTest.find_one({'name': 'abc'}).name, 'abc')
+
+        with self.assertRaises(Exception):
+            ModelTest.all(read_mode='invalid')
+
+    def test_frozen_view_kept_across_saves(self):
+        m1 = ModelTestMixedIndexes.create('abc', 1.0, 3)
+        ModelTestMixedIndexes.create('def', 2.0, 5)
+        view = ModelTestMixedIndexes.find_one({'name': 'abc'}, read_mode='frozen')
+
+        m1.name = 'ghi'
+        m1.save()
+        m1.stock = 4
+        m1.save()
+        # saves replace the stored object, the view still shows it as it was read
+        self.assertEqual((view.name, view.price, view.stock), ('abc', 1.0, 3))
+
+        # every index hands out the new version, changed properties or not
+        for query in ({'name': 'ghi'}, {'price': 1.0}, {'stock': 4}):
+            found = ModelTestMixedIndexes.find_one(query, read_mode='frozen')
+            self.assertEqual((found.name, found.price, found.stock), ('ghi', 1.0, 4))
+        self.assertIsNone(ModelTestMixedIndexes.find_one({'name': 'abc'}))
+        self.assertIsNone(ModelTestMixedIndexes.find_one({'stock': 3}))
+        self.assertEqual([m.name for m in ModelTestMixedIndexes.all()], ['ghi', 'def'])
+
+    def test_read_mode_per_model(self):
+        m1 = ModelTestFrozen.create('abc')
+        with self.assertRaises(ReadOnlyException):
+            m1.name = 'test'
+
+        ret = ModelTestFrozen.all(read_mode='copy')
+        ret[0].name = 'test'
+        ret[0].save()
+        self.assertEqual(ModelTestFrozen.find_one({'name': 'test'}), m1)
+
+    def test_read_mode_cow(self):
+        ModelTest.create('abc')
+
+        ret = ModelTest.find({'name': 'abc'}, read_mode='cow')[0]
+        ret.name = 'test'
+        self.assertEqual(ret.name, 'test')
+        self.assertEqual(ModelTest.count({'name': 'abc'}), 1)
+
+        ret.save()
+        self.assertEqual(ModelTest.count({'name': 'abc'}), 0)
+        self.assertEqual(ModelTest.count({'name': 'test'}), 1)
+
+    def test_queryset(self):
+        m1 = ModelTest.create('abc')
+        m2 = ModelTest.create('abc 2')
+        m3 = ModelTest.create('abc')
+
+        self.assertEqual(list(ModelTest.objects.filter(name='abc')), [m1, m3])
+        self.assertEqual(list(ModelTest.objects.filter({'name': 'abc'}).exclude(id=m1.id)), [m3])
+        self.assertEqual(list(ModelTest.objects.order_by('-name', 'id')), [m2, m1, m3])
+        self.assertEqual(list(ModelTest.objects.all()[1:]), [m2, m3])
+        self.assertEqual(list(ModelTest.objects.all()[1:][:1]), [m2])
+        self.assertEqual(ModelTest.objects.order_by('-id')[0], m3)
+        self.assertEqual(ModelTest.objects.filter(name='abc 2').first(), m2)
+        self.assertIsNone(ModelTest.objects.filter(name='nope').first())
+
+        self.assertEqual(ModelTest.objects.filter(name='abc').count(), 2)
+        self.assertEqual(ModelTest.objects.all()[1:5].count(), 2)
+        self.assertTrue(ModelTest.objects.filter(name='abc 2').exists())
+        self.assertFalse(ModelTest.objects.filter(name='abc 3').exists())
+
+        with self.assertRaises(IndexError):
+            ModelTest.objects.all()[3]
+
+        with self.assertRaises(Exception):
+            ModelTest.objects.all()[:1].filter(name='abc')
+
+    def test_queryset_lazy(self):
+        compared = []
+
+        class CountingProp(QueryProp):
+            def compare(self, other_data):
+                compared.append(other_data)
+                return super().compare(other_data)
+
+        for i in range(10):
+            ModelTest.create('abc')
+
+        qs = ModelTest.objects.filter(name=CountingProp('abc'))
+        self.assertEqual(compared, [])
+
+        self.assertEqual(len(list(qs[:2])), 2)
+        self.assertEqual(len(compared), 2)
+
+        self.assertTrue(qs.exists())
+        self.assertEqual(len(compared), 3)
+
+    def test_query_plan(self):
+        plan = compile_query(ModelTestSorted, {'id': GTProp(1), 'price': LTProp(20), 'name': 'abc'})
+        self.assertEqual(plan.keys, ['price', 'name', 'id'])
+        self.assertEqual(plan.index_keys, ['price'])
+        self.assertIs(plan, compile_query(ModelTestSorted, {'name': 'x', 'price': LTProp(1), 'id': GTProp(5)}))
+
+        plan = compile_query(ModelTestIndexed, {'id': 1, 'name': 'abc'})
+        self.assertEqual(plan.keys, ['name', 'id'])
+        self.assertEqual(plan.index_keys, ['name'])
+        self.assertEqual(plan.exact_keys, set(['name']))
+
+    def test_query_short_circuit(self):
+        compared = []
+
+        class CountingProp(QueryProp):
+            def compare(self, other_data):
+                compared.append(other_data)
+                return super().compare(other_data)
+
+        ModelTest.create('abc')
+        ModelTest.create('abc 2')
+
+        ret = ModelTest.find({'id': CountingProp(0), 'name': 'abc'})
+        self.assertEqual(ret, [])
+        # the plain equality is checked first, so the prop is only compared for 'abc'
+        self.assertEqual(len(compared), 1)
+
+    def test_iter_find(self):
+        m1 = ModelTest.create('abc')
+        m2 = ModelTest.create('abc 2')
+        m3 = ModelTest.create('abc')
+
+        items = ModelTest.iter_find({'name': 'abc'})
+        self.assertEqual(next(items), m1)
+        # the stream is not affected by writes while it is consumed
+        ModelTest.create('abc')
+        self.assertEqual(list(items), [m3])
+
+        self.assertEqual(list(ModelTest.iter_all()), ModelTest.all())
+        self.assertEqual(list(ModelTest.iter_all(batch_size=3))[0], [m1, m2, m3])
+        self.assertEqual([len(b) for b in ModelTest.iter_find({'name': 'abc'}, batch_size=2)], [2, 1])
+
+        with self.assertRaises(Exception):
+            ModelTest.iter_all(batch_size=0)
+
+    def test_index_find(self):
+        m1 = ModelTestIndexed.create('abc')
+        m2 = ModelTestIndexed.create('abc 2')
+        m3 = ModelTestIndexed.create('abc')
+
+        self.assertEqual(ModelTestIndexed.find({'name': 'abc'}), [m1, m3])
+        self.assertEqual(ModelTestIndexed.find_one({'name': 'abc 2'}), m2)
+        self.assertEqual(ModelTestIndexed.count({'name': 'abc'}), 2)
+        self.assertEqual(ModelTestIndexed.count({'name': 'nope'}), 0)
+
+    def test_index_update(self):
+        m1 = ModelTestIndexed.create('abc')
+        m2 = ModelTestIndexed.create('abc 2')
+
+        m2.name = 'abc'
+        m2.save()
+        # container order is kept even though m2 entered the bucket last
+        m1.name = 'abc'
+        m1.save()
+        self.assertEqual(ModelTestIndexed.find({'name': 'abc'}), [m1, m2])
+        self.assertEqual(ModelTestIndexed.count({'name': 'abc 2'}), 0)
+
+        m1.remove()
+        self.assertEqual(ModelTestIndexed.find({'name': 'abc'}), [m2])
+
+    def test_index_clear(self):
+        ModelTestIndexed.create('abc')
+        ModelTestIndexed.clear()
+        self.assertEqual(ModelTestIndexed.count({'name': 'abc'}), 0)
+
+        m1 = ModelTestIndexed.create('abc')
+        self.assertEqual(ModelTestIndexed.find({'name': 'abc'}), [m1])
+
+    def test_sorted_index_range(self):
+        m1 = ModelTestSorted.create(30)
+        m2 = ModelTestSorted.create(10)
+        m3 = ModelTestSorted.create(20)
+        m4 = ModelTestSorted.create(10)
+
+        self.assertEqual(ModelTestSorted.find({'price': GTProp(10)}), [m1, m3])
+        self.assertEqual(ModelTestSorted.find({'price': GTEProp(20)}), [m1, m3])
+        self.assertEqual(ModelTestSorted.find({'price': LTProp(20)}), [m2, m4])
+        self.assertEqual(ModelTestSorted.find({'price': LTEProp(20)}), [m2, m3, m4])
+        self.assertEqual(ModelTestSorted.find({'price': 10}), [m2, m4])
+        self.assertEqual(ModelTestSorted.count({'price': LTProp(5)}), 0)
+
+    def test_sorted_index_update(self):
+        m1 = ModelTestSorted.create(30)
+        m2 = ModelTestSorted.create(10)
+
+        m1.price = 5
+        m1.save()
+        self.assertEqual(ModelTestSorted.find({'price': LTProp(20)}), [m1, m2])
+
+        m2.remove()
+        self.assertEqual(ModelTestSorted.find({'price': LTProp(20)}), [m1])
+        self.assertEqual(ModelTestSorted.count({'price': GTProp(5)}), 0)
+
+    def test_concurrent_writes(self):
+        m = ModelTestIndexed.create('abc')
+        ids = []
+
+        def work():
+            for _ in range(200):
+                ids.append(ModelTestIndexed.create('t').id)
+                ids.extend(obj.id for obj in ModelTestIndexed.bulk_create([['b'], ['b']], True))
+                ModelTestIndexed.count({'name': 't'})
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertNotIn(m.id, ids)
+        self.assertEqual(ModelTestIndexed.count({'name': 't'}), 800)
+        self.assertEqual(ModelTestIndexed.count(), 2401)
+
+    def test_queryset_count_concurrent_writes(self):
+        threads = []
+
+        class WritingProp(QueryProp):
+            def compare(self, other_data):
+                # a write waits for the scan while the first item is compared
+                if not threads:
+                    threads.append(threading.Thread(target=ModelTest.create, args=('c',)))
+                    threads[0].start()
+                    time.sleep(0.05)
+                return True
+
+        for name in 'ab':
+            ModelTest.create(name)
+
+        self.assertEqual(ModelTest.objects.filter(name=WritingProp('c')).count(), 2)
+        threads[0].join()
+        self.assertEqual(ModelTest.count(), 3)
+
+    def test_scan_outside_lock(self):
+        with self.assertRaises(RuntimeError):
+            ModelTest._iter_matches({})
+        with ModelTest._lock().read():
+            self.assertEqual(list(ModelTest._iter_matches({})), [])
+
+    def test_sequence(self):
+        ModelTest.reset_sequence(10)
+        self.assertEqual(ModelTest.create('abc').id, 10)
+        self.assertEqual(ModelTest.allocate_sequence(2), [11, 12])
+
+        ModelTest.advance_sequence(20)
+        self.assertEqual(ModelTest.next_sequence(), 21)
+        ModelTest.advance_sequence(5)
+        self.assertEqual(ModelTest.next_sequence(), 22)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
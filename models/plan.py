@@ -1,11 +1,15 @@
 from models import Model, autoproperty, baseproperties
 from models.validator.instance_validator import InstanceValidator
+from models.result_cache import ResultCache
 
-@baseproperties
-@autoproperty(name='', validators=[InstanceValidator(str)])
-@autoproperty(price=0.0, validators=[InstanceValidator((float, int))])
-@autoproperty(number_websites=0, validators=[InstanceValidator(int)])
+@baseproperties(slots=True)
+@autoproperty(name='', validators=[InstanceValidator(str)], index=True)
+@autoproperty(price=0.0, validators=[InstanceValidator((float, int))], index='sorted', column=True)
+@autoproperty(number_websites=0, validators=[InstanceValidator(int)], column=True)
 class Plan(Model):
+    # the plan catalog is looked up far more often than it changes
+    __cache__ = ResultCache(maxsize=256)
+
     def __init__(self, name, price, number_websites):
         '''
         Creates a new Plan object
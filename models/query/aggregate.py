@@ -0,0 +1,197 @@
+class Aggregate(object):
+    '''
+    Aggregate defines how the values of a property are summarized by `Model.aggregate`
+    and `Model.group_by`. Aggregates run in a single pass over the stored objects:
+    every group keeps a state that is updated with `step` and turned into the result
+    by `result`. States computed over different partitions are combined with `merge`.
+    None values are skipped, like SQL does
+    '''
+    # true for aggregates of numbers only (e.g. sums)
+    numeric = False
+
+    def __init__(self, prop=None):
+        '''
+        :param prop: str aggregated property
+        '''
+        self.prop = prop
+
+    def start(self):
+        return None
+
+    def step(self, state, value):
+        raise NotImplementedError()
+
+    def merge(self, state, other):
+        raise NotImplementedError()
+
+    def result(self, state):
+        return state
+
+    def sql(self, column):
+        '''
+        returns the SQL expressions computing the state of this aggregate over `column`
+        :rtype list(str):
+        '''
+        raise NotImplementedError()
+
+    def from_sql(self, values):
+        '''
+        returns the state of this aggregate from the values of its SQL expressions
+        '''
+        return values[0]
+
+class Count(Aggregate):
+    '''
+    Count counts the objects, or the ones where `prop` is not None
+    '''
+    def start(self):
+        return 0
+
+    def step(self, state, value):
+        return state + 1
+
+    def merge(self, state, other):
+        return state + other
+
+    def sql(self, column):
+        return ['COUNT({})'.format('*' if column is None else column)]
+
+class Sum(Aggregate):
+    '''
+    Sum adds up the values of `prop`. It is 0 when there are none
+    '''
+    numeric = True
+
+    def start(self):
+        return 0
+
+    def step(self, state, value):
+        return state + value
+
+    def merge(self, state, other):
+        return state + other
+
+    def sql(self, column):
+        return ['SUM({})'.format(column)]
+
+    def from_sql(self, values):
+        return 0 if values[0] is None else values[0]
+
+class Avg(Aggregate):
+    '''
+    Avg is the mean of the values of `prop`, None when there are none
+    '''
+    numeric = True
+
+    def start(self):
+        return (0, 0)
+
+    def step(self, state, value):
+        return (state[0] + value, state[1] + 1)
+
+    def merge(self, state, other):
+        return (state[0] + other[0], state[1] + other[1])
+
+    def result(self, state):
+        return state[0] / state[1] if state[1] else None
+
+    def sql(self, column):
+        return ['SUM({})'.format(column), 'COUNT({})'.format(column)]
+
+    def from_sql(self, values):
+        return (0 if values[0] is None else values[0], values[1])
+
+class Min(Aggregate):
+    '''
+    Min is the smallest value of `prop`, None when there are none
+    '''
+    def step(self, state, value):
+        return value if state is None or value < state else state
+
+    def merge(self, state, other):
+        return state if other is None else self.step(state, other)
+
+    def sql(self, column):
+        return ['MIN({})'.format(column)]
+
+class Max(Aggregate):
+    '''
+    Max is the largest value of `prop`, None when there are none
+    '''
+    def step(self, state, value):
+        return value if state is None or value > state else state
+
+    def merge(self, state, other):
+        return state if other is None else self.step(state, other)
+
+    def sql(self, column):
+        return ['MAX({})'.format(column)]
+
+def group_getters(model, keys):
+    '''
+    returns a function per group key reading it from a stored object.
+    Keys are properties (relations are grouped by id) or functions of the object
+    '''
+    relations = getattr(model, '__relations__', {})
+    getters = []
+    for key in keys:
+        if callable(key):
+            getters.append(key)
+        else:
+            attr = '{}_id'.format(key) if key in relations else key
+            getters.append(lambda item, attr=attr: getattr(item, attr, None))
+
+    return getters
+
+def aggregate_attr(model, aggregate):
+    '''
+    returns the attribute read by `aggregate`, or None when it counts objects
+    '''
+    if aggregate.prop is None:
+        return None
+    if aggregate.prop in getattr(model, '__relations__', {}):
+        return '{}_id'.format(aggregate.prop)
+    return aggregate.prop
+
+def accumulate(model, items, keys, aggregates, groups=None):
+    '''
+    aggregates `items` in a single pass
+    :param keys: list of group keys (see `group_getters`)
+    :param aggregates: list of Aggregate
+    :param groups: dict to accumulate into
+    :rtype dict: {tuple of group values: list of states}
+    '''
+    groups = {} if groups is None else groups
+    getters = group_getters(model, keys)
+    attrs = [aggregate_attr(model, aggregate) for aggregate in aggregates]
+    steps = list(zip(aggregates, attrs, range(len(aggregates))))
+    for item in items:
+        key = tuple(getter(item) for getter in getters)
+        states = groups.get(key)
+        if states is None:
+            states = groups[key] = [aggregate.start() for aggregate in aggregates]
+
+        for aggregate, attr, i in steps:
+            if attr is None:
+                states[i] = aggregate.step(states[i], item)
+                continue
+
+            value = getattr(item, attr, None)
+            if value is not None:
+                states[i] = aggregate.step(states[i], value)
+
+    return groups
+
+def merge_groups(aggregates, groups, other):
+    '''
+    merges the states of `other` into `groups`
+    '''
+    for key, states in other.items():
+        current = groups.get(key)
+        if current is None:
+            groups[key] = states
+        else:
+            groups[key] = [aggregate.merge(state, new)
+                           for aggregate, state, new in zip(aggregates, current, states)]
+
+    return groups
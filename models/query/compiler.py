@@ -0,0 +1,146 @@
+from ..index.index import relation_id
+from .query_prop import QueryProp
+
+MAX_CACHED_PLANS = 1024
+
+_plan_cache = {}
+
+# lower ranks are more selective (or cheaper) and are checked first
+RANK_HASH_INDEX = 0
+RANK_SORTED_INDEX = 1
+RANK_RANGE_INDEX = 2
+RANK_COLUMN = 3
+RANK_VALUE = 4
+RANK_MODEL = 5
+RANK_QUERY_PROP = 6
+
+def _value_kind(value):
+    '''
+    returns the kind of a query value. Queries with the same keys and kinds share a plan
+    '''
+    if isinstance(value, QueryProp):
+        return value.__class__
+    if hasattr(value, '__properties__'):
+        return 'model'
+    return 'value'
+
+def query_shape(query):
+    return tuple(sorted((key, _value_kind(value)) for key, value in query.items()))
+
+class QueryPlan(object):
+    '''
+    QueryPlan is the compiled form of a query shape (its keys and the kind of their values).
+    It knows which indexes can be probed and in which order the keys should be compared
+    '''
+    def __init__(self, keys, index_keys, exact_keys, column_keys=None, relation_keys=None,
+                 count_key=None):
+        '''
+        :param keys: list of keys, most selective first
+        :param index_keys: list of indexed keys to probe, in order of preference
+        :param exact_keys: set of keys whose index results need no further comparison
+        :param column_keys: list of keys that can be evaluated over columns
+        :param relation_keys: set of relation keys, compared by id
+        :param count_key: the key of single equality queries, which indexes can count
+        '''
+        self.keys = keys
+        self.index_keys = index_keys
+        self.exact_keys = exact_keys
+        self.column_keys = column_keys or []
+        self.relation_keys = relation_keys or set()
+        self.count_key = count_key
+
+    def predicate(self, query, skip=(), compare=None):
+        '''
+        binds the values of `query` to this plan
+        :param skip: keys already resolved by indexes or columns
+        :param compare: function(v1, v2) used instead of `==`
+        :rtype function(item) -> bool:
+        '''
+        checks = [(key, query[key]) for key in self.keys if key not in skip]
+        if self.relation_keys:
+            # relations are compared by id, without reading the related models
+            checks = [('{}_id'.format(key), relation_id(value)) if key in self.relation_keys
+                      else (key, value) for key, value in checks]
+
+        if compare is not None:
+            def predicate(item):
+                for key, value in checks:
+                    if not compare(getattr(item, key, None), value):
+                        return False
+                return True
+            return predicate
+
+        if not checks:
+            return lambda item: True
+
+        if len(checks) == 1:
+            (key, value), = checks
+            return lambda item: getattr(item, key, None) == value
+
+        if len(checks) == 2:
+            (key1, value1), (key2, value2) = checks
+            return lambda item: getattr(item, key1, None) == value1 and \
+                getattr(item, key2, None) == value2
+
+        def predicate(item):
+            for key, value in checks:
+                if not getattr(item, key, None) == value:
+                    return False
+            return True
+        return predicate
+
+def _rank(indexes, columns, key, kind, value):
+    index = indexes.get(key)
+    if kind == 'value':
+        if index == 'hash':
+            return RANK_HASH_INDEX
+        if index == 'sorted':
+            return RANK_SORTED_INDEX
+        return RANK_COLUMN if key in columns else RANK_VALUE
+    if kind == 'model':
+        return RANK_SORTED_INDEX if index == 'hash' else RANK_MODEL
+    if value.range() is not None:
+        if index == 'sorted':
+            return RANK_RANGE_INDEX
+        if key in columns:
+            return RANK_COLUMN
+    return RANK_QUERY_PROP
+
+def compile_query(model, query):
+    '''
+    returns the (cached) plan for `query` over `model`
+    :param query: dict where keys are properties
+    :rtype QueryPlan:
+    '''
+    shape = query_shape(query)
+    cache_key = (model, shape)
+    plan = _plan_cache.get(cache_key)
+    if plan is not None:
+        return plan
+
+    indexes = getattr(model, '__indexes__', {})
+    columns = getattr(model, '__columns__', [])
+    relations = getattr(model, '__relations__', {})
+    relation_keys = set(key for key in query if key in relations)
+    # relations hold ids, so related models are queried like plain values
+    shape = [(key, 'value' if key in relation_keys and kind == 'model' else kind)
+             for key, kind in shape]
+    ranks = {
+        key: _rank(indexes, columns, key, kind, query[key]) for key, kind in shape
+    }
+    # sorted is stable, so keys with the same rank keep the query order
+    keys = sorted(query, key=ranks.get)
+    index_keys = [key for key in keys if ranks[key] <= RANK_RANGE_INDEX]
+    exact_keys = set(key for key, kind in shape if kind != 'model' and key in index_keys)
+    # columns are also used to evaluate the remaining keys when an index can't answer
+    column_keys = [key for key in keys
+                   if key in columns and ranks[key] not in (RANK_MODEL, RANK_QUERY_PROP)]
+
+    count_key = shape[0][0] if len(shape) == 1 and shape[0][1] == 'value' else None
+
+    plan = QueryPlan(keys, index_keys, exact_keys, column_keys, relation_keys, count_key)
+    if len(_plan_cache) >= MAX_CACHED_PLANS:
+        _plan_cache.clear()
+    _plan_cache[cache_key] = plan
+
+    return plan
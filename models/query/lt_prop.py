@@ -5,4 +5,7 @@ class LTProp(QueryProp):
     GTProp defines the comparator matching values greater the initial value
     '''
     def compare(self, other_data):
-        return self.data > other_data
\ No newline at end of file
+        return self.data > other_data
+
+    def range(self):
+        return None, (self.data, False)
\ No newline at end of file
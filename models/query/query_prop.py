@@ -10,4 +10,12 @@ class QueryProp(object):
         return self.compare(other_data)
 
     def compare(self, other_data):
-        return self.data == other_data
\ No newline at end of file
+        return self.data == other_data
+
+    def range(self):
+        '''
+        returns the (lower, upper) bounds of the matching values, so sorted indexes
+        can answer this query. Each bound is a tuple (value, inclusive) or None when unbounded.
+        None means the matching values can't be described by a range
+        '''
+        return None
\ No newline at end of file
@@ -0,0 +1,240 @@
+from itertools import islice
+
+# items whose relations are resolved together by select_related
+RELATED_BATCH_SIZE = 100
+
+class QuerySet(object):
+    '''
+    Lazy and chainable query over the stored items of a model. E.g.:
+    Website.objects.filter(url='http://localhost').exclude(customer=None).order_by('-created_at')[:20]
+
+    Nothing is evaluated until the QuerySet is iterated. Slices stop scanning as soon
+    as they are satisfied and `count`/`exists` never copy any item
+    '''
+    def __init__(self, model, filters=None, excludes=None, ordering=None,
+                 offset=0, limit=None, read_mode=None, related=None, prefetch=None):
+        self.model = model
+        self.filters = filters or []
+        self.excludes = excludes or []
+        self.ordering = ordering or []
+        self.offset = offset
+        self.limit = limit
+        self._read_mode = read_mode
+        self.related = related or []
+        self.prefetch = prefetch or []
+
+    def _clone(self, **kwargs):
+        params = {
+            'filters': self.filters,
+            'excludes': self.excludes,
+            'ordering': self.ordering,
+            'offset': self.offset,
+            'limit': self.limit,
+            'read_mode': self._read_mode,
+            'related': self.related,
+            'prefetch': self.prefetch,
+        }
+        params.update(kwargs)
+        return QuerySet(self.model, **params)
+
+    def _is_sliced(self):
+        return self.offset > 0 or self.limit is not None
+
+    def _check_not_sliced(self):
+        if self._is_sliced():
+            raise Exception('Cannot change a query once a slice has been taken')
+
+    @staticmethod
+    def _to_query(query, kwargs):
+        query = dict(query or {})
+        query.update(kwargs)
+        return query
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, query=None, **kwargs):
+        '''
+        keeps the items matching all properties
+        :param query: dict where keys are properties. Keyword arguments are merged into it
+        '''
+        self._check_not_sliced()
+        return self._clone(filters=self.filters + [self._to_query(query, kwargs)])
+
+    def exclude(self, query=None, **kwargs):
+        '''
+        drops the items matching all properties
+        :param query: dict where keys are properties. Keyword arguments are merged into it
+        '''
+        self._check_not_sliced()
+        return self._clone(excludes=self.excludes + [self._to_query(query, kwargs)])
+
+    def order_by(self, *props):
+        '''
+        orders the items by the given properties. Prefix a property with `-` for descending order
+        '''
+        self._check_not_sliced()
+        return self._clone(ordering=list(props))
+
+    def read_mode(self, read_mode):
+        '''
+        sets how the items are handed out. See `Model.read_modes`
+        '''
+        return self._clone(read_mode=read_mode)
+
+    def select_related(self, *paths):
+        '''
+        resolves the given relations (`__` follows nested ones, e.g. 'customer__subscription')
+        while the items are iterated, with one lookup per relation every `RELATED_BATCH_SIZE` items
+        '''
+        return self._clone(related=self.related + list(paths))
+
+    def prefetch_related(self, *paths):
+        '''
+        same as `select_related`, but the relations of the whole result are resolved
+        at once, with a single lookup per relation
+        '''
+        return self._clone(prefetch=self.prefetch + list(paths))
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None:
+                raise Exception('QuerySet does not support slice steps')
+
+            start = k.start or 0
+            if start < 0 or (k.stop is not None and k.stop < 0):
+                raise Exception('QuerySet does not support negative indexing')
+
+            limit = None if k.stop is None else max(0, k.stop - start)
+            if self.limit is not None:
+                remaining = max(0, self.limit - start)
+                limit = remaining if limit is None else min(limit, remaining)
+
+            return self._clone(offset=self.offset + start, limit=limit)
+
+        if k < 0:
+            raise Exception('QuerySet does not support negative indexing')
+
+        for item in self[k:k+1]:
+            return item
+
+        raise IndexError('QuerySet index out of range')
+
+    def _split_filters(self):
+        '''
+        returns the query driving the model (and its indexes) and the filters checked afterwards
+        '''
+        # the first filter on each property drives the query,
+        # repeated properties are checked afterwards
+        query = {}
+        extra = []
+        for f in self.filters:
+            rest = {}
+            for key, value in f.items():
+                if key in query:
+                    rest[key] = value
+                else:
+                    query[key] = value
+            if rest:
+                extra.append(rest)
+
+        return query, extra
+
+    def _iter_stored(self, snapshot=False):
+        '''
+        yields the stored items matching the filters and not matching the excludes
+        '''
+        query, extra = self._split_filters()
+        model = self.model
+        extra = [model._predicate(q) for q in extra]
+        excludes = [model._predicate(q) for q in self.excludes]
+        for item in model._iter_matches(query, snapshot=snapshot):
+            if any(not predicate(item) for predicate in extra):
+                continue
+            if any(predicate(item) for predicate in excludes):
+                continue
+            yield item
+
+    def _sorted(self, items):
+        # stable sorts from the last key to the first give a multi-key ordering
+        for prop in reversed(self.ordering):
+            reverse = prop.startswith('-')
+            name = prop[1:] if reverse else prop
+            items.sort(key=lambda item: getattr(item, name, None), reverse=reverse)
+
+        return items
+
+    def _iter_window(self, ordered=True, snapshot=False):
+        items = self._iter_stored(snapshot=snapshot)
+        if ordered and self.ordering:
+            items = iter(self._sorted(list(items)))
+
+        stop = None if self.limit is None else self.offset + self.limit
+        return islice(items, self.offset, stop)
+
+    def __iter__(self):
+        # items are handed to the caller while scanning, so the container may change
+        items = self.model._iter_read(self._iter_window(snapshot=True), self._read_mode)
+        if not self.related and not self.prefetch:
+            return items
+
+        return self._iter_related(items)
+
+    def _iter_related(self, items):
+        paths = self.related + self.prefetch
+        size = None if self.prefetch else RELATED_BATCH_SIZE
+        batch = list(islice(items, size))
+        while batch:
+            self.model.load_related(batch, *paths)
+            for item in batch:
+                yield item
+            batch = list(islice(items, size))
+
+    def count(self):
+        '''
+        returns the number of items in this query, without copying any of them
+        :rtype int:
+        '''
+        # the live container is scanned, so writes must wait until it is done
+        with self.model._lock().read():
+            return sum(1 for _ in self._iter_window(ordered=False))
+
+    def exists(self):
+        '''
+        returns true if this query has at least one item
+        :rtype bool:
+        '''
+        with self.model._lock().read():
+            for _ in self._iter_window(ordered=False):
+                return True
+
+        return False
+
+    def first(self):
+        '''
+        returns the first item of this query or None
+        '''
+        for item in self[:1]:
+            return item
+
+        return None
+
+    def explain(self):
+        '''
+        describes how the model answers the filters of this query (see `Model.explain`)
+        :rtype dict:
+        '''
+        return self.model.explain(self._split_filters()[0])
+
+    def __repr__(self):
+        return '<QuerySet {}>'.format(self.model.__name__)
+
+class QueryManager(object):
+    '''
+    Exposes a new QuerySet for the model it is attached to. E.g.: Website.objects.filter(...)
+    '''
+    def __get__(self, obj, cls):
+        if obj is not None:
+            raise AttributeError('objects is only accessible from the model class')
+
+        return QuerySet(cls)
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import threading
+
+from .index.index import relation_id
+from .query.query_prop import QueryProp
+
+def query_key(model, kind, query):
+    '''
+    returns the cache key of `query`, the same for every query with the same conditions.
+    None means the query can't be cached (e.g. it compares whole models)
+    '''
+    relations = getattr(model, '__relations__', {})
+    conditions = []
+    for key, value in query.items():
+        if key in relations:
+            value = relation_id(value)
+        if isinstance(value, QueryProp):
+            value = (value.__class__, value.data)
+        elif hasattr(value, '__properties__'):
+            return None
+        conditions.append((key, value))
+
+    cache_key = (model, kind, tuple(sorted(conditions, key=lambda condition: condition[0])))
+    try:
+        hash(cache_key)
+    except TypeError:
+        return None
+
+    return cache_key
+
+class ResultCache(object):
+    '''
+    Keeps the results of `find`, `find_one` and `count` of a model, so repeated queries
+    are answered without touching the backend. Opt in by setting it on a read-mostly model,
+    e.g. `__cache__ = ResultCache(maxsize=1024)`. It can be shared by many models.
+
+    Entries are tagged with the backend of their model and its write generation, which every
+    write (create, save, remove, ...) bumps, so they are never served after the model changes
+    or is moved to another backend.
+    The least recently used entries are evicted first. Only the stored objects are kept:
+    reads still hand them out through the read mode of the caller
+    '''
+    def __init__(self, maxsize=1024):
+        '''
+        :param maxsize: int number of results kept
+        '''
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, model, kind, query, generation, compute):
+        '''
+        returns the cached result of `query`, or computes (and keeps) it with `compute()`
+        :param kind: str what is computed (e.g. 'count')
+        :param generation: what the results of `model` are valid for (its backend and write generation)
+        '''
+        key = query_key(model, kind, query)
+        if key is None:
+            return compute()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        result = compute()
+        with self.lock:
+            self.entries[key] = (generation, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return result
+
+    def contains(self, model, kind, query, generation):
+        '''
+        returns true if the result of `query` is cached for `generation`, without using it
+        '''
+        key = query_key(model, kind, query)
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[0] == generation
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
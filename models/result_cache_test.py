@@ -0,0 +1,110 @@
+import unittest
+
+from .model import Model
+from .model_test import ModelTestCase
+from .autoproperty import autoproperty
+from .baseproperties import baseproperties
+from .query.gt_prop import GTProp
+from .result_cache import ResultCache
+from .storage.memory_backend import MemoryBackend
+
+@baseproperties
+@autoproperty(name='', index=True)
+@autoproperty(price=0)
+class ModelTestCached(Model):
+    __cache__ = ResultCache(maxsize=2)
+
+    def __init__(self, name, price=0):
+        super().__init__()
+        self.name = name
+        self.price = price
+
+class TestResultCache(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        ModelTestCached.__cache__.clear()
+        self.scans = 0
+        backend = ModelTestCached._get_backend()
+        scan = backend.scan
+
+        def counted_scan(*args, **kwargs):
+            self.scans += 1
+            return scan(*args, **kwargs)
+
+        backend.scan = counted_scan
+        self.addCleanup(delattr, backend, 'scan')
+
+    def test_hit(self):
+        m1 = ModelTestCached.create('abc', 1)
+        self.assertEqual(ModelTestCached.find({'name': 'abc'}), [m1])
+        self.assertEqual(ModelTestCached.find({'name': 'abc'}), [m1])
+        self.assertEqual(ModelTestCached.find_one({'price': GTProp(0)}), m1)
+        self.assertEqual(ModelTestCached.find_one({'price': GTProp(0)}), m1)
+        self.assertEqual(self.scans, 2)
+
+    def test_copies_are_not_shared(self):
+        ModelTestCached.create('abc', 1)
+        m1 = ModelTestCached.find_one({'name': 'abc'})
+        m1.price = 2
+        self.assertEqual(ModelTestCached.find_one({'name': 'abc'}).price, 1)
+
+    def test_invalidated_by_writes(self):
+        m1 = ModelTestCached.create('abc', 1)
+        self.assertEqual(ModelTestCached.count({'price': 1}), 1)
+
+        m2 = ModelTestCached.create('def', 1)
+        self.assertEqual(ModelTestCached.count({'price': 1}), 2)
+
+        m2.price = 2
+        m2.save()
+        self.assertEqual(ModelTestCached.count({'price': 1}), 1)
+
+        m1.remove()
+        self.assertEqual(ModelTestCached.count({'price': 1}), 0)
+
+        ModelTestCached.bulk_create([['ghi', 1]])
+        self.assertEqual(ModelTestCached.count({'price': 1}), 1)
+
+        ModelTestCached.clear()
+        self.assertEqual(ModelTestCached.count({'price': 1}), 0)
+
+    def test_invalidated_by_backend_change(self):
+        default = ModelTestCached._get_backend()
+        m1 = ModelTestCached.create('abc', 1)
+        self.assertEqual(ModelTestCached.find_one({'name': 'abc'}), m1)
+        self.assertEqual(ModelTestCached.count(), 1)
+
+        ModelTestCached.__backend__ = MemoryBackend()
+        self.assertIsNone(ModelTestCached.find_one({'name': 'abc'}))
+        self.assertEqual(ModelTestCached.count(), 0)
+
+        del ModelTestCached.__backend__
+        self.assertEqual(ModelTestCached.count(), 1)
+        Model.use_backend(MemoryBackend())
+        self.addCleanup(Model.use_backend, default)
+        self.assertIsNone(ModelTestCached.find_one({'name': 'abc'}))
+        self.assertEqual(ModelTestCached.count(), 0)
+
+    def test_lru(self):
+        ModelTestCached.create('abc', 1)
+        ModelTestCached.find({'price': 1})
+        ModelTestCached.find({'price': 2})
+        ModelTestCached.find({'price': 1})
+        ModelTestCached.find({'price': 3})
+        self.assertEqual(self.scans, 3)
+
+        # price 2 was the least recently used
+        ModelTestCached.find({'price': 1})
+        self.assertEqual(self.scans, 3)
+        ModelTestCached.find({'price': 2})
+        self.assertEqual(self.scans, 4)
+
+    def test_uncacheable_query(self):
+        m1 = ModelTestCached.create('abc', [1])
+        self.assertEqual(ModelTestCached.find({'price': [1]}), [m1])
+        self.assertEqual(ModelTestCached.find({'price': [1]}), [m1])
+        self.assertEqual(self.scans, 2)
+        self.assertEqual(len(ModelTestCached.__cache__.entries), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+import threading
+
+class ReadWriteLock(object):
+    '''
+    Lets many readers in at once while writers get exclusive access.
+    Waiting writers block new readers, so a steady flow of reads can't starve them.
+    Both sides are reentrant, and the thread holding the write lock can also read
+    (but a reader can't upgrade to a writer)
+    '''
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, 'reads', 0)
+        if depth == 0:
+            # the writer already excludes everyone else
+            local.counted = self._writer != threading.get_ident()
+            if local.counted:
+                with self._cond:
+                    while self._writer is not None or self._waiting_writers:
+                        self._cond.wait()
+                    self._readers += 1
+
+        local.reads = depth + 1
+
+    def release_read(self):
+        local = self._local
+        local.reads -= 1
+        if local.reads == 0 and local.counted:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writes += 1
+            return
+
+        if getattr(self._local, 'reads', 0):
+            raise RuntimeError('A read lock can not be upgraded to a write lock')
+
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self):
+        self._writes -= 1
+        if self._writes == 0:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+    def held(self):
+        '''
+        returns true if the current thread holds the read or the write lock
+        '''
+        return getattr(self._local, 'reads', 0) > 0 or self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from .rwlock import ReadWriteLock
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_shared_reads(self):
+        lock = ReadWriteLock()
+        inside = threading.Barrier(2, timeout=2)
+
+        def read():
+            with lock.read():
+                # both readers must be inside at the same time to pass the barrier
+                inside.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(inside.broken)
+
+    def test_exclusive_write(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def write(name):
+            with lock.write():
+                events.append(name + ' in')
+                time.sleep(0.01)
+                events.append(name + ' out')
+
+        threads = [threading.Thread(target=write, args=(str(i),)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(0, len(events), 2):
+            self.assertEqual(events[i][0], events[i + 1][0])
+
+    def test_writer_waits_for_readers(self):
+        lock = ReadWriteLock()
+        events = []
+        lock.acquire_read()
+
+        def write():
+            with lock.write():
+                events.append('write')
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.01)
+        events.append('read')
+        lock.release_read()
+        thread.join()
+
+        self.assertEqual(events, ['read', 'write'])
+
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+
+        with lock.read():
+            with lock.read():
+                with self.assertRaises(RuntimeError):
+                    lock.acquire_write()
+
+        with lock.write():
+            pass
+
+    def test_held(self):
+        lock = ReadWriteLock()
+        self.assertFalse(lock.held())
+        with lock.read():
+            self.assertTrue(lock.held())
+            thread = threading.Thread(target=lambda: held.append(lock.held()))
+            held = []
+            thread.start()
+            thread.join()
+            self.assertEqual(held, [False])
+        with lock.write():
+            self.assertTrue(lock.held())
+        self.assertFalse(lock.held())
+
+if __name__ == '__main__':
+    unittest.main()
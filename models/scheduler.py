@@ -0,0 +1,175 @@
+from datetime import datetime
+from heapq import heapify, heappop, heappush
+from itertools import count
+import threading
+
+# the heap is rebuilt once it holds this many (and more than twice the live) stale entries
+COMPACT_THRESHOLD = 1024
+
+class ExpiryScheduler(object):
+    '''
+    Tells which objects of a model reached the deadline kept in one of their properties,
+    e.g. the subscriptions past their renewal date, without scanning the model.
+
+    Deadlines are kept in a min-heap updated on every write of the model: declared in the
+    body of a model, the scheduler observes its writes (see `Model.__observers__`).
+    Changed or removed deadlines are left in the heap and skipped when they come up,
+    so taking the due objects costs in proportion to how many are due. Each object is handed out once per deadline:
+    saving it with a new deadline schedules it again. E.g.:
+        class Subscription(Model):
+            expiry = ExpiryScheduler('renewal_date')
+        ...
+        for batch in Subscription.expiry.due(batch_size=100):
+            renew(batch)
+
+    The deadlines of objects stored before the process started are read from the model
+    on first use
+    '''
+    def __init__(self, prop, batch_size=100):
+        '''
+        :param prop: str property holding the deadline of each object
+        :param batch_size: int objects read at a time
+        '''
+        self.prop = prop
+        self.batch_size = batch_size
+        self.callbacks = []
+        self.heap = []
+        self.deadlines = None
+        self.model = None
+        self.order = count()
+        self.lock = threading.RLock()
+
+    def __set_name__(self, owner, name):
+        self.model = owner
+        observers = tuple(getattr(owner, '__observers__', ()))
+        if self not in observers:
+            owner.__observers__ = observers + (self,)
+
+    def _schedule(self, id, deadline):
+        if self.deadlines.get(id) == deadline:
+            return
+
+        if deadline is None:
+            self.deadlines.pop(id, None)
+        else:
+            self.deadlines[id] = deadline
+            heappush(self.heap, (deadline, next(self.order), id))
+        self._compact_if_due()
+
+    def _compact_if_due(self):
+        stale = len(self.heap) - len(self.deadlines)
+        if stale >= COMPACT_THRESHOLD and stale > 2 * len(self.deadlines):
+            self.heap = [(deadline, next(self.order), id) for id, deadline in self.deadlines.items()]
+            heapify(self.heap)
+
+    def _load(self):
+        '''
+        reads the deadlines of the stored objects, the first time the scheduler is used
+        '''
+        if self.deadlines is not None:
+            return
+
+        self.deadlines = {}
+        self.heap = []
+        for item in self.model._iter_matches({}):
+            self._schedule(item.id, getattr(item, self.prop, None))
+
+    # observer api, called by the model after each write
+
+    def inserted(self, model, objs):
+        with self.lock:
+            if self.deadlines is not None:
+                for obj in objs:
+                    self._schedule(obj.id, getattr(obj, self.prop, None))
+
+    def updated(self, model, obj, changed):
+        if self.prop not in changed:
+            return
+
+        with self.lock:
+            if self.deadlines is not None:
+                self._schedule(obj.id, getattr(obj, self.prop, None))
+
+    def removed(self, model, obj):
+        with self.lock:
+            if self.deadlines is not None:
+                self.deadlines.pop(obj.id, None)
+                self._compact_if_due()
+
+    def cleared(self, model):
+        with self.lock:
+            # read again from the model on next use
+            self.deadlines = None
+            self.heap = []
+
+    def on_due(self, callback):
+        '''
+        registers `callback(batch)`, called by `run` with the lists of due objects
+        '''
+        self.callbacks.append(callback)
+        return callback
+
+    def next_deadline(self):
+        '''
+        returns the earliest pending deadline, None if there is none
+        '''
+        # the model lock is always taken first, as writes do
+        with self.model._lock().read(), self.lock:
+            self._load()
+            heap = self.heap
+            while heap and self.deadlines.get(heap[0][2]) != heap[0][0]:
+                heappop(heap)
+            return heap[0][0] if heap else None
+
+    def pop_due(self, now=None):
+        '''
+        returns the ids of the objects whose deadline is not after `now`, earliest first,
+        and stops tracking them
+        :param now: datetime. Defaults to the current time
+        :rtype list(int):
+        '''
+        if now is None:
+            now = datetime.now()
+
+        with self.model._lock().read(), self.lock:
+            self._load()
+            heap = self.heap
+            deadlines = self.deadlines
+            ids = []
+            while heap and heap[0][0] <= now:
+                deadline, _, id = heappop(heap)
+                if deadlines.get(id) == deadline:
+                    del deadlines[id]
+                    ids.append(id)
+
+            return ids
+
+    def due(self, now=None, batch_size=None, read_mode=None):
+        '''
+        yields lists of the objects whose deadline is not after `now`, earliest first.
+        Objects removed meanwhile are left out
+        :param batch_size: int objects per list. Defaults to the scheduler batch size
+        :param read_mode: str see `Model.read_modes`
+        '''
+        ids = self.pop_due(now)
+        batch_size = batch_size or self.batch_size
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            found = self.model.get_many(chunk, read_mode)
+            batch = [found[id] for id in chunk if id in found]
+            if batch:
+                yield batch
+
+    def run(self, now=None):
+        '''
+        hands the due objects to the registered callbacks, a batch at a time.
+        Returns how many objects were due
+        :rtype int:
+        '''
+        total = 0
+        for batch in self.due(now):
+            total += len(batch)
+            for callback in self.callbacks:
+                callback(batch)
+
+        return total
@@ -0,0 +1,72 @@
+import threading
+
+_local = threading.local()
+
+class Session(object):
+    '''
+    Keeps an identity map of the related models resolved while it is open, so every
+    relation pointing to the same object gives back the same instance, read only once. E.g.:
+        with Session():
+            websites = Website.find({'url': url})
+            # all the websites of a customer share the same Customer instance
+            websites[0].customer is websites[1].customer
+
+    Sessions are per thread and can be nested. Outside a session each object resolves
+    its relations on its own. Objects are not refreshed while the session is open,
+    so keep sessions short (e.g. one per request)
+    '''
+    def __init__(self, read_mode=None):
+        '''
+        :param read_mode: str how related models are read (see `Model.read_modes`).
+            Defaults to the read mode of each model
+        '''
+        self.read_mode = read_mode
+        self.identity_map = {}
+
+    @staticmethod
+    def current():
+        '''
+        returns the innermost open session of this thread, None otherwise
+        :rtype Session|None:
+        '''
+        stack = getattr(_local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def __enter__(self):
+        _local.__dict__.setdefault('stack', []).append(self)
+        return self
+
+    def __exit__(self, *args):
+        _local.stack.pop()
+
+    def get_many(self, model, ids):
+        '''
+        returns {id: object} for the objects of `model` with `ids`, reading the ones
+        not in the identity map yet in a single lookup
+        :rtype dict:
+        '''
+        identity_map = self.identity_map
+        found = {}
+        missing = []
+        for id in ids:
+            obj = identity_map.get((model, id))
+            if obj is None:
+                missing.append(id)
+            else:
+                found[id] = obj
+
+        if missing:
+            for id, obj in model.get_many(missing, self.read_mode).items():
+                identity_map[(model, id)] = obj
+                found[id] = obj
+
+        return found
+
+    def add(self, obj):
+        '''
+        puts `obj` in the identity map, so relations pointing to it resolve to it
+        '''
+        self.identity_map[(obj.__class__, obj.id)] = obj
+
+    def clear(self):
+        self.identity_map.clear()
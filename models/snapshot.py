@@ -0,0 +1,158 @@
+from copy import deepcopy
+from types import FunctionType, MethodType
+
+class ReadOnlyException(Exception):
+    def __init__(self, obj, attr, *args, **kwargs):
+        super().__init__('Cannot change "{}" of a read-only {}'.format(attr, obj.__class__.__name__),
+                         *args, **kwargs)
+
+def _find_function(klass, name):
+    '''
+    returns the plain function `name` defined in the class hierarchy, None otherwise.
+    classmethods, staticmethods and properties are not plain functions
+    '''
+    for base in klass.__mro__:
+        if name in base.__dict__:
+            attr = base.__dict__[name]
+            return attr if isinstance(attr, FunctionType) else None
+
+    return None
+
+def unwrap(value):
+    '''
+    returns the object behind a view, or the value itself
+    '''
+    if isinstance(value, FrozenView):
+        return value._view_current()
+    return value
+
+class FrozenView(object):
+    '''
+    Read-only view over a stored object. Nothing is copied: attributes are read straight
+    from the stored object and related models are wrapped in views as well.
+    Methods run against the view, so they can read the object but not change it.
+    Relations are resolved without being kept by the stored object
+    '''
+    __slots__ = ('_view_target', '_view_related')
+
+    def __init__(self, target):
+        object.__setattr__(self, '_view_target', target)
+        object.__setattr__(self, '_view_related', None)
+
+    def _view_current(self):
+        return object.__getattribute__(self, '_view_target')
+
+    def _view_wrap(self, name, value):
+        return FrozenView(value)
+
+    @property
+    def __class__(self):
+        return self._view_current().__class__
+
+    def __getattr__(self, name):
+        current = self._view_current()
+        func = _find_function(type(current), name)
+        if func is not None:
+            return MethodType(func, self)
+
+        if name in getattr(type(current), '__relations__', {}):
+            value = self._view_relation(current, name)
+        else:
+            value = getattr(current, name)
+
+        if hasattr(value, '__properties__'):
+            return self._view_wrap(name, value)
+
+        return value
+
+    def _view_relation(self, current, name):
+        related = object.__getattribute__(self, '_view_related')
+        if related is not None:
+            value = related.get(name)
+            if value is not None and value.id == getattr(current, '{}_id'.format(name)):
+                return value
+
+        return current._get_relation(name, cache=False)
+
+    def _cache_relation(self, prop, obj):
+        '''
+        keeps a related model resolved for this view (see `Model.load_related`)
+        '''
+        related = object.__getattribute__(self, '_view_related')
+        if related is None:
+            related = {}
+            object.__setattr__(self, '_view_related', related)
+        related[prop] = obj
+
+    def __setattr__(self, name, value):
+        raise ReadOnlyException(self._view_current(), name)
+
+    def __delattr__(self, name):
+        raise ReadOnlyException(self._view_current(), name)
+
+    def __eq__(self, other):
+        return self._view_current() == unwrap(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._view_current())
+
+    def __copy__(self):
+        return deepcopy(self._view_current())
+
+    def __deepcopy__(self, memo):
+        # copying a view gives back a regular (mutable) object
+        return deepcopy(self._view_current(), memo)
+
+class CopyOnWriteProxy(FrozenView):
+    '''
+    Proxy over a stored object that only copies it on the first write.
+    Writes to related models copy the whole object as well, so they are kept on save
+    '''
+    __slots__ = ('_view_copy', '_view_parent', '_view_attr')
+
+    def __init__(self, target, parent=None, attr=None):
+        super().__init__(target)
+        object.__setattr__(self, '_view_copy', None)
+        object.__setattr__(self, '_view_parent', parent)
+        object.__setattr__(self, '_view_attr', attr)
+
+    def _view_current(self):
+        copy = object.__getattribute__(self, '_view_copy')
+        if copy is None:
+            return object.__getattribute__(self, '_view_target')
+        return copy
+
+    def _view_materialize(self):
+        '''
+        copies the stored object (once) and returns the copy
+        '''
+        copy = object.__getattribute__(self, '_view_copy')
+        if copy is None:
+            parent = object.__getattribute__(self, '_view_parent')
+            if parent is None:
+                copy = deepcopy(object.__getattribute__(self, '_view_target'))
+            else:
+                copy = getattr(parent._view_materialize(), object.__getattribute__(self, '_view_attr'))
+            object.__setattr__(self, '_view_copy', copy)
+
+        return copy
+
+    def _view_wrap(self, name, value):
+        return CopyOnWriteProxy(value, self, name)
+
+    def _view_relation(self, current, name):
+        if object.__getattribute__(self, '_view_copy') is not None:
+            # the copy belongs to this proxy, so it can keep its related models
+            return getattr(current, name)
+
+        return super()._view_relation(current, name)
+
+    def __setattr__(self, name, value):
+        if isinstance(value, FrozenView):
+            value = deepcopy(value)
+        setattr(self._view_materialize(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._view_materialize(), name)
@@ -0,0 +1,6 @@
+from .backend import Backend
+from .memory_backend import MemoryBackend
+from .sqlite_backend import SQLiteBackend
+from .journal import JournaledBackend
+from .async_backend import AsyncBackend, ExecutorBackend
+from .parallel import ParallelScanner
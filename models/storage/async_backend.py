@@ -0,0 +1,161 @@
+import asyncio
+from functools import partial
+from itertools import islice
+
+def _identity(item):
+    return item
+
+class AsyncBackend(object):
+    '''
+    Base asynchronous storage backend, used by the async api of Model (`afind`, `asave`, ...).
+    Same operations as `Backend`, as coroutines. Reads take a `read` function applied to each
+    stored object before it is handed out (the model read mode), so backends sharing their
+    objects with other threads can apply it while those objects can't change.
+    Writes call `model._written()` and notify the model observers (`model._notify`) before
+    other reads can see them, so cached results are never served after a write
+    '''
+    async def get(self, model, id, read=_identity):
+        '''
+        returns read(stored object) of `model` with `id`, None otherwise
+        '''
+        raise NotImplementedError()
+
+    async def insert(self, model, obj, read=_identity):
+        '''
+        stores a new object and returns read(obj)
+        '''
+        raise NotImplementedError()
+
+    async def insert_many(self, model, objs, read=_identity):
+        '''
+        stores many new objects at once and returns them through `read`
+        '''
+        return [await self.insert(model, obj, read) for obj in objs]
+
+    async def upsert(self, model, obj, changed):
+        '''
+        see `Backend.upsert`
+        '''
+        raise NotImplementedError()
+
+    async def delete(self, model, id):
+        '''
+        see `Backend.delete`
+        '''
+        raise NotImplementedError()
+
+    async def scan(self, model, query, read=_identity):
+        '''
+        returns the list of read(object) for the stored objects matching `query`
+        '''
+        raise NotImplementedError()
+
+    async def iter_scan(self, model, query, batch_size, read=_identity):
+        '''
+        yields lists of up to `batch_size` read(object) matching `query`
+        '''
+        items = await self.scan(model, query, read)
+        for i in range(0, len(items), batch_size):
+            yield items[i:i + batch_size]
+
+    async def count(self, model, query):
+        '''
+        returns the number of stored objects matching `query`
+        '''
+        return len(await self.scan(model, query))
+
+class ExecutorBackend(AsyncBackend):
+    '''
+    Runs a synchronous backend in an executor, so scans of large containers (and the copies
+    of the read modes) don't block the event loop. Each operation takes the model lock
+    inside the executor, like the synchronous api does
+    '''
+    def __init__(self, backend, executor=None):
+        '''
+        :param backend: Backend
+        :param executor: concurrent.futures.Executor. Defaults to the event loop executor
+        '''
+        self.backend = backend
+        self.executor = executor
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    def _get(self, model, id, read):
+        with model._lock().read():
+            stored = self.backend.get(model, id)
+            return None if stored is None else read(stored)
+
+    def _insert_many(self, model, objs, read):
+        with model._lock().write():
+            try:
+                self.backend.insert_many(model, objs)
+            finally:
+                model._written()
+            model._notify('inserted', objs)
+            return [read(obj) for obj in objs]
+
+    def _upsert(self, model, obj, changed):
+        with model._lock().write():
+            try:
+                self.backend.upsert(model, obj, changed)
+            finally:
+                model._written()
+            model._notify('updated', obj, changed)
+
+    def _delete(self, model, id):
+        with model._lock().write():
+            try:
+                removed = self.backend.delete(model, id)
+            finally:
+                model._written()
+            if removed is not None:
+                model._notify('removed', removed)
+            return removed
+
+    def _scan(self, model, query, read):
+        with model._lock().read():
+            return [read(item) for item in self.backend.scan(model, query)]
+
+    def _start_scan(self, model, query):
+        with model._lock().read():
+            return iter(self.backend.scan(model, query, snapshot=True))
+
+    def _next_batch(self, model, items, batch_size, read):
+        with model._lock().read():
+            return [read(item) for item in islice(items, batch_size)]
+
+    def _count(self, model, query):
+        with model._lock().read():
+            return self.backend.count(model, query)
+
+    async def get(self, model, id, read=_identity):
+        return await self._run(self._get, model, id, read)
+
+    async def insert(self, model, obj, read=_identity):
+        return (await self.insert_many(model, [obj], read))[0]
+
+    async def insert_many(self, model, objs, read=_identity):
+        return await self._run(self._insert_many, model, list(objs), read)
+
+    async def upsert(self, model, obj, changed):
+        await self._run(self._upsert, model, obj, changed)
+
+    async def delete(self, model, id):
+        return await self._run(self._delete, model, id)
+
+    async def scan(self, model, query, read=_identity):
+        return await self._run(self._scan, model, query, read)
+
+    async def iter_scan(self, model, query, batch_size, read=_identity):
+        # only one batch is read (and copied) at a time
+        items = await self._run(self._start_scan, model, query)
+        while True:
+            batch = await self._run(self._next_batch, model, items, batch_size, read)
+            if not batch:
+                return
+            yield batch
+
+    async def count(self, model, query):
+        return await self._run(self._count, model, query)
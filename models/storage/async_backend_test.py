@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from ..model import Model, _generations
+from ..model_test import ModelTestCase, ModelTestIndexed
+from ..snapshot import ReadOnlyException
+from ..query.gt_prop import GTProp
+from .async_backend import ExecutorBackend
+from .memory_backend import MemoryBackend
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class TestAsyncApi(ModelTestCase):
+    def test_create_find(self):
+        async def scenario():
+            m1 = await ModelTestIndexed.acreate('abc')
+            await ModelTestIndexed.acreate('def')
+
+            self.assertEqual(await ModelTestIndexed.afind({'name': 'abc'}), [m1])
+            self.assertEqual(await ModelTestIndexed.afind_one({'name': 'abc'}), m1)
+            self.assertIsNone(await ModelTestIndexed.afind_one({'name': 'xyz'}))
+            self.assertEqual(await ModelTestIndexed.acount(), 2)
+            self.assertEqual(len(await ModelTestIndexed.afind()), 2)
+
+        run(scenario())
+        self.assertEqual(ModelTestIndexed.count(), 2)
+
+    def test_save(self):
+        async def scenario():
+            m = await ModelTestIndexed.acreate('abc')
+            m.name = 'def'
+            await m.asave()
+            self.assertEqual(m.changed_fields(), frozenset())
+            return m
+
+        m = run(scenario())
+        self.assertEqual(ModelTestIndexed.find_one({'name': 'def'}), m)
+        self.assertIsNone(ModelTestIndexed.find_one({'name': 'abc'}))
+
+    def test_read_modes(self):
+        ModelTestIndexed.create('abc')
+
+        async def scenario():
+            m, = await ModelTestIndexed.afind({'name': 'abc'}, read_mode='frozen')
+            with self.assertRaises(ReadOnlyException):
+                m.name = 'def'
+
+            with self.assertRaises(Exception):
+                await ModelTestIndexed.afind(read_mode='invalid')
+
+        run(scenario())
+
+    def test_iterator(self):
+        ModelTestIndexed.bulk_create([[str(i)] for i in range(250)])
+
+        async def scenario():
+            names = [m.name async for m in ModelTestIndexed.aiter_find()]
+            self.assertEqual(names, [str(i) for i in range(250)])
+
+            batches = [b async for b in ModelTestIndexed.aiter_find({'name': GTProp('9')}, 4)]
+            self.assertEqual([len(b) for b in batches], [4, 4, 2])
+
+        run(scenario())
+
+    def test_generation_bumped_under_lock(self):
+        lock = ModelTestIndexed._lock()
+        release_write = lock.release_write
+        released = []
+
+        def release():
+            # the generation seen by the next reader
+            released.append(_generations.get(ModelTestIndexed, 0))
+            release_write()
+
+        lock.release_write = release
+        self.addCleanup(delattr, lock, 'release_write')
+
+        async def scenario():
+            m = await ModelTestIndexed.acreate('abc')
+            m.name = 'def'
+            await m.asave()
+
+        run(scenario())
+        self.assertEqual(len(released), 2)
+        self.assertEqual(released[-1], _generations[ModelTestIndexed])
+        self.assertEqual(released[0], released[1] - 1)
+
+    def test_custom_executor(self):
+        backend = MemoryBackend()
+        executor = ThreadPoolExecutor(2)
+        ModelTestIndexed.__backend__ = backend
+        ModelTestIndexed.__async_backend__ = ExecutorBackend(backend, executor)
+        try:
+            async def scenario():
+                await ModelTestIndexed.acreate('abc')
+                return await ModelTestIndexed.acount()
+
+            self.assertEqual(run(scenario()), 1)
+            self.assertEqual(len(backend.container(ModelTestIndexed)), 1)
+        finally:
+            ModelTestIndexed.__backend__ = None
+            ModelTestIndexed.__async_backend__ = None
+            executor.shutdown()
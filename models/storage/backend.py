@@ -0,0 +1,97 @@
+
+from ..query.aggregate import accumulate
+
+class Backend(object):
+    '''
+    Base storage backend. Every read and write of the Model api goes through a backend.
+    Backends hand out the stored objects themselves: copying them (or not) is up to the
+    model read modes. Inherit from this class to store models somewhere else
+    '''
+    def get(self, model, id):
+        '''
+        returns the stored object of `model` with `id`, None otherwise
+        '''
+        raise NotImplementedError()
+
+    def get_many(self, model, ids):
+        '''
+        returns {id: stored object} for the objects of `model` with `ids`. Missing ids are left out
+        '''
+        found = {}
+        for id in ids:
+            obj = self.get(model, id)
+            if obj is not None:
+                found[id] = obj
+        return found
+
+    def insert(self, model, obj):
+        '''
+        stores a new object. The backend may keep `obj` itself
+        '''
+        raise NotImplementedError()
+
+    def insert_many(self, model, objs):
+        '''
+        stores many new objects at once
+        '''
+        for obj in objs:
+            self.insert(model, obj)
+
+    def upsert(self, model, obj, changed):
+        '''
+        stores a copy of `obj`. When it is already stored only the `changed` properties are written
+        :param changed: set of changed properties
+        '''
+        raise NotImplementedError()
+
+    def delete(self, model, id):
+        '''
+        removes the object of `model` with `id`
+        :rtype Model|None: the removed object, None if it wasn't stored
+        '''
+        raise NotImplementedError()
+
+    def scan(self, model, query, snapshot=False):
+        '''
+        returns the stored objects matching `query`, in insertion order
+        :param query: dict where keys are properties
+        :param snapshot: bool the result must not be affected by writes made while it is consumed
+        :rtype iterable(Model):
+        '''
+        raise NotImplementedError()
+
+    def count(self, model, query):
+        '''
+        returns the number of stored objects matching `query`
+        '''
+        return sum(1 for _ in self.scan(model, query))
+
+    def explain(self, model, query, operation='find'):
+        '''
+        describes how `query` would be answered, without running it.
+        `access` tells the path taken, e.g. 'index' or 'full_scan'
+        :param operation: str 'find', 'find_one' or 'count'
+        :rtype dict:
+        '''
+        return {'access': 'full_scan'}
+
+    def aggregate(self, model, query, keys, aggregates):
+        '''
+        aggregates the stored objects matching `query` in a single pass, without copying them
+        :param keys: list of group keys (see `aggregate.group_getters`)
+        :param aggregates: list of Aggregate
+        :rtype dict: {tuple of group values: list of aggregate states}
+        '''
+        return accumulate(model, self.scan(model, query), keys, aggregates)
+
+    def clear(self, model):
+        '''
+        removes all the stored objects of `model`
+        '''
+        raise NotImplementedError()
+
+    def reset(self):
+        '''
+        removes all the stored objects of all models
+        '''
+        raise NotImplementedError()
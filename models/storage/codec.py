@@ -0,0 +1,420 @@
+from datetime import datetime, timedelta, timezone
+from itertools import repeat
+from operator import itemgetter
+import pickle
+import struct
+import sys
+import zlib
+
+from ..index.column_index import EPOCH, AWARE_EPOCH, MICROSECOND
+
+MAGIC = b'LORM'
+# magic, schema checksum, number of objects
+BATCH_HEADER = struct.Struct('<4sII')
+
+# every value starts with a tag byte telling how it is encoded
+NONE, FALSE, TRUE, INT, BIGINT, FLOAT, STR, DATETIME, AWARE, REF, BYTES, PICKLE = range(12)
+# naive datetimes are written as their fields, which are rebuilt much faster than from
+# microseconds since the epoch. DATETIME is still read, for data written before
+LOCAL = 12
+
+TAG = struct.Struct('<B')
+TAGGED_INT = struct.Struct('<Bq')
+TAGGED_FLOAT = struct.Struct('<Bd')
+TAGGED_SIZE = struct.Struct('<BI')
+TAGGED_AWARE = struct.Struct('<Bqi')
+# year, month, day, hour, minute, second, microsecond
+TAGGED_LOCAL = struct.Struct('<BHBBBBBI')
+# class key and id of a related model
+TAGGED_REF = struct.Struct('<BIq')
+
+INT_VALUE = struct.Struct('<q')
+FLOAT_VALUE = struct.Struct('<d')
+SIZE_VALUE = struct.Struct('<I')
+AWARE_VALUE = struct.Struct('<qi')
+LOCAL_VALUE = struct.Struct('<HBBBBBI')
+REF_VALUE = struct.Struct('<Iq')
+
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63
+
+# struct format of the payload following each fixed-width tag
+FIXED_FORMATS = {NONE: '', FALSE: '', TRUE: '', INT: 'q', FLOAT: 'd', DATETIME: 'q', AWARE: 'qi',
+                 REF: 'Iq', LOCAL: 'HBBBBBI'}
+# layouts kept per codec, objects of other shapes are decoded value by value
+MAX_LAYOUTS = 32
+
+_codecs = {}
+_models = {}
+
+def model_key(model):
+    '''
+    returns the 32 bits key identifying `model` in encoded data
+    '''
+    return zlib.crc32('{}.{}'.format(model.__module__, model.__qualname__).encode('utf8'))
+
+def _published(cls):
+    '''
+    returns the class bound to the module and qualified name of `cls`. Classes rebuilt by
+    decorators (e.g. `baseproperties(slots=True)`) leave the original class alive under
+    the same name until it is collected
+    '''
+    found = sys.modules.get(cls.__module__)
+    for name in cls.__qualname__.split('.'):
+        found = getattr(found, name, None)
+
+    return found if isinstance(found, type) else cls
+
+def model_for(key):
+    '''
+    returns the model class identified by `key`
+    '''
+    model = _models.get(key)
+    if model is None:
+        from ..model import Model
+        pending = list(Model.__subclasses__())
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            _models[model_key(cls)] = _published(cls)
+        model = _models.get(key)
+        if model is None:
+            raise ValueError('Unknown model key {}'.format(key))
+
+    return model
+
+def codec_for(model):
+    '''
+    returns the (cached) codec of `model`
+    :rtype Codec:
+    '''
+    codec = _codecs.get(model)
+    if codec is None:
+        codec = Codec(model)
+        _codecs[model] = codec
+        _models[codec.key] = model
+
+    return codec
+
+def read_stored(model, id):
+    '''
+    default resolver of related models: reads the stored object with the model read mode
+    '''
+    stored = model._get_backend().get(model, id)
+    return None if stored is None else model._read(stored)
+
+def _decode_aware(micro, seconds):
+    return (AWARE_EPOCH + timedelta(0, 0, micro)).astimezone(timezone(timedelta(seconds=seconds)))
+
+def _decode_bigint(chunk):
+    return int.from_bytes(chunk, 'little', signed=True)
+
+class Layout(object):
+    '''
+    Struct layout of the encoded objects whose values have the same tags, e.g. every object
+    of a model with its properties set to values of the same types. Each run of fixed-width
+    values (tags included), up to the size of the next length-prefixed one, is read with a
+    single precompiled struct and its tags are checked at once. The objects read are then
+    built column by column, so each value is converted without going through the tags again
+    '''
+    def __init__(self, inner, tags):
+        '''
+        :param inner: list of the backing attributes, in schema order
+        :param tags: tuple of the tag of each value
+        '''
+        # tuples (name, tag, position of its payload in the rows read)
+        self.values = []
+        # tuples (struct, tags getter, expected tags, whether a length-prefixed value ends it)
+        self.segments = []
+        fmt, template, positions, start = '<', [], [], 0
+        for name, tag in zip(inner, tags):
+            positions.append(len(template))
+            template.append(tag)
+            self.values.append((name, tag, start + len(template)))
+            fmt += 'B'
+            if tag in FIXED_FORMATS:
+                fmt += FIXED_FORMATS[tag]
+                template.extend([None] * len(FIXED_FORMATS[tag]))
+                continue
+
+            # a length-prefixed value ends the run. Its size is followed by its data in the rows
+            fmt += 'I'
+            template.append(None)
+            self._add_segment(fmt, template, positions, True)
+            start += len(template) + 1
+            fmt, template, positions = '<', [], []
+
+        if positions:
+            self._add_segment(fmt, template, positions, False)
+
+    def _add_segment(self, fmt, template, positions, sized):
+        check = itemgetter(*positions)
+        self.segments.append((struct.Struct(fmt), check, check(template), sized))
+
+    def read(self, view, offset):
+        '''
+        returns the row of values of the object encoded at `offset` and where it ends.
+        None if its tags differ from the layout
+        '''
+        row = ()
+        for layout, check, expected, sized in self.segments:
+            try:
+                unpacked = layout.unpack_from(view, offset)
+            except struct.error:
+                return None
+
+            if check(unpacked) != expected:
+                return None
+
+            offset += layout.size
+            if sized:
+                end = offset + unpacked[-1]
+                if end > len(view):
+                    return None
+                unpacked += (view[offset:end],)
+                offset = end
+            row += unpacked
+
+        return row, offset
+
+    def build(self, model, rows, resolve, missing):
+        '''
+        returns the objects of `model` holding the values of `rows`
+        '''
+        objs = list(map(model.__new__, repeat(model, len(rows))))
+        columns = list(zip(*rows))
+        setter = object.__setattr__
+        for name, tag, i in self.values:
+            if tag == INT or tag == FLOAT:
+                values = columns[i]
+            elif tag == STR:
+                values = map(str, columns[i + 1], repeat('utf8'))
+            elif tag == LOCAL:
+                values = map(datetime, *columns[i:i + 7])
+            elif tag == DATETIME:
+                values = map(EPOCH.__add__, map(timedelta, repeat(0), repeat(0), columns[i]))
+            elif tag == NONE:
+                values = repeat(None)
+            elif tag == REF:
+                values = self._resolve(objs, name, columns[i], columns[i + 1], resolve, missing)
+            elif tag == TRUE or tag == FALSE:
+                values = repeat(tag == TRUE)
+            elif tag == AWARE:
+                values = map(_decode_aware, columns[i], columns[i + 1])
+            elif tag == BIGINT:
+                values = map(_decode_bigint, columns[i + 1])
+            elif tag == BYTES:
+                values = map(bytes, columns[i + 1])
+            else:
+                values = map(pickle.loads, columns[i + 1])
+
+            for obj, value in zip(objs, values):
+                setter(obj, name, value)
+
+        return objs
+
+    @staticmethod
+    def _resolve(objs, name, keys, ids, resolve, missing):
+        values = []
+        for obj, key, id in zip(objs, keys, ids):
+            related = model_for(key)
+            value = resolve(related, id)
+            if value is None and missing is not None:
+                missing.append((obj, name, related, id))
+            values.append(value)
+
+        return values
+
+class Codec(object):
+    '''
+    Binary encoding of the instances of a model, built from its `__properties__`.
+    Numbers and datetimes are fixed-width, strings are length-prefixed and related models
+    are encoded as a reference (class key and id) instead of a copy of their whole graph.
+    Values of any other type fall back to pickle.
+
+    A batch is a header followed by the properties of each object in schema order.
+    Batches are decoded through a memoryview, so they can be read straight from a
+    memory-mapped file. Objects with the same value types share a precompiled `Layout`,
+    so most of them are decoded without looking at each tag.
+
+    Compared with pickling the whole list at once, batches of the models of this project are
+    5-10% smaller and encode about twice as fast, but decode 1.5-2x slower: pickle rebuilds
+    objects in C, here each object still goes through a few Python steps
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.key = model_key(model)
+        self.props = list(model.__properties__)
+        inner = dict((prop, name) for name, prop in model.__inner_properties__.items())
+        self.inner = [inner.get(prop, '_' + prop) for prop in self.props]
+        self.schema = zlib.crc32(' '.join([model.__qualname__] + self.props).encode('utf8'))
+        # layout of each shape (tags of the values) seen while decoding
+        self.layouts = {}
+
+    def _layout(self, tags):
+        layout = self.layouts.get(tags)
+        if layout is None:
+            layout = Layout(self.inner, tags)
+            if len(self.layouts) < MAX_LAYOUTS:
+                self.layouts[tags] = layout
+
+        return layout
+
+    def _encode_value(self, out, value):
+        if value is None:
+            out += b'\x00'
+        elif value is True:
+            out += b'\x02'
+        elif value is False:
+            out += b'\x01'
+        elif isinstance(value, int):
+            if MIN_INT <= value < MAX_INT:
+                out += TAGGED_INT.pack(INT, value)
+            else:
+                data = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+                out += TAGGED_SIZE.pack(BIGINT, len(data))
+                out += data
+        elif isinstance(value, float):
+            out += TAGGED_FLOAT.pack(FLOAT, value)
+        elif isinstance(value, str):
+            data = value.encode('utf8')
+            out += TAGGED_SIZE.pack(STR, len(data))
+            out += data
+        elif isinstance(value, datetime):
+            if value.tzinfo is None:
+                out += TAGGED_LOCAL.pack(LOCAL, value.year, value.month, value.day, value.hour,
+                                         value.minute, value.second, value.microsecond)
+            else:
+                offset = value.utcoffset() // timedelta(seconds=1)
+                out += TAGGED_AWARE.pack(AWARE, (value - AWARE_EPOCH) // MICROSECOND, offset)
+        elif hasattr(value, '__properties__'):
+            out += TAGGED_REF.pack(REF, model_key(value.__class__), value.id)
+        elif isinstance(value, bytes):
+            out += TAGGED_SIZE.pack(BYTES, len(value))
+            out += value
+        else:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            out += TAGGED_SIZE.pack(PICKLE, len(data))
+            out += data
+
+    def encode_many(self, objs, out=None):
+        '''
+        encodes `objs` as a single batch
+        :param out: bytearray to append the batch to
+        :rtype bytearray:
+        '''
+        if out is None:
+            out = bytearray()
+
+        objs = list(objs)
+        out += BATCH_HEADER.pack(MAGIC, self.schema, len(objs))
+        inner, encode_value = self.inner, self._encode_value
+        for obj in objs:
+            for name in inner:
+                encode_value(out, getattr(obj, name, None))
+
+        return out
+
+    def encode(self, obj):
+        return bytes(self.encode_many([obj]))
+
+    def decode_many(self, data, resolve=None, missing=None):
+        '''
+        decodes a batch written by `encode_many`
+        :param data: bytes-like (e.g. a memoryview over a memory-mapped file)
+        :param resolve: function(model, id) returning the related object of a reference.
+            Defaults to reading the stored object
+        :param missing: list collecting (obj, inner name, model, id) for the references
+            `resolve` couldn't find, which are decoded as None
+        :rtype list(Model):
+        '''
+        view = memoryview(data)
+        magic, schema, count = BATCH_HEADER.unpack_from(view, 0)
+        if magic != MAGIC or schema != self.schema:
+            raise ValueError('Data was not encoded with the {} schema'.format(self.model.__name__))
+
+        if resolve is None:
+            resolve = read_stored
+
+        model = self.model
+        offset = BATCH_HEADER.size
+        objs, rows, layout = [], [], None
+        for _ in range(count):
+            found = None if layout is None else layout.read(view, offset)
+            if found is not None:
+                row, offset = found
+                rows.append(row)
+                continue
+
+            # a new shape: decoded value by value, then its layout reads the next objects
+            if rows:
+                objs.extend(layout.build(model, rows, resolve, missing))
+                rows = []
+            obj = model.__new__(model)
+            offset, tags = self._decode_values(view, offset, obj, resolve, missing)
+            objs.append(obj)
+            layout = self._layout(tags)
+
+        if rows:
+            objs.extend(layout.build(model, rows, resolve, missing))
+        return objs
+
+    @staticmethod
+    def _decode_sized(tag, chunk):
+        if tag == STR:
+            return str(chunk, 'utf8')
+        elif tag == BIGINT:
+            return _decode_bigint(chunk)
+        elif tag == BYTES:
+            return bytes(chunk)
+        elif tag == PICKLE:
+            return pickle.loads(chunk)
+
+        raise ValueError('Invalid tag {}'.format(tag))
+
+    def _decode_values(self, view, offset, obj, resolve, missing):
+        '''
+        decodes the object at `offset` into `obj` one value at a time.
+        Returns where it ends and the tags of its values
+        '''
+        setter = object.__setattr__
+        tags = []
+        for name in self.inner:
+            tag = view[offset]
+            tags.append(tag)
+            offset += 1
+            if tag == INT or tag == FLOAT:
+                value = (INT_VALUE if tag == INT else FLOAT_VALUE).unpack_from(view, offset)[0]
+                offset += 8
+            elif tag == NONE:
+                value = None
+            elif tag == LOCAL:
+                value = datetime(*LOCAL_VALUE.unpack_from(view, offset))
+                offset += LOCAL_VALUE.size
+            elif tag == DATETIME:
+                value = EPOCH + timedelta(0, 0, INT_VALUE.unpack_from(view, offset)[0])
+                offset += 8
+            elif tag == REF:
+                key, id = REF_VALUE.unpack_from(view, offset)
+                offset += 12
+                related = model_for(key)
+                value = resolve(related, id)
+                if value is None and missing is not None:
+                    missing.append((obj, name, related, id))
+            elif tag == TRUE or tag == FALSE:
+                value = tag == TRUE
+            elif tag == AWARE:
+                value = _decode_aware(*AWARE_VALUE.unpack_from(view, offset))
+                offset += 12
+            else:
+                size = SIZE_VALUE.unpack_from(view, offset)[0]
+                offset += 4
+                value = self._decode_sized(tag, view[offset:offset + size])
+                offset += size
+
+            setter(obj, name, value)
+
+        return offset, tuple(tags)
+
+    def decode(self, data, resolve=None):
+        return self.decode_many(data, resolve)[0]
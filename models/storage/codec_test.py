@@ -0,0 +1,119 @@
+from datetime import datetime, timezone, timedelta
+import pickle
+
+from ..model import Model
+from ..model_test import ModelTestCase
+from ..autoproperty import autoproperty
+from ..baseproperties import baseproperties
+from ..index.column_index import EPOCH, MICROSECOND
+from .codec import codec_for, BATCH_HEADER, MAGIC, TAGGED_INT, DATETIME
+
+@baseproperties(slots=True)
+@autoproperty(name='')
+class ModelTestCodecParent(Model):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+@baseproperties(slots=True)
+@autoproperty(value=None)
+@autoproperty(parent=None)
+class ModelTestCodec(Model):
+    def __init__(self, value, parent=None):
+        super().__init__()
+        self.value = value
+        self.parent = parent
+
+class TestCodec(ModelTestCase):
+    def test_round_trip(self):
+        values = [None, True, False, 0, -5, 2 ** 63, -2 ** 70, 1.5, '', 'çà', b'\x00',
+                  datetime(2020, 1, 2, 3, 4, 5, 6),
+                  datetime(2020, 1, 2, tzinfo=timezone(timedelta(hours=-3))),
+                  [1, 'a'], {'a': 1}]
+        objs = [ModelTestCodec(value) for value in values]
+
+        decoded = ModelTestCodec.loads(ModelTestCodec.dumps(objs))
+        self.assertEqual([obj.value for obj in decoded], values)
+        self.assertEqual([type(obj.value) for obj in decoded], [type(v) for v in values])
+        self.assertEqual([obj.id for obj in decoded], [obj.id for obj in objs])
+        self.assertEqual(decoded[0].created_at, objs[0].created_at)
+        self.assertEqual(decoded[12].value.utcoffset(), timedelta(hours=-3))
+        self.assertEqual(decoded[0].changed_fields(), frozenset())
+
+    def test_references(self):
+        parent = ModelTestCodecParent.create('abc')
+        data = ModelTestCodec.dumps([ModelTestCodec(1, parent)])
+
+        # the stored parent is read back instead of a copy embedded in the data
+        parent.name = 'def'
+        parent.save()
+        decoded, = ModelTestCodec.loads(data)
+        self.assertEqual(decoded.parent.name, 'def')
+
+        stored = ModelTestCodecParent._get_backend().get(ModelTestCodecParent, parent.id)
+        decoded, = ModelTestCodec.loads(data, lambda model, id: stored)
+        self.assertIs(decoded.parent, stored)
+
+        ModelTestCodecParent.clear()
+        decoded, = ModelTestCodec.loads(data)
+        self.assertIsNone(decoded.parent)
+
+    def test_memoryview(self):
+        objs = [ModelTestCodec(i) for i in range(10)]
+        data = memoryview(bytearray(b'xx') + codec_for(ModelTestCodec).encode_many(objs))
+        decoded = codec_for(ModelTestCodec).decode_many(data[2:])
+        self.assertEqual([obj.value for obj in decoded], list(range(10)))
+
+    def test_schema_mismatch(self):
+        data = ModelTestCodec.dumps([ModelTestCodec(1)])
+        with self.assertRaises(ValueError):
+            ModelTestCodecParent.loads(data)
+
+    def test_layouts(self):
+        # runs of objects with the same value types are read through a precompiled layout,
+        # the first object of each run value by value
+        values = [i if i % 3 else 'v{}'.format(i) for i in range(30)] + \
+            [None, datetime(2021, 5, 6, 7, 8, 9, 10), True, 2.5] * 5
+        objs = [ModelTestCodec(value) for value in values]
+
+        codec = codec_for(ModelTestCodec)
+        data = codec.encode_many(objs)
+        decode_values = codec._decode_values
+        slow = []
+
+        def counted(*args):
+            slow.append(args[1])
+            return decode_values(*args)
+
+        codec._decode_values = counted
+        self.addCleanup(delattr, codec, '_decode_values')
+        decoded = codec.decode_many(data)
+
+        self.assertEqual([obj.value for obj in decoded], values)
+        self.assertEqual([obj.created_at for obj in decoded], [obj.created_at for obj in objs])
+        self.assertEqual([obj.id for obj in decoded], [obj.id for obj in objs])
+        runs = 1 + sum(type(a) != type(b) for a, b in zip(values, values[1:]))
+        self.assertEqual(len(slow), runs)
+
+    def test_datetimes_in_microseconds(self):
+        # naive datetimes were written as microseconds since the epoch, data written then is still read
+        objs = [ModelTestCodec(datetime(2020, 1, 2, 3, 4, 5, 6)) for _ in range(3)]
+        codec = codec_for(ModelTestCodec)
+        data = bytearray(BATCH_HEADER.pack(MAGIC, codec.schema, len(objs)))
+        for obj in objs:
+            for name in codec.inner:
+                value = getattr(obj, name, None)
+                if isinstance(value, datetime):
+                    data += TAGGED_INT.pack(DATETIME, (value - EPOCH) // MICROSECOND)
+                else:
+                    codec._encode_value(data, value)
+
+        decoded = codec.decode_many(data)
+        self.assertEqual([obj.value for obj in decoded], [obj.value for obj in objs])
+        self.assertEqual([obj.updated_at for obj in decoded], [obj.updated_at for obj in objs])
+
+    def test_smaller_than_pickle(self):
+        parent = ModelTestCodecParent.create('abc')
+        objs = [ModelTestCodec(i, parent) for i in range(100)]
+        # compared with the whole list pickled at once, which keeps a single copy of the parent
+        self.assertLess(len(ModelTestCodec.dumps(objs)), len(pickle.dumps(objs, pickle.HIGHEST_PROTOCOL)))
@@ -0,0 +1,341 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .backend import Backend
+from .codec import codec_for, model_key, model_for
+from .memory_backend import MemoryBackend
+
+# every record is framed by its length and checksum, so a torn write at the end is detected
+HEADER = struct.Struct('<II')
+# operation and model key of a record, followed by its payload
+RECORD = struct.Struct('<BI')
+INSERT, UPSERT, DELETE, CLEAR = range(4)
+ID = struct.Struct('<q')
+# generation of the last log covered and number of models
+SNAPSHOT_HEADER = struct.Struct('<qI')
+# model key and size of its batch
+SNAPSHOT_MODEL = struct.Struct('<IQ')
+SNAPSHOT = 'snapshot.bin'
+LOG_PREFIX = 'journal.'
+LOG_SUFFIX = '.log'
+
+def _log_generation(name):
+    if name.startswith(LOG_PREFIX) and name.endswith(LOG_SUFFIX):
+        generation = name[len(LOG_PREFIX):-len(LOG_SUFFIX)]
+        if generation.isdigit():
+            return int(generation)
+    return None
+
+def read_records(data):
+    '''
+    yields the records of a log, stopping at the first torn or corrupted one
+    :param data: bytes-like
+    '''
+    view = memoryview(data)
+    offset = 0
+    while offset + HEADER.size <= len(view):
+        size, checksum = HEADER.unpack_from(view, offset)
+        start = offset + HEADER.size
+        payload = view[start:start + size]
+        if len(payload) < size or zlib.crc32(payload) != checksum:
+            return
+        yield payload
+        offset = start + size
+
+class JournaledBackend(Backend):
+    '''
+    Makes another backend (memory by default) durable. Every write is appended to a log,
+    and the whole state is periodically written to a compacted snapshot.
+    On startup the latest snapshot is loaded (memory-mapped) and only the log written after
+    it is replayed, so restarting depends on the size of the log tail, not of the dataset.
+    Records and snapshots use the binary format of `codec`.
+
+    Writes are group-committed: every record is handed to the OS as it is appended (so it
+    survives the process crashing) and the log is fsynced once `group_size` records are pending,
+    by a background thread once the oldest pending record is `sync_interval` seconds old,
+    and on `sync()`/`close()`. Records appended after the last fsync can be lost if the machine
+    goes down
+    '''
+    def __init__(self, directory, backend=None, group_size=64, sync_interval=0.05,
+                 snapshot_every=10000):
+        '''
+        :param directory: str where the snapshot and the logs are kept
+        :param backend: Backend holding the live state. Defaults to a new MemoryBackend
+        :param group_size: int records written between two fsyncs at most
+        :param sync_interval: float seconds between two fsyncs at most
+        :param snapshot_every: int records appended before the log is compacted into a snapshot.
+            None disables automatic snapshots
+        '''
+        self.directory = directory
+        self.backend = backend or MemoryBackend()
+        self.group_size = group_size
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self.models = set()
+        self.log = None
+        self.pending = 0
+        self.appended = 0
+        self.last_sync = time.monotonic()
+        # set while records wait for the background fsync
+        self.due = threading.Event()
+        self.closing = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+        self.generation = self._recover()
+        self._open_log()
+        self.flusher = threading.Thread(target=self._flush_pending, daemon=True)
+        self.flusher.start()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _log_path(self, generation):
+        return self._path('{}{}{}'.format(LOG_PREFIX, generation, LOG_SUFFIX))
+
+    def _log_generations(self):
+        return sorted(g for g in map(_log_generation, os.listdir(self.directory)) if g is not None)
+
+    def _open_log(self):
+        self.log = open(self._log_path(self.generation), 'ab')
+
+    def _recover(self):
+        '''
+        loads the snapshot, replays the logs written after it and returns the generation
+        of the log new records go to
+        '''
+        covered = -1
+        path = self._path(SNAPSHOT)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                covered = self._load_snapshot(data)
+
+        generation = covered + 1
+        for log_generation in self._log_generations():
+            if log_generation <= covered:
+                os.remove(self._log_path(log_generation))
+                continue
+
+            log_path = self._log_path(log_generation)
+            with open(log_path, 'rb') as f:
+                data = f.read()
+            end = 0
+            for record in read_records(data):
+                self._replay(record)
+                end += HEADER.size + len(record)
+            if end < len(data):
+                # drops the torn tail, so new records aren't appended after it
+                os.truncate(log_path, end)
+            generation = log_generation
+
+        for model in self.models:
+            self._advance_sequence(model)
+
+        return generation
+
+    def _advance_sequence(self, model):
+        '''
+        makes sure the new ids of `model` don't collide with the recovered ones
+        '''
+        model.advance_sequence(max((obj.id for obj in self.backend.scan(model, {})), default=0))
+
+    def _load_snapshot(self, data):
+        '''
+        loads all the objects of a snapshot and returns the generation of the last log it covers.
+        Objects are decoded first and stored once all their references are resolved
+        '''
+        view = memoryview(data)
+        covered, count = SNAPSHOT_HEADER.unpack_from(view, 0)
+        offset = SNAPSHOT_HEADER.size
+        decoded, loaded, missing = {}, [], []
+        resolve = lambda model, id: decoded.get((model, id))
+        for _ in range(count):
+            key, size = SNAPSHOT_MODEL.unpack_from(view, offset)
+            offset += SNAPSHOT_MODEL.size
+            model = model_for(key)
+            objs = codec_for(model).decode_many(view[offset:offset + size], resolve, missing)
+            offset += size
+            decoded.update(((model, obj.id), obj) for obj in objs)
+            loaded.append((model, objs))
+
+        for obj, name, model, id in missing:
+            object.__setattr__(obj, name, decoded.get((model, id)))
+
+        for model, objs in loaded:
+            self.models.add(model)
+            self.backend.insert_many(model, objs)
+
+        view.release()
+        return covered
+
+    def _replay(self, record):
+        op, key = RECORD.unpack_from(record, 0)
+        model = model_for(key)
+        payload = record[RECORD.size:]
+        self.models.add(model)
+        if op == DELETE:
+            self.backend.delete(model, ID.unpack_from(payload, 0)[0])
+        elif op == CLEAR:
+            self.backend.clear(model)
+        else:
+            objs = codec_for(model).decode_many(payload, self._resolve)
+            if op == INSERT:
+                self.backend.insert_many(model, objs)
+            else:
+                self.backend.upsert(model, objs[0], set(model.__properties__))
+
+    def _resolve(self, model, id):
+        return self.backend.get(model, id)
+
+    def _append(self, op, model, payload=b''):
+        '''
+        writes a record to the log, fsyncing the pending group when it is due
+        '''
+        data = RECORD.pack(op, model_key(model)) + payload
+        with self.lock:
+            self.log.write(HEADER.pack(len(data), zlib.crc32(data)))
+            self.log.write(data)
+            self.log.flush()
+            self.pending += 1
+            self.appended += 1
+            if self.pending >= self.group_size or \
+                    time.monotonic() - self.last_sync >= self.sync_interval:
+                self.sync()
+            elif self.pending == 1:
+                self.due.set()
+
+    def _flush_pending(self):
+        '''
+        fsyncs the pending records `sync_interval` seconds after the first of them was appended
+        (runs in a background thread until the backend is closed)
+        '''
+        while True:
+            self.due.wait()
+            if self.closing.wait(self.sync_interval):
+                return
+
+            with self.lock:
+                if self.pending and not self.log.closed:
+                    self.sync()
+                self.due.clear()
+
+    def _compact_if_due(self):
+        '''
+        takes a snapshot once enough records were appended. Called after a write is applied,
+        so the snapshot covers it
+        '''
+        if self.snapshot_every is not None and self.appended >= self.snapshot_every:
+            self.snapshot()
+
+    def sync(self):
+        '''
+        flushes the pending records to disk
+        '''
+        with self.lock:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.pending = 0
+            self.last_sync = time.monotonic()
+
+    def snapshot(self):
+        '''
+        writes the whole state to a new snapshot and drops the logs it covers
+        '''
+        with self.lock:
+            self.sync()
+            self.log.close()
+            covered = self.generation
+            models = list(self.models)
+
+            temp = self._path(SNAPSHOT + '.tmp')
+            with open(temp, 'wb') as f:
+                f.write(SNAPSHOT_HEADER.pack(covered, len(models)))
+                for model in models:
+                    batch = codec_for(model).encode_many(self.backend.scan(model, {}))
+                    f.write(SNAPSHOT_MODEL.pack(model_key(model), len(batch)))
+                    f.write(batch)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self._path(SNAPSHOT))
+
+            for generation in self._log_generations():
+                if generation <= covered:
+                    os.remove(self._log_path(generation))
+
+            self.generation = covered + 1
+            self.appended = 0
+            self._open_log()
+
+    def close(self):
+        self.closing.set()
+        self.due.set()
+        if self.flusher is not threading.current_thread():
+            self.flusher.join()
+        with self.lock:
+            if self.log is not None and not self.log.closed:
+                self.sync()
+                self.log.close()
+
+    def get(self, model, id):
+        return self.backend.get(model, id)
+
+    def get_many(self, model, ids):
+        return self.backend.get_many(model, ids)
+
+    def insert(self, model, obj):
+        self.insert_many(model, [obj])
+
+    def insert_many(self, model, objs):
+        objs = list(objs)
+        with self.lock:
+            self.models.add(model)
+            # logged once applied, so writes the backend rejects are never replayed
+            self.backend.insert_many(model, objs)
+            self._append(INSERT, model, codec_for(model).encode_many(objs))
+            self._compact_if_due()
+
+    def upsert(self, model, obj, changed):
+        with self.lock:
+            self.models.add(model)
+            self.backend.upsert(model, obj, changed)
+            # the whole stored object is logged, so replaying it doesn't depend on older records
+            self._append(UPSERT, model, codec_for(model).encode(self.backend.get(model, obj.id)))
+            self._compact_if_due()
+
+    def delete(self, model, id):
+        with self.lock:
+            stored = self.backend.delete(model, id)
+            if stored is not None:
+                self._append(DELETE, model, ID.pack(id))
+                self._compact_if_due()
+
+        return stored
+
+    def scan(self, model, query, snapshot=False):
+        return self.backend.scan(model, query, snapshot=snapshot)
+
+    def count(self, model, query):
+        return self.backend.count(model, query)
+
+    def explain(self, model, query, operation='find'):
+        return self.backend.explain(model, query, operation)
+
+    def aggregate(self, model, query, keys, aggregates):
+        return self.backend.aggregate(model, query, keys, aggregates)
+
+    def clear(self, model):
+        with self.lock:
+            self._append(CLEAR, model)
+            self.backend.clear(model)
+            self._compact_if_due()
+
+    def reset(self):
+        with self.lock:
+            self.backend.reset()
+            self.models.clear()
+            # an empty snapshot drops all the logs
+            self.snapshot()
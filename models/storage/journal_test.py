@@ -0,0 +1,172 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ..model import Model
+from ..model_test import ModelTestCase
+from ..autoproperty import autoproperty
+from ..baseproperties import baseproperties
+from .journal import JournaledBackend, SNAPSHOT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# writes or counts the customers journaled in a directory
+CUSTOMERS_SCRIPT = '''
+import sys
+from models.customer import Customer
+from models.storage import JournaledBackend
+Customer.__backend__ = JournaledBackend(sys.argv[1])
+if sys.argv[2] == 'write':
+    Customer.create('c', 'x', 'a@b.com', None)
+print(Customer.count(), Customer.__backend__.models == set([Customer]))
+Customer.__backend__.close()
+'''
+
+@baseproperties(slots=True)
+@autoproperty(name='', index=True)
+class ModelTestJournal(Model):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+# journals three records (the last two a while after the first sync) and crashes
+CRASH_SCRIPT = '''
+import os
+import sys
+import time
+from models.storage.journal import JournaledBackend
+from models.storage.journal_test import ModelTestJournal
+ModelTestJournal.__backend__ = JournaledBackend(sys.argv[1], sync_interval=0.05)
+ModelTestJournal.create('c')
+time.sleep(0.2)
+ModelTestJournal.create('d')
+ModelTestJournal.create('e')
+time.sleep(1)
+os._exit(0)
+'''
+
+class TestJournaledBackend(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        ModelTestJournal.reset_sequence()
+        self.open()
+
+    def tearDown(self):
+        ModelTestJournal.__backend__.close()
+        ModelTestJournal.__backend__ = None
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        ModelTestJournal.__backend__ = JournaledBackend(self.directory, **kwargs)
+        return ModelTestJournal.__backend__
+
+    def restart(self, **kwargs):
+        ModelTestJournal.__backend__.close()
+        ModelTestJournal.reset_sequence()
+        return self.open(**kwargs)
+
+    def test_replay_log(self):
+        m1 = ModelTestJournal.create('abc')
+        m2 = ModelTestJournal.create('def')
+        ModelTestJournal.bulk_create([['ghi']])
+        m1.name = 'xyz'
+        m1.save()
+        m2.remove()
+
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['xyz', 'ghi'])
+        self.assertEqual(ModelTestJournal.find_one({'name': 'xyz'}), m1)
+        # ids keep going after the recovered ones
+        self.assertEqual(ModelTestJournal.create('new').id, 4)
+
+    def test_snapshot(self):
+        backend = self.restart(snapshot_every=3)
+        for name in 'abcd':
+            ModelTestJournal.create(name)
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, SNAPSHOT)))
+        # only the record written after the snapshot is left in the log
+        self.assertEqual(backend.appended, 1)
+
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], list('abcd'))
+
+    def test_torn_tail(self):
+        ModelTestJournal.create('abc')
+        ModelTestJournal.create('def')
+        backend = ModelTestJournal.__backend__
+        backend.close()
+        with open(backend.log.name, 'r+b') as f:
+            f.truncate(os.path.getsize(backend.log.name) - 1)
+
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['abc'])
+
+    def test_write_after_torn_tail(self):
+        ModelTestJournal.create('abc')
+        ModelTestJournal.create('def')
+        backend = ModelTestJournal.__backend__
+        backend.close()
+        with open(backend.log.name, 'r+b') as f:
+            f.truncate(os.path.getsize(backend.log.name) - 1)
+
+        self.restart()
+        ModelTestJournal.create('ghi')
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['abc', 'ghi'])
+
+    def test_rejected_insert_not_logged(self):
+        backend = ModelTestJournal.__backend__
+        insert_many = backend.backend.insert_many
+
+        def rejected(model, objs):
+            raise Exception('rejected')
+
+        backend.backend.insert_many = rejected
+        with self.assertRaises(Exception):
+            ModelTestJournal.create('abc')
+        backend.backend.insert_many = insert_many
+        ModelTestJournal.create('def')
+
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['def'])
+
+    def test_clear_and_reset(self):
+        ModelTestJournal.create('abc')
+        ModelTestJournal.clear()
+        ModelTestJournal.create('def')
+        self.restart()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['def'])
+
+        Model.reset_all_containers()
+        self.restart()
+        self.assertEqual(ModelTestJournal.all(), [])
+
+    def test_recover_slotted_model_in_new_process(self):
+        def run(action):
+            return subprocess.check_output([sys.executable, '-c', CUSTOMERS_SCRIPT, self.directory, action],
+                                           cwd=ROOT, universal_newlines=True).strip()
+
+        self.assertEqual(run('write'), '1 True')
+        self.assertEqual(run('read'), '1 True')
+
+    def test_crash(self):
+        ModelTestJournal.__backend__.close()
+        subprocess.check_call([sys.executable, '-c', CRASH_SCRIPT, self.directory], cwd=ROOT)
+
+        self.open()
+        self.assertEqual([m.name for m in ModelTestJournal.all()], ['c', 'd', 'e'])
+
+    def test_background_sync(self):
+        backend = self.restart(sync_interval=0.05)
+        ModelTestJournal.create('abc')
+        ModelTestJournal.create('def')
+        self.assertTrue(backend.pending)
+
+        deadline = time.monotonic() + 5
+        while backend.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(backend.pending, 0)
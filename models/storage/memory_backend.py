@@ -0,0 +1,204 @@
+from copy import copy, deepcopy
+
+from ..index import IndexSet
+from .backend import Backend
+
+class MemoryBackend(Backend):
+    '''
+    Stores the objects of every model in an insertion-ordered dict (id -> object)
+    kept in process memory, along with the indexes and columns declared by the model.
+    Full scans of models with a `__parallel__` scanner (see `parallel`) may run on a process pool
+    '''
+    def __init__(self):
+        self.containers = {}
+        self.index_sets = {}
+        # bumped on every write of a model
+        self.generations = {}
+
+    def _written(self, model, objs=None, inserted=False):
+        '''
+        bumps the generation of `model` and tells its parallel scanner which objects were written
+        :param objs: list of the objects written. None means the whole container changed
+        '''
+        self.generations[model] = self.generations.get(model, 0) + 1
+        scanner = getattr(model, '__parallel__', None)
+        if scanner is not None:
+            scanner.written(self.containers.get(model), objs, inserted)
+
+    def _parallel(self, model):
+        '''
+        returns the parallel scanner of `model` if its container is big enough for it
+        '''
+        scanner = getattr(model, '__parallel__', None)
+        if scanner is not None and scanner.engages(len(self.container(model))):
+            return scanner
+        return None
+
+    def container(self, model):
+        '''
+        returns the storage of `model`
+        '''
+        return self.containers.setdefault(model, {})
+
+    def set_container(self, model, ct):
+        '''
+        replaces the storage of `model`
+        '''
+        self.containers[model] = ct
+        # the indexes are rebuilt from the new container on the next access
+        self.index_sets.pop(model, None)
+        self._written(model)
+
+    def indexes(self, model):
+        '''
+        returns the indexes and columns of `model`, kept in sync with its container
+        '''
+        indexes = self.index_sets.get(model)
+        if indexes is None:
+            indexes = IndexSet(getattr(model, '__indexes__', {}), getattr(model, '__columns__', []),
+                               getattr(model, '__relations__', {}))
+            indexes.add_many(self.container(model).values())
+            self.index_sets[model] = indexes
+
+        return indexes
+
+    def get(self, model, id):
+        return self.container(model).get(id)
+
+    def get_many(self, model, ids):
+        ct = self.container(model)
+        return dict((id, ct[id]) for id in ids if id in ct)
+
+    def insert(self, model, obj):
+        indexes = self.indexes(model)
+        self.container(model)[obj.id] = obj
+        indexes.add(obj)
+        self._written(model, [obj], inserted=True)
+
+    def insert_many(self, model, objs):
+        indexes = self.indexes(model)
+        self.container(model).update((obj.id, obj) for obj in objs)
+        indexes.add_many(objs)
+        self._written(model, objs, inserted=True)
+
+    def upsert(self, model, obj, changed):
+        stored = self.get(model, obj.id)
+        if stored is None:
+            stored = deepcopy(obj)
+            stored._mark_clean()
+            self.insert(model, stored)
+        elif changed:
+            # the stored object is replaced, never changed in place: objects handed out before
+            # (e.g. frozen views) stay as they were and readers never see half a save.
+            # Only the changed properties are copied (and re-indexed)
+            new = copy(stored)
+            model._copy_fields(obj, new, changed)
+            self.indexes(model).replace(stored, new, changed)
+            self.container(model)[obj.id] = new
+            self._written(model, [new])
+
+    def delete(self, model, id):
+        indexes = self.indexes(model)
+        stored = self.container(model).pop(id, None)
+        if stored is not None:
+            indexes.remove(stored)
+            self._written(model, [stored])
+
+        return stored
+
+    def _candidates(self, model, query, plan):
+        '''
+        returns the items to compare with `query`, the keys they already satisfy and
+        the index they come from. Candidates are None when the container must be scanned
+        :rtype tuple(list(Model)|None, set, str|None):
+        '''
+        # the compiled plan of the query tells which indexes can be probed,
+        # so only their candidates are compared
+        indexes = self.indexes(model)
+        for key in plan.index_keys:
+            candidates = indexes.lookup(key, query[key])
+            if candidates is not None:
+                return candidates, plan.exact_keys & set([key]), key
+
+        if plan.column_keys:
+            candidates, resolved = indexes.scan_columns(query, plan.column_keys)
+            return candidates, resolved, None
+
+        return None, set(), None
+
+    def scan(self, model, query, snapshot=False):
+        candidates, resolved, _ = self._candidates(model, query, model._query_plan(query))
+        if candidates is None:
+            scanner = self._parallel(model)
+            if scanner is not None:
+                return iter(scanner.find(model, query, self.container(model)))
+
+            candidates = self.container(model).values()
+            if snapshot:
+                candidates = list(candidates)
+
+        predicate = model._predicate(query, skip=resolved)
+        return (item for item in candidates if predicate(item))
+
+    def explain(self, model, query, operation='find'):
+        size = len(self.container(model))
+        plan = model._query_plan(query)
+        if operation == 'count':
+            if not query:
+                return {'access': 'size', 'rows': size}
+
+            if plan.count_key is not None:
+                found = self.indexes(model).count(plan.count_key, query[plan.count_key])
+                if found is not None:
+                    return {'access': 'index_count', 'index': plan.count_key, 'rows': found}
+
+        candidates, resolved, key = self._candidates(model, query, plan)
+        if key is not None:
+            explained = {'access': 'index', 'index': key,
+                         'index_type': type(self.indexes(model).indexes[key]).__name__}
+        elif candidates is not None:
+            explained = {'access': 'columns', 'columns': sorted(resolved)}
+        else:
+            scanner = self._parallel(model)
+            explained = {'access': 'full_scan' if scanner is None else 'parallel_scan'}
+
+        explained['candidates'] = size if candidates is None else len(candidates)
+        explained['rows'] = size
+        # keys compared item by item
+        explained['filters'] = [key for key in plan.keys if key not in resolved]
+        return explained
+
+    def count(self, model, query):
+        if not query:
+            return len(self.container(model))
+
+        plan = model._query_plan(query)
+        if plan.count_key is not None:
+            # e.g. the websites of a customer, counted by the index of the relation
+            found = self.indexes(model).count(plan.count_key, query[plan.count_key])
+            if found is not None:
+                return found
+
+        scanner = self._parallel(model)
+        if scanner is not None and not plan.index_keys and not plan.column_keys:
+            return scanner.count(model, query, self.container(model))
+
+        return super().count(model, query)
+
+    def aggregate(self, model, query, keys, aggregates):
+        plan = model._query_plan(query)
+        scanner = self._parallel(model)
+        if scanner is not None and not plan.index_keys and not plan.column_keys and \
+                all(isinstance(key, str) for key in keys):
+            return scanner.aggregate(model, query, keys, aggregates, self.container(model))
+
+        return super().aggregate(model, query, keys, aggregates)
+
+    def clear(self, model):
+        self.set_container(model, {})
+
+    def reset(self):
+        self.containers.clear()
+        self.index_sets.clear()
+        for model in list(self.generations):
+            self._written(model)
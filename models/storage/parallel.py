@@ -0,0 +1,216 @@
+import multiprocessing
+import threading
+
+from ..query.aggregate import accumulate, merge_groups
+
+# the stored objects scanned by the workers, inherited when the pool is forked.
+# Kept while the pool lives, so the workers it respawns find them as well
+_snapshot = {}
+
+def _scan_partition(model, query, start, stop, skip, count_only):
+    '''
+    evaluates `query` over a slice of the snapshot of `model` (runs in a worker),
+    leaving out the positions in `skip`. Returns the positions of the matching objects,
+    or how many matched
+    '''
+    items = _snapshot[model]
+    predicate = model._predicate(query)
+    positions = (i for i in range(start, stop) if i not in skip and predicate(items[i]))
+    if count_only:
+        return sum(1 for _ in positions)
+
+    return list(positions)
+
+def _aggregate_partition(model, query, keys, aggregates, start, stop, skip):
+    '''
+    aggregates the objects matching `query` in a slice of the snapshot of `model` (runs in a worker),
+    leaving out the positions in `skip`. Returns the states of each group
+    '''
+    items = _snapshot[model]
+    predicate = model._predicate(query)
+    return accumulate(model, (items[i] for i in range(start, stop) if i not in skip and predicate(items[i])),
+                      keys, aggregates)
+
+class ParallelScanner(object):
+    '''
+    Evaluates full scans of large containers on a pool of processes. Opt in by setting it
+    on a model stored in memory, e.g. `__parallel__ = ParallelScanner(threshold=100000)`.
+
+    The container is split into partitions and each worker runs the query predicate
+    (QueryProps included) over its partitions, sending back only positions, counts
+    or the partial states of aggregates.
+    Workers are forked, so they read the stored objects without copying them, as they were
+    when the pool was forked. The backend tells the scanner which objects each write touches:
+    workers leave those out and they are compared in process instead. Forking costs about as
+    much as a few serial scans, so the pool is only forked again once more than `stale_ratio`
+    of the objects changed (or the container was replaced). Scans below `threshold` rows,
+    or answered by an index, stay in process
+    '''
+    def __init__(self, processes=None, threshold=100000, partitions_per_process=4, stale_ratio=0.01):
+        '''
+        :param processes: int size of the pool. Defaults to the number of cpus
+        :param threshold: int minimum number of stored objects to scan in parallel
+        :param partitions_per_process: int partitions handed to each process
+        :param stale_ratio: float part of the objects changed since the fork that are compared
+            in process before the pool is forked again
+        '''
+        self.processes = processes or multiprocessing.cpu_count()
+        self.threshold = threshold
+        self.partitions_per_process = partitions_per_process
+        self.stale_ratio = stale_ratio
+        self.pool = None
+        self.key = None
+        self.container = None
+        self.items = None
+        self.positions = None
+        # ids written since the fork, in the order they were first written
+        self.changed = {}
+        self.stale = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def engages(self, size):
+        '''
+        returns true if a scan of `size` objects should run in parallel
+        '''
+        return size >= self.threshold and self.available()
+
+    def _snapshot_positions(self):
+        if self.positions is None:
+            self.positions = dict((item.id, i) for i, item in enumerate(self.items))
+        return self.positions
+
+    def written(self, container, objs=None, inserted=False):
+        '''
+        called by the backend after each write of the model
+        :param container: dict the container written
+        :param objs: list of the objects written. None means the whole container changed
+        :param inserted: bool the objects are new
+        '''
+        with self.lock:
+            if self.pool is None or self.stale or container is not self.container:
+                return
+
+            if objs is None:
+                self.stale = True
+                return
+
+            for obj in objs:
+                # an id back after being removed moved to the end of the container
+                if inserted and obj.id in self.changed:
+                    self.stale = True
+                self.changed[obj.id] = True
+
+            if len(self.changed) > len(self.items) * self.stale_ratio:
+                self.stale = True
+
+    def _pool(self, model, container):
+        '''
+        returns the pool for the current state of `model`, forking a new one if the
+        objects changed since the fork are too many to compare in process
+        '''
+        if self.pool is None or self.stale or container is not self.container:
+            self.close()
+            self.items = list(container.values())
+            self.container = container
+            _snapshot[model] = self.items
+            self.pool = multiprocessing.get_context('fork').Pool(self.processes)
+            self.key = model
+
+        return self.pool
+
+    def _changes(self, model, query):
+        '''
+        returns the positions in the snapshot of the changed objects, the current version of
+        those still stored that match `query` (by position), and the new objects matching it
+        :rtype tuple(list(int), list(tuple(int, Model)), list(Model)):
+        '''
+        if not self.changed:
+            return [], [], []
+
+        positions = self._snapshot_positions()
+        predicate = model._predicate(query)
+        skip, updated, inserted = [], [], []
+        for id in self.changed:
+            obj = self.container.get(id)
+            position = positions.get(id)
+            if position is not None:
+                skip.append(position)
+                if obj is not None and predicate(obj):
+                    updated.append((position, obj))
+            elif obj is not None and predicate(obj):
+                inserted.append(obj)
+
+        return skip, updated, inserted
+
+    def _tasks(self, skip, *args):
+        '''
+        returns the arguments of each partition, with the changed positions it must leave out
+        '''
+        size = len(self.items)
+        count = self.processes * self.partitions_per_process
+        step = max(1, -(-size // count))
+        tasks = []
+        for start in range(0, size, step):
+            stop = min(start + step, size)
+            tasks.append(args + (start, stop, frozenset(i for i in skip if start <= i < stop)))
+        return tasks
+
+    def find(self, model, query, container):
+        '''
+        returns the stored objects matching `query`, in insertion order
+        '''
+        with self.lock:
+            pool = self._pool(model, container)
+            skip, updated, inserted = self._changes(model, query)
+            tasks = [task + (False,) for task in self._tasks(skip, model, query)]
+            items = self.items
+            found = [(i, items[i]) for positions in pool.starmap(_scan_partition, tasks)
+                     for i in positions]
+            if updated:
+                found = sorted(found + updated, key=lambda entry: entry[0])
+            return [obj for _, obj in found] + inserted
+
+    def count(self, model, query, container):
+        '''
+        returns the number of stored objects matching `query`
+        '''
+        with self.lock:
+            pool = self._pool(model, container)
+            skip, updated, inserted = self._changes(model, query)
+            tasks = [task + (True,) for task in self._tasks(skip, model, query)]
+            return sum(pool.starmap(_scan_partition, tasks)) + len(updated) + len(inserted)
+
+    def aggregate(self, model, query, keys, aggregates, container):
+        '''
+        returns the aggregate states of each group of the stored objects matching `query`
+        (see `Backend.aggregate`). Group keys must be properties
+        '''
+        with self.lock:
+            pool = self._pool(model, container)
+            skip, updated, inserted = self._changes(model, query)
+            tasks = self._tasks(skip, model, query, keys, aggregates)
+            groups = {}
+            for partial in pool.starmap(_aggregate_partition, tasks):
+                merge_groups(aggregates, groups, partial)
+            if updated or inserted:
+                changed = [obj for _, obj in updated] + inserted
+                merge_groups(aggregates, groups, accumulate(model, changed, keys, aggregates))
+            return groups
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        if self.key is not None:
+            _snapshot.pop(self.key, None)
+        self.pool = None
+        self.key = None
+        self.container = None
+        self.items = None
+        self.positions = None
+        self.changed = {}
+        self.stale = False
@@ -0,0 +1,115 @@
+import multiprocessing
+import unittest
+
+from ..model import Model
+from ..model_test import ModelTestCase
+from ..autoproperty import autoproperty
+from ..baseproperties import baseproperties
+from ..query.gt_prop import GTProp
+from ..query.aggregate import Count, Sum, Max
+from .parallel import ParallelScanner, _scan_partition, _snapshot
+
+@baseproperties(slots=True)
+@autoproperty(name='')
+@autoproperty(value=0)
+class ModelTestParallel(Model):
+    __parallel__ = ParallelScanner(processes=2, threshold=10)
+
+    def __init__(self, name, value):
+        super().__init__()
+        self.name = name
+        self.value = value
+
+@unittest.skipUnless(ParallelScanner.available(), 'needs the fork start method')
+class TestParallelScanner(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        # every test starts without a pool
+        ModelTestParallel.__parallel__.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        ModelTestParallel.__parallel__.close()
+
+    def test_below_threshold(self):
+        ModelTestParallel.bulk_create([['a', i] for i in range(5)])
+        self.assertEqual(len(ModelTestParallel.find({'value': GTProp(1)})), 3)
+        self.assertIsNone(ModelTestParallel.__parallel__.key)
+
+    def test_find_count(self):
+        objs = ModelTestParallel.bulk_create([[str(i % 3), i] for i in range(100)], True)
+
+        ret = ModelTestParallel.find({'name': '1', 'value': GTProp(50)})
+        self.assertEqual(ret, [obj for obj in objs if obj.name == '1' and obj.value > 50])
+        self.assertEqual(ModelTestParallel.count({'value': GTProp(89)}), 10)
+        self.assertIsNotNone(ModelTestParallel.__parallel__.key)
+
+    def test_refork_after_writes(self):
+        objs = ModelTestParallel.bulk_create([['a', i] for i in range(20)], True)
+        self.assertEqual(ModelTestParallel.count({'name': 'b'}), 0)
+        pool = ModelTestParallel.__parallel__.pool
+
+        self.assertEqual(ModelTestParallel.count({'name': 'a'}), 20)
+        self.assertIs(ModelTestParallel.__parallel__.pool, pool)
+
+        objs[3].name = 'b'
+        objs[3].save()
+        self.assertEqual(ModelTestParallel.find({'name': 'b'}), [objs[3]])
+        self.assertIsNot(ModelTestParallel.__parallel__.pool, pool)
+
+    def test_aggregate(self):
+        ModelTestParallel.bulk_create([[str(i % 3), i] for i in range(100)])
+
+        ret = ModelTestParallel.group_by('name', {'value': GTProp(9)}, n=Count(), total=Sum('value'),
+                                         top=Max('value'))
+        expected = {}
+        for i in range(10, 100):
+            group = expected.setdefault(str(i % 3), {'n': 0, 'total': 0, 'top': None})
+            group['n'] += 1
+            group['total'] += i
+            group['top'] = i
+        self.assertEqual(ret, expected)
+        self.assertIsNotNone(ModelTestParallel.__parallel__.key)
+
+    def test_changes_compared_in_process(self):
+        scanner = ModelTestParallel.__parallel__
+        scanner.stale_ratio = 0.5
+        self.addCleanup(setattr, scanner, 'stale_ratio', 0.01)
+        objs = ModelTestParallel.bulk_create([['a', i] for i in range(40)], True)
+        self.assertEqual(ModelTestParallel.count({'name': 'a'}), 40)
+        pool = scanner.pool
+
+        objs[5].name = 'b'
+        objs[5].save()
+        objs[7].remove()
+        objs[30].value = 100
+        objs[30].save()
+        created = ModelTestParallel.create('a', 200)
+
+        expected = [obj for obj in objs if obj.name == 'a' and obj.id != objs[7].id] + [created]
+        self.assertEqual(ModelTestParallel.find({'name': 'a'}), expected)
+        self.assertEqual(ModelTestParallel.find({'value': GTProp(38)}), [objs[30], objs[39], created])
+        self.assertEqual(ModelTestParallel.count({'name': 'b'}), 1)
+        self.assertEqual(ModelTestParallel.aggregate({'name': 'a'}, n=Count(), top=Max('value')),
+                         {'n': 39, 'top': 200})
+        self.assertIs(scanner.pool, pool)
+
+        # past the ratio, the pool is forked again
+        ModelTestParallel.bulk_create([['c', i] for i in range(30)])
+        self.assertEqual(ModelTestParallel.count({'name': 'c'}), 30)
+        self.assertIsNot(scanner.pool, pool)
+        self.assertEqual(scanner.changed, {})
+
+    def test_respawned_worker(self):
+        ModelTestParallel.bulk_create([['a', i] for i in range(20)])
+        self.assertEqual(ModelTestParallel.count({'name': 'a'}), 20)
+        scanner = ModelTestParallel.__parallel__
+        self.assertIs(_snapshot[ModelTestParallel], scanner.items)
+
+        # workers respawned by the pool are forked from the current process, as this one
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            self.assertEqual(pool.apply(_scan_partition, (ModelTestParallel, {'name': 'a'}, 0, 20,
+                                                          frozenset([3]), True)), 19)
+
+        scanner.close()
+        self.assertNotIn(ModelTestParallel, _snapshot)
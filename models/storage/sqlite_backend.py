@@ -0,0 +1,519 @@
+from contextlib import contextmanager
+from datetime import datetime
+import os
+import pickle
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+from ..index.column_index import EPOCH, AWARE_EPOCH, MICROSECOND
+from ..index.index import relation_id
+from ..query.query_prop import QueryProp
+from ..snapshot import unwrap
+from .backend import Backend
+
+MAX_SQL_INT = 2 ** 63
+# ids looked up by a single statement of get_many
+MAX_SQL_PARAMS = 500
+# rows read at a time by scans
+SCAN_BATCH_SIZE = 500
+
+def encode(value):
+    '''
+    returns the SQL value of a property, used to filter rows in SQL.
+    Related models are stored as their id. Values without a SQL form are stored as NULL
+    '''
+    if value is None or isinstance(value, (str, float)):
+        return value
+    if isinstance(value, int):
+        return int(value) if -MAX_SQL_INT <= value < MAX_SQL_INT else None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return (value - EPOCH) // MICROSECOND
+        return (value - AWARE_EPOCH) // MICROSECOND
+    if hasattr(value, '__properties__'):
+        return value.id
+
+    return None
+
+def value_kind(value):
+    '''
+    returns the kind of SQL value `value` is stored as: 'number' and 'str' compare
+    (and aggregate) in SQL like they do in python, anything else can only be read back pickled
+    '''
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'number' if -MAX_SQL_INT <= value < MAX_SQL_INT else 'other'
+    if isinstance(value, float):
+        # NaN is stored as NULL
+        return 'number' if value == value else 'other'
+    if isinstance(value, str):
+        return 'str'
+    return 'other'
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+class SQLiteBackend(Backend):
+    '''
+    Stores every model in a SQLite table. Each row keeps the pickled object plus one
+    column per property, so query dicts (and QueryProp ranges) are pushed down to SQL.
+    The declared indexes and columns of a model get a SQL index.
+    Connections are pooled and statements are prepared once per connection (sqlite3 caches them).
+    Write transactions take the database write lock when they begin (BEGIN IMMEDIATE), so
+    concurrent writers wait for each other (up to `timeout`) instead of failing.
+    Without a file, the database lives in a private temporary file in WAL mode, removed along
+    with the backend: unlike a shared-cache in-memory database, readers never block writers
+
+    Pushed down conditions only narrow the candidates: NULL columns (values without a SQL form)
+    are always fetched and every candidate is compared with the query afterwards,
+    so results are the same as the memory backend. Scans read SCAN_BATCH_SIZE rows at a time,
+    so streaming reads (`iter_find`, `aiter_find`) keep a flat memory usage.
+    Aggregates run in SQL when every column they read only ever held numbers (or only strings)
+    and None, which the backend keeps track of. Otherwise they are computed over the scan
+    '''
+    def __init__(self, database=':memory:', pool_size=4, timeout=30.0):
+        '''
+        :param database: str path of the database file. ':memory:' keeps a private temporary one
+        :param pool_size: int connections kept open
+        :param timeout: float seconds a write waits for the other writers
+        '''
+        temporary = database == ':memory:'
+        if temporary:
+            directory = tempfile.mkdtemp(prefix='licensing_orm_')
+            weakref.finalize(self, shutil.rmtree, directory, True)
+            database = os.path.join(directory, 'data.db')
+
+        self.pool = queue.Queue()
+        for _ in range(pool_size):
+            conn = sqlite3.connect(database, timeout=timeout, isolation_level='IMMEDIATE',
+                                   check_same_thread=False)
+            if temporary:
+                # nothing survives the backend, so commits don't need to reach the disk
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=OFF')
+            self.pool.put(conn)
+
+        self.tables = {}
+        self.attrs = {}
+        # model -> {column: set of value kinds written to it}, None until known
+        self.kinds = {}
+        self.tables_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        '''
+        borrows a connection from the pool for a single transaction
+        '''
+        conn = self.pool.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.put(conn)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+    def table(self, model):
+        '''
+        returns the (table name, property columns) of `model`, creating the table if needed
+        '''
+        table = self.tables.get(model)
+        if table is not None:
+            return table
+
+        with self.tables_lock:
+            table = self.tables.get(model)
+            if table is not None:
+                return table
+
+            name = getattr(model, '__table__', model.__name__)
+            props = [prop for prop in model.__properties__ if prop != 'id']
+            relations = getattr(model, '__relations__', {})
+            # relations are indexed as well, for reverse lookups and counts
+            indexed = set(getattr(model, '__indexes__', {})) | set(getattr(model, '__columns__', [])) | \
+                set(relations)
+            with self.connection() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS {} (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                             'id INTEGER UNIQUE NOT NULL, data BLOB NOT NULL{})'.format(
+                                 quote(name), ''.join(', {}'.format(quote(p)) for p in props)))
+                for prop in props:
+                    if prop in indexed:
+                        conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                            quote('{}_{}'.format(name, prop)), quote(name), quote(prop)))
+                empty = conn.execute('SELECT 1 FROM {} LIMIT 1'.format(quote(name))).fetchone() is None
+
+            table = (name, props)
+            # relation columns hold the related id, read without resolving the relation
+            self.attrs[model] = ['{}_id'.format(p) if p in relations else p for p in props]
+            # the kinds of rows written before are read on the first aggregate
+            self.kinds[model] = dict((prop, set()) for prop in props) if empty else None
+            self.tables[model] = table
+            return table
+
+    def dump(self, obj):
+        return pickle.dumps(unwrap(obj), pickle.HIGHEST_PROTOCOL)
+
+    def load(self, data):
+        obj = pickle.loads(data)
+        obj._mark_clean()
+        return obj
+
+    def _row(self, model, obj):
+        values = [getattr(obj, attr, None) for attr in self.attrs[model]]
+        kinds = self.kinds.get(model)
+        if kinds is not None:
+            self._add_kinds(model, kinds, values)
+        return [obj.id, self.dump(obj)] + [encode(value) for value in values]
+
+    def _add_kinds(self, model, kinds, values):
+        _, props = self.tables[model]
+        for prop, value in zip(props, values):
+            if value is not None:
+                kinds[prop].add(value_kind(value))
+
+    def _kinds(self, model):
+        '''
+        returns {column: set of value kinds} of `model`, reading the stored rows once if unknown
+        '''
+        name, props = self.table(model)
+        kinds = self.kinds.get(model)
+        if kinds is None:
+            kinds = dict((prop, set()) for prop in props)
+            attrs = self.attrs[model]
+            with self.connection() as conn:
+                for data, in conn.execute('SELECT data FROM {}'.format(quote(name))):
+                    obj = pickle.loads(data)
+                    self._add_kinds(model, kinds, [getattr(obj, attr, None) for attr in attrs])
+            self.kinds[model] = kinds
+
+        return kinds
+
+    def _insert_sql(self, name, props):
+        return 'INSERT INTO {} (id, data{}) VALUES (?, ?{})'.format(
+            quote(name), ''.join(', ' + quote(p) for p in props), ', ?' * len(props))
+
+    def get(self, model, id):
+        name, _ = self.table(model)
+        with self.connection() as conn:
+            row = conn.execute('SELECT data FROM {} WHERE id = ?'.format(quote(name)), (id,)).fetchone()
+
+        return None if row is None else self.load(row[0])
+
+    def get_many(self, model, ids):
+        name, _ = self.table(model)
+        ids = list(ids)
+        found = {}
+        with self.connection() as conn:
+            for i in range(0, len(ids), MAX_SQL_PARAMS):
+                chunk = ids[i:i + MAX_SQL_PARAMS]
+                rows = conn.execute('SELECT id, data FROM {} WHERE id IN ({})'.format(
+                    quote(name), ', '.join('?' * len(chunk))), chunk)
+                found.update((id, self.load(data)) for id, data in rows)
+
+        return found
+
+    def insert(self, model, obj):
+        self.insert_many(model, [obj])
+
+    def insert_many(self, model, objs):
+        name, props = self.table(model)
+        with self.connection() as conn:
+            conn.executemany(self._insert_sql(name, props), (self._row(model, obj) for obj in objs))
+
+    def upsert(self, model, obj, changed):
+        name, props = self.table(model)
+        with self.connection() as conn:
+            row = conn.execute('SELECT data FROM {} WHERE id = ?'.format(quote(name)), (obj.id,)).fetchone()
+            if row is None:
+                conn.execute(self._insert_sql(name, props), self._row(model, obj))
+                return
+
+            if not changed:
+                return
+
+            stored = self.load(row[0])
+            model._copy_fields(obj, stored, changed)
+            values = self._row(model, stored)
+            conn.execute('UPDATE {} SET data = ?{} WHERE id = ?'.format(
+                quote(name), ''.join(', {} = ?'.format(quote(p)) for p in props)),
+                values[1:] + [obj.id])
+
+    def delete(self, model, id):
+        stored = self.get(model, id)
+        if stored is None:
+            return None
+
+        name, _ = self.table(model)
+        with self.connection() as conn:
+            conn.execute('DELETE FROM {} WHERE id = ?'.format(quote(name)), (id,))
+
+        return stored
+
+    def _condition(self, column, value):
+        '''
+        returns the SQL condition (and its params) narrowing `column` to `value`,
+        or None if it can't be expressed in SQL
+        '''
+        if value is None:
+            return '{} IS NULL'.format(column), []
+
+        if not isinstance(value, QueryProp):
+            encoded = encode(value)
+            if encoded is None:
+                return None
+            return '({0} = ? OR {0} IS NULL)'.format(column), [encoded]
+
+        bounds = value.range()
+        if bounds is None:
+            return None
+
+        conditions, params = [], []
+        for bound, inclusive_op, exclusive_op in zip(bounds, ('>=', '<='), ('>', '<')):
+            if bound is None:
+                continue
+
+            encoded = encode(bound[0])
+            if encoded is None:
+                return None
+            conditions.append('{} {} ?'.format(column, inclusive_op if bound[1] else exclusive_op))
+            params.append(encoded)
+
+        return '(({}) OR {} IS NULL)'.format(' AND '.join(conditions), column), params
+
+    def _select(self, model, query, columns, extra=()):
+        '''
+        returns the SQL (and its params) selecting `columns` of the rows narrowed by `query`
+        :param extra: further SQL conditions. Their params go after the returned ones
+        '''
+        name, props = self.table(model)
+        conditions, params = [], []
+        for key, value in query.items():
+            if key == 'id' or key in props:
+                condition = self._condition(quote(key), value)
+                if condition is not None:
+                    conditions.append(condition[0])
+                    params.extend(condition[1])
+        conditions.extend(extra)
+
+        sql = 'SELECT {} FROM {}'.format(columns, quote(name))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        return sql, params
+
+    def scan(self, model, query, snapshot=False):
+        name, _ = self.table(model)
+        with self.connection() as conn:
+            last = conn.execute('SELECT MAX(seq) FROM {}'.format(quote(name))).fetchone()[0]
+        if last is None:
+            return iter(())
+
+        sql, params = self._select(model, query, 'seq, data', extra=('seq > ?', 'seq <= ?'))
+        return self._iter_rows(sql + ' ORDER BY seq LIMIT ?', params, last, model._predicate(query))
+
+    def _iter_rows(self, sql, params, last, predicate):
+        '''
+        yields the objects of the rows selected by `sql` that match `predicate`, reading
+        SCAN_BATCH_SIZE rows at a time. Each batch is a statement of its own that resumes
+        after the last row read, so no cursor (nor lock) is held while objects are consumed.
+        Rows inserted after the scan started (past `last`) are left out
+        '''
+        seq = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(sql, params + [seq, last, SCAN_BATCH_SIZE]).fetchall()
+
+            for seq, data in rows:
+                obj = self.load(data)
+                if predicate(obj):
+                    yield obj
+
+            if len(rows) < SCAN_BATCH_SIZE:
+                return
+
+    def _count_sql(self, model, query):
+        '''
+        returns the SQL (and its params) counting the matches of `query` exactly,
+        None if the matches must be compared in Python
+        '''
+        name, _ = self.table(model)
+        if not query:
+            return 'SELECT COUNT(*) FROM {}'.format(quote(name)), []
+
+        plan = model._query_plan(query)
+        if plan.count_key in plan.relation_keys:
+            # relation columns always hold the related id, so SQL can count them exactly
+            key = plan.count_key
+            id = relation_id(query[key])
+            if id is None:
+                return 'SELECT COUNT(*) FROM {} WHERE {} IS NULL'.format(quote(name), quote(key)), []
+            return 'SELECT COUNT(*) FROM {} WHERE {} = ?'.format(quote(name), quote(key)), [id]
+
+        return None
+
+    def count(self, model, query):
+        counted = self._count_sql(model, query)
+        if counted is None:
+            return super().count(model, query)
+
+        with self.connection() as conn:
+            return conn.execute(*counted).fetchone()[0]
+
+    def explain(self, model, query, operation='find'):
+        counted = self._count_sql(model, query) if operation == 'count' else None
+        sql, params = counted or self._select(model, query, 'data')
+        with self.connection() as conn:
+            details = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+        searched = any(detail.startswith('SEARCH') for detail in details)
+        return {
+            'access': 'index' if searched else 'full_scan',
+            'sql': sql,
+            'query_plan': details,
+            # keys compared in Python once rows are loaded
+            'filters': [] if counted else list(query),
+        }
+
+    def _plain_kind(self, kinds, key):
+        '''
+        returns 'number' or 'str' if the column of `key` only holds that kind of value
+        (or None), None otherwise
+        '''
+        if key == 'id':
+            return 'number'
+
+        seen = kinds.get(key)
+        if seen is None or len(seen) > 1:
+            return None
+        if not seen:
+            # only None so far
+            return 'number'
+
+        kind, = seen
+        return kind if kind in ('number', 'str') else None
+
+    def _exact_condition(self, model, kinds, key, value):
+        '''
+        returns the SQL condition (and its params) matching exactly the rows where `key`
+        equals `value`, or None if it can't be expressed in SQL
+        '''
+        kind = self._plain_kind(kinds, key)
+        if kind is None:
+            return None
+
+        column = quote(key)
+        if key in getattr(model, '__relations__', {}):
+            value = relation_id(value)
+
+        if value is None:
+            return '{} IS NULL'.format(column), []
+
+        if not isinstance(value, QueryProp):
+            if value_kind(value) != kind:
+                return None
+            return '{} = ?'.format(column), [value]
+
+        bounds = value.range()
+        if bounds is None:
+            return None
+
+        conditions, params = [], []
+        for bound, inclusive_op, exclusive_op in zip(bounds, ('>=', '<='), ('>', '<')):
+            if bound is None:
+                continue
+            if value_kind(bound[0]) != kind:
+                return None
+            conditions.append('{} {} ?'.format(column, inclusive_op if bound[1] else exclusive_op))
+            params.append(bound[0])
+
+        return ' AND '.join(conditions), params
+
+    def _aggregate_sql(self, model, query, keys, aggregates):
+        '''
+        returns the SQL statement computing the aggregates in SQL, its params and
+        the number of expressions of each aggregate, or None if they must be computed in python
+        '''
+        from ..model import Model
+        if model._compare_props_query.__func__ is not Model._compare_props_query.__func__:
+            return None
+
+        name, props = self.table(model)
+        kinds = self._kinds(model)
+        columns = set(props) | set(['id'])
+        if any(not isinstance(key, str) or key not in columns or self._plain_kind(kinds, key) is None
+               for key in keys):
+            return None
+
+        expressions, widths = [], []
+        for aggregate in aggregates:
+            if aggregate.prop is None:
+                sql = aggregate.sql(None)
+            else:
+                kind = self._plain_kind(kinds, aggregate.prop) if aggregate.prop in columns else None
+                if kind is None or (aggregate.numeric and kind != 'number'):
+                    return None
+                sql = aggregate.sql(quote(aggregate.prop))
+            expressions.extend(sql)
+            widths.append(len(sql))
+
+        conditions, params = [], []
+        for key, value in query.items():
+            condition = self._exact_condition(model, kinds, key, value) if key in columns else None
+            if condition is None:
+                return None
+            if condition[0]:
+                conditions.append(condition[0])
+                params.extend(condition[1])
+
+        group = [quote(key) for key in keys]
+        sql = 'SELECT {} FROM {}'.format(', '.join(group + expressions), quote(name))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if group:
+            sql += ' GROUP BY ' + ', '.join(group)
+
+        return sql, params, widths
+
+    def aggregate(self, model, query, keys, aggregates):
+        statement = self._aggregate_sql(model, query, keys, aggregates)
+        if statement is None:
+            return super().aggregate(model, query, keys, aggregates)
+
+        sql, params, widths = statement
+        with self.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        groups = {}
+        for row in rows:
+            states = []
+            i = len(keys)
+            for aggregate, width in zip(aggregates, widths):
+                states.append(aggregate.from_sql(row[i:i + width]))
+                i += width
+            groups[tuple(row[:len(keys)])] = states
+
+        return groups
+
+    def clear(self, model):
+        name, _ = self.table(model)
+        with self.connection() as conn:
+            conn.execute('DELETE FROM {}'.format(quote(name)))
+        self.kinds[model] = dict((prop, set()) for prop in self.tables[model][1])
+
+    def reset(self):
+        with self.tables_lock:
+            with self.connection() as conn:
+                for name, _ in self.tables.values():
+                    conn.execute('DROP TABLE IF EXISTS {}'.format(quote(name)))
+            self.tables.clear()
+            self.kinds.clear()
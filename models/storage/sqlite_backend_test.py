@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+import threading
+
+from ..model import Model
+from ..model_test import ModelTestCase
+from ..autoproperty import autoproperty
+from ..baseproperties import baseproperties
+from ..query.gt_prop import GTProp
+from ..query.lte_prop import LTEProp
+from ..query.aggregate import Count, Sum, Avg, Min, Max
+from . import sqlite_backend
+from .sqlite_backend import SQLiteBackend
+
+backend = SQLiteBackend()
+
+@baseproperties
+@autoproperty(name='', index=True)
+@autoproperty(price=0.0, index='sorted', column=True)
+class ModelTestSQLite(Model):
+    __backend__ = backend
+
+    def __init__(self, name, price=0.0):
+        super().__init__()
+        self.name = name
+        self.price = price
+
+@baseproperties(slots=True)
+@autoproperty(owner=None, relation=ModelTestSQLite)
+@autoproperty(due=None)
+class ModelTestSQLiteRelated(Model):
+    __backend__ = backend
+
+    def __init__(self, owner, due=None):
+        super().__init__()
+        self.owner = owner
+        self.due = due
+
+class TestSQLiteBackend(ModelTestCase):
+    def test_create_find(self):
+        m1 = ModelTestSQLite.create('abc', 1)
+        ModelTestSQLite.create('def', 2)
+
+        self.assertEqual(ModelTestSQLite.find({'name': 'abc'}), [m1])
+        self.assertEqual(ModelTestSQLite.find_one({'name': 'abc'}), m1)
+        self.assertIsNone(ModelTestSQLite.find_one({'name': 'xyz'}))
+        self.assertEqual(ModelTestSQLite.count(), 2)
+        self.assertEqual(ModelTestSQLite.count({'name': 'def'}), 1)
+
+    def test_not_shared_with_default_backend(self):
+        ModelTestSQLite.create('abc')
+        self.assertIsNot(ModelTestSQLite._get_backend(), Model._get_backend())
+        self.assertEqual(len(backend.tables), 1)
+
+    def test_ranges(self):
+        ModelTestSQLite.create('a', 1)
+        m2 = ModelTestSQLite.create('b', 2)
+        m3 = ModelTestSQLite.create('c', 3)
+
+        self.assertEqual(ModelTestSQLite.find({'price': GTProp(1)}), [m2, m3])
+        self.assertEqual(ModelTestSQLite.find({'price': GTProp(1), 'name': 'c'}), [m3])
+        self.assertEqual(ModelTestSQLite.count({'price': LTEProp(2)}), 2)
+
+    def test_insertion_order(self):
+        ms = [ModelTestSQLite.create(name) for name in ('c', 'a', 'b')]
+        self.assertEqual(ModelTestSQLite.all(), ms)
+        self.assertEqual(list(ModelTestSQLite.objects.order_by('name')), [ms[1], ms[2], ms[0]])
+
+    def test_save_remove(self):
+        m = ModelTestSQLite.create('abc', 1)
+        m.name = 'def'
+        m.save()
+
+        self.assertIsNone(ModelTestSQLite.find_one({'name': 'abc'}))
+        stored = ModelTestSQLite.find_one({'name': 'def'})
+        self.assertEqual(stored.price, 1)
+        self.assertEqual(stored.changed_fields(), frozenset())
+
+        stored.remove()
+        self.assertEqual(ModelTestSQLite.count(), 0)
+        with self.assertRaises(ValueError):
+            stored.remove()
+
+    def test_bulk_create(self):
+        ms = ModelTestSQLite.bulk_create([['a', 1], {'name': 'b', 'price': 2}], return_objects=True)
+        self.assertEqual(ModelTestSQLite.all(), ms)
+        self.assertEqual(ModelTestSQLite.find({'price': 2}), [ms[1]])
+
+    def test_values_without_sql_form(self):
+        ModelTestSQLite.create('a', 1.5)
+        big = ModelTestSQLite.create('b', 2 ** 70)
+        self.assertEqual(ModelTestSQLite.find({'price': 2 ** 70}), [big])
+        self.assertEqual(ModelTestSQLite.find({'price': GTProp(2)}), [big])
+
+    def test_related_and_datetimes(self):
+        owner = ModelTestSQLite.create('owner')
+        now = datetime.now()
+        m = ModelTestSQLiteRelated.create(owner, now)
+        ModelTestSQLiteRelated.create(ModelTestSQLite.create('other'), now + timedelta(days=1))
+
+        self.assertEqual(ModelTestSQLiteRelated.find({'owner': owner}), [m])
+        self.assertEqual(ModelTestSQLiteRelated.find({'due': LTEProp(now)}), [m])
+        self.assertEqual(ModelTestSQLiteRelated.find_one({'due': now}).owner, owner)
+
+    def test_count_relation(self):
+        owner = ModelTestSQLite.create('owner')
+        for _ in range(3):
+            ModelTestSQLiteRelated.create(owner)
+        m = ModelTestSQLiteRelated.create(ModelTestSQLite.create('other'))
+
+        self.assertEqual(ModelTestSQLiteRelated.count({'owner': owner}), 3)
+        self.assertEqual(ModelTestSQLiteRelated.count({'owner': owner.id}), 3)
+
+        m.owner = owner
+        m.save()
+        self.assertEqual(ModelTestSQLiteRelated.count({'owner': owner}), 4)
+        m.remove()
+        self.assertEqual(ModelTestSQLiteRelated.count({'owner': owner}), 3)
+
+    def test_streaming(self):
+        batch_size = sqlite_backend.SCAN_BATCH_SIZE
+        sqlite_backend.SCAN_BATCH_SIZE = 4
+        self.addCleanup(setattr, sqlite_backend, 'SCAN_BATCH_SIZE', batch_size)
+        ModelTestSQLite.bulk_create([[str(i), i] for i in range(10)])
+
+        batches = []
+        for conn in list(backend.pool.queue):
+            conn.set_trace_callback(lambda sql: batches.append(sql) if 'LIMIT' in sql else None)
+            self.addCleanup(conn.set_trace_callback, None)
+
+        items = ModelTestSQLite.iter_find({'price': GTProp(0)})
+        first = next(items)
+        self.assertEqual(first.name, '1')
+        # only the first batch was read
+        self.assertEqual(len(batches), 1)
+
+        # writes go through while the scan is consumed, rows created meanwhile are left out
+        first.price = 100
+        first.save()
+        ModelTestSQLite.create('new', 50)
+        self.assertEqual([m.name for m in items], [str(i) for i in range(2, 10)])
+        self.assertEqual(len(batches), 3)
+        self.assertEqual(len(ModelTestSQLite.find({'price': GTProp(0)})), 10)
+
+    def test_concurrent_writes(self):
+        owner = ModelTestSQLite.create('owner')
+        errors = []
+
+        def work(i):
+            try:
+                for j in range(50):
+                    ModelTestSQLiteRelated.create(owner)
+                    owner.price = i * 100 + j
+                    owner.save()
+                    ModelTestSQLite.create('t{}'.format(i))
+            except Exception as e:
+                errors.append(e)
+
+        # writes of different models (and tables) run side by side
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(ModelTestSQLiteRelated.count({'owner': owner}), 200)
+        self.assertEqual(ModelTestSQLite.count(), 201)
+
+    def test_explain(self):
+        owner = ModelTestSQLite.create('owner')
+        ModelTestSQLiteRelated.create(owner)
+
+        explained = ModelTestSQLiteRelated.explain({'owner': owner}, 'count')
+        self.assertEqual((explained['access'], explained['filters']), ('index', []))
+        self.assertIn('COUNT(*)', explained['sql'])
+        self.assertEqual(explained['backend'], 'SQLiteBackend')
+
+        explained = ModelTestSQLite.explain({'name': 'owner'})
+        self.assertEqual((explained['access'], explained['filters']), ('index', ['name']))
+        self.assertEqual(ModelTestSQLiteRelated.explain({'due': None})['access'], 'full_scan')
+
+    def test_aggregate_in_sql(self):
+        ModelTestSQLite.bulk_create([['a', 1], ['b', 2.5], ['a', 3]])
+
+        statements = []
+        for conn in list(backend.pool.queue):
+            conn.set_trace_callback(statements.append)
+        try:
+            ret = ModelTestSQLite.group_by('name', {'price': GTProp(1)}, n=Count(), avg=Avg('price'))
+            self.assertEqual(ModelTestSQLite.aggregate(low=Min('price'), high=Max('name')),
+                             {'low': 1, 'high': 'b'})
+        finally:
+            for conn in list(backend.pool.queue):
+                conn.set_trace_callback(None)
+
+        self.assertEqual(ret, {'a': {'n': 1, 'avg': 3}, 'b': {'n': 1, 'avg': 2.5}})
+        # computed by SQL, the pickled objects are never read
+        self.assertTrue(statements)
+        self.assertFalse([s for s in statements if 'data' in s])
+
+    def test_aggregate_without_sql_form(self):
+        ModelTestSQLite.create('a', 1)
+        ModelTestSQLite.create('a', 2 ** 70)
+
+        self.assertIsNone(backend._aggregate_sql(ModelTestSQLite, {}, [], [Sum('price')]))
+        self.assertEqual(ModelTestSQLite.aggregate({'name': 'a'}, total=Sum('price')),
+                         {'total': 2 ** 70 + 1})
+
+    def test_aggregate_relation(self):
+        owner = ModelTestSQLite.create('owner')
+        now = datetime.now()
+        ModelTestSQLiteRelated.create(owner, now)
+        ModelTestSQLiteRelated.create(owner, now + timedelta(days=1))
+
+        self.assertEqual(ModelTestSQLiteRelated.group_by('owner', n=Count(), last=Max('due')),
+                         {owner.id: {'n': 2, 'last': now + timedelta(days=1)}})
+
+    def test_clear(self):
+        ModelTestSQLite.create('abc')
+        ModelTestSQLite.clear()
+        self.assertEqual(ModelTestSQLite.all(), [])
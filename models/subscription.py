@@ -3,11 +3,16 @@ from datetime import datetime
 from models import Model, autoproperty, baseproperties
 from models.validator.instance_validator import InstanceValidator
 from models.query.lt_prop import LTProp
+from models.plan import Plan
+from models.scheduler import ExpiryScheduler
 
-@baseproperties
-@autoproperty(renewal_date=None, validators=[InstanceValidator(datetime)])
-@autoproperty(plan=None)
+@baseproperties(slots=True)
+@autoproperty(renewal_date=None, validators=[InstanceValidator(datetime)], index='sorted', column=True)
+@autoproperty(plan=None, relation=Plan)
 class Subscription(Model):
+    # yields the subscriptions as they reach their renewal date, without scanning
+    expiry = ExpiryScheduler('renewal_date')
+
     def __init__(self, renewal_date, plan):
         '''
         Creates a new Subscription object
@@ -21,7 +26,7 @@ class Subscription(Model):
     def __eq__(self, other):
         return super().__eq__(other) and \
             self.renewal_date == other.renewal_date and \
-            self.plan == other.plan
+            self.plan_id == other.plan_id
 
     @classmethod
     def get_expired_subscriptions(self):
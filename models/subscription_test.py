@@ -30,5 +30,45 @@ class TestSubscription(ModelTestCase):
         self.assertEqual(Subscription.count(), 2)
         self.assertEqual([s1], Subscription.get_expired_subscriptions())
 
+    def test_expiry_scheduler(self):
+        now = datetime.now()
+        plan = Plan.create('p1', 15.3, 3)
+        subscriptions = Subscription.bulk_create(
+            [[now + timedelta(days=i), plan] for i in (3, 1, 2, 5)], return_objects=True)
+
+        self.assertEqual(Subscription.expiry.next_deadline(), now + timedelta(days=1))
+        self.assertEqual(Subscription.expiry.pop_due(now), [])
+
+        # renewed before expiring
+        subscriptions[1].renewal_date = now + timedelta(days=4)
+        subscriptions[1].save()
+        subscriptions[3].remove()
+        late = Subscription.create(now + timedelta(hours=1), plan)
+
+        batches = list(Subscription.expiry.due(now + timedelta(days=4), batch_size=2))
+        self.assertEqual(batches, [[late, subscriptions[2]], [subscriptions[0], subscriptions[1]]])
+        # each deadline is handed out once
+        self.assertEqual(Subscription.expiry.pop_due(now + timedelta(days=10)), [])
+        self.assertIsNone(Subscription.expiry.next_deadline())
+
+    def test_expiry_callbacks(self):
+        now = datetime.now()
+        plan = Plan.create('p1', 15.3, 3)
+        s1 = Subscription.create(now - timedelta(days=1), plan)
+        Subscription.create(now + timedelta(days=1), plan)
+
+        expired = []
+        callback = Subscription.expiry.on_due(expired.extend)
+        self.addCleanup(Subscription.expiry.callbacks.remove, callback)
+
+        self.assertEqual(Subscription.expiry.run(), 1)
+        self.assertEqual(expired, [s1])
+
+        # renewing schedules it again
+        s1.renewal_date = now - timedelta(hours=1)
+        s1.save()
+        self.assertEqual(Subscription.expiry.run(), 1)
+        self.assertEqual(Subscription.expiry.run(), 0)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1 +1 @@
-from .validator import Validator, ValidatorException
\ No newline at end of file
+from .validator import Validator, ValidatorException, compile_validators
\ No newline at end of file
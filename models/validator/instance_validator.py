@@ -10,4 +10,11 @@ class InstanceValidator(NotNoneValidator):
 
     def validate(self, value):
         return super().validate(value) and \
-            isinstance(value, self.klass)
\ No newline at end of file
+            isinstance(value, self.klass)
+
+    def compile(self):
+        if type(self).validate is not InstanceValidator.validate:
+            return super().compile()
+
+        klass = self.klass
+        return lambda value: value is not None and isinstance(value, klass)
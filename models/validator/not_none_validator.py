@@ -4,4 +4,9 @@ from .validator import Validator
 
 class NotNoneValidator(Validator):
     def validate(self, value):
-        return value is not None
\ No newline at end of file
+        return value is not None
+
+    def compile(self):
+        if type(self).validate is not NotNoneValidator.validate:
+            return super().compile()
+        return lambda value: value is not None
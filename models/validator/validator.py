@@ -8,4 +8,34 @@ class Validator(object):
     Base validator. Inherit from this class to add validations to Model properties
     '''
     def validate(self, value):
-        pass
\ No newline at end of file
+        pass
+
+    def compile(self):
+        '''
+        returns a function(value) -> bool doing the same check as `validate`.
+        Validators return a faster one when they can, so it runs on every assignment
+        '''
+        return self.validate
+
+def compile_validators(validators):
+    '''
+    combines the checks of `validators` into a single function(value) -> bool,
+    None when there is nothing to check
+    '''
+    checks = [validator.compile() for validator in validators]
+    if not checks:
+        return None
+
+    if len(checks) == 1:
+        return checks[0]
+
+    if len(checks) == 2:
+        check1, check2 = checks
+        return lambda value: check1(value) and check2(value)
+
+    def check(value):
+        for validate in checks:
+            if not validate(value):
+                return False
+        return True
+    return check
@@ -1,9 +1,9 @@
 from models import Model, autoproperty, baseproperties
 from models.validator.instance_validator import InstanceValidator
 
-@baseproperties
+@baseproperties(slots=True)
 @autoproperty(url='', validators=[InstanceValidator(str)])
-@autoproperty(customer=None)
+@autoproperty(customer=None, relation='Customer', index=True)
 class Website(Model):
     def __init__(self, url, customer):
         '''
@@ -18,4 +18,4 @@ class Website(Model):
     def __eq__(self, other):
         return super().__eq__(other) and \
             self.url == other.url and \
-            self.customer == other.customer
\ No newline at end of file
+            self.customer_id == other.customer_id
\ No newline at end of file
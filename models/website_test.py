@@ -3,6 +3,8 @@ import unittest
 from .validator.validator import ValidatorException
 from .website import Website
 from .customer import Customer
+from .snapshot import ReadOnlyException
+from .session import Session
 
 from .model_test import ModelTestCase
 
@@ -19,6 +21,89 @@ class TestPlan(ModelTestCase):
         self.assertNotEqual(w1, w2)
         self.assertNotEqual(w1, w3)
 
+    def test_cow_related(self):
+        # relations point to stored models
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        Website.create('h1', c1)
+
+        w1 = Website.find_one({'url': 'h1'}, read_mode='cow')
+        w1.customer.name = 'c2'
+        self.assertEqual(w1.customer.name, 'c2')
+        self.assertEqual(Website.find_one({'url': 'h1'}).customer.name, 'c1')
+
+        w1.save()
+        self.assertEqual(Website.find_one({'url': 'h1'}).customer.name, 'c2')
+
+    def test_frozen_related(self):
+        # relations point to stored models
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        Website.create('h1', c1)
+
+        w1 = Website.find_one({'url': 'h1'}, read_mode='frozen')
+        with self.assertRaises(ReadOnlyException):
+            w1.customer.name = 'c2'
+
+    def test_relation_by_id(self):
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        w1 = Website.create('h1', c1)
+        self.assertEqual(w1.customer_id, c1.id)
+
+        w1 = Website.find_one({'customer': c1})
+        self.assertEqual(w1.customer_id, c1.id)
+        self.assertEqual(w1.customer, c1)
+        self.assertEqual(Website.count({'customer': c1.id}), 1)
+
+    def test_relation_session(self):
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        Website.create('h1', c1)
+        Website.create('h2', c1)
+
+        w1, w2 = Website.find({'customer': c1})
+        self.assertIsNot(w1.customer, w2.customer)
+
+        with Session():
+            w1, w2 = Website.find({'customer': c1})
+            self.assertIs(w1.customer, w2.customer)
+
+    def test_select_related(self):
+        customers = [Customer.create('c{}'.format(i), '123456', 'abc@example.com', None)
+                     for i in range(3)]
+        for i in range(6):
+            Website.create('h{}'.format(i), customers[i % 3])
+
+        lookups = []
+        get_many = Customer.get_many.__func__
+        Customer.get_many = classmethod(lambda cls, ids, read_mode=None:
+                                        lookups.append(sorted(ids)) or get_many(cls, ids, read_mode))
+        try:
+            websites = list(Website.objects.all().select_related('customer'))
+            names = [w.customer.name for w in websites]
+            self.assertEqual(names, ['c0', 'c1', 'c2'] * 2)
+            self.assertEqual(lookups, [[c.id for c in customers]])
+
+            del lookups[:]
+            list(Website.objects.all().prefetch_related('customer'))
+            self.assertEqual(len(lookups), 1)
+        finally:
+            del Customer.get_many
+
+    def test_save_related(self):
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        w1 = Website.create('h1', c1)
+
+        w1.customer.name = 'c2'
+        w1.save()
+        self.assertEqual(Customer.find_one({'id': c1.id}).name, 'c2')
+
+    def test_copy_keeps_relation_id(self):
+        c1 = Customer.create('c1', '123456', 'abc@example.com', None)
+        Website.create('h1', c1)
+
+        w1 = Website.find_one({'url': 'h1'})
+        self.assertEqual(w1.changed_fields(), set())
+        self.assertEqual(w1.customer.id, c1.id)
+        self.assertEqual(Customer.count(), 1)
+
     def test_invalid_url(self):
         with self.assertRaises(ValidatorException):
             Website(None, None)